@@ -7,10 +7,8 @@ sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 import streamlit as st
 import numpy as np
 import pandas as pd
-import pickle
 import time
-import altair as alt
-from twilio.rest import Client
+from collections import deque
 
 # Set page configuration
 st.set_page_config(
@@ -73,59 +71,104 @@ beep_audio = """
     """
 
 # --- Load Model Bundle ---
-MODEL_PATH = "water_model.pkl"
+from src.data_preprocessing import load_params
+from src.predict import PredictionCache, file_signature, load_bundle, resolve_bundle_path
+
+# Lazy bundle directory written by src/train.py, falling back to the pickle
+MODEL_PATH = resolve_bundle_path({"model_path": "water_model.pkl", "bundle_dir": "water_model"})
+from src.stream_buffer import RingBuffer
+from src.alerts import AlertDispatcher, LogTransport, TwilioTransport, twilio_credentials
+from src.charting import TrendChart, trend_spec
+from src.monitor import MonitoringEngine, dispatch_transitions, load_station_codes, station_ids
+from src.store import open_store
+from src.drift import drift_message, monitor_from_bundle
+from src.instrumentation import configure, start_exporter
+
+
+@st.cache_resource
+def start_instrumentation():
+    """Honor params.yaml's instrumentation settings; export periodically while enabled."""
+    try:
+        params = load_params()
+    except FileNotFoundError:
+        return None
+    configure(params)
+    return start_exporter(params)
+
+
+start_instrumentation()
 
 
 @st.cache_resource
-def load_model_bundle():
-    """Load the trained model bundle from pickle file."""
+def load_model_bundle(signature):
+    """Load the trained model bundle (components load on first use).
+
+    `signature` (mtime, size) is only part of the cache key, so a retrained
+    bundle is picked up on the next rerun.
+    """
     if os.path.exists(MODEL_PATH):
-        with open(MODEL_PATH, 'rb') as f:
-            return pickle.load(f)
+        return load_bundle(MODEL_PATH)
     return None
 
 
-bundle = load_model_bundle()
+bundle = load_model_bundle(file_signature(MODEL_PATH))
 
-# --- Twilio SMS Setup ---
-def send_sms_alert(message):
-    """Sends an SMS alert using Twilio if credentials exist."""
+
+@st.cache_resource
+def get_prediction_cache():
+    """One LRU prediction cache shared by every session and rerun."""
     try:
-        # Load from st.secrets if available, fallback to os.environ
-        # Make sure to set these up in .streamlit/secrets.toml
-        try:
-            account_sid = st.secrets["TWILIO_ACCOUNT_SID"]
-            auth_token = st.secrets["TWILIO_AUTH_TOKEN"]
-            from_number = st.secrets["TWILIO_FROM_NUMBER"]
-            to_number = st.secrets["TWILIO_TO_NUMBER"]
-        except Exception:
-            account_sid = os.environ.get("TWILIO_ACCOUNT_SID")
-            auth_token = os.environ.get("TWILIO_AUTH_TOKEN")
-            from_number = os.environ.get("TWILIO_FROM_NUMBER")
-            to_number = os.environ.get("TWILIO_TO_NUMBER")
-            
-        if not all([account_sid, auth_token, from_number, to_number]):
-            return False, "Twilio configuration missing. Check .streamlit/secrets.toml."
-            
-        client = Client(account_sid, auth_token)
-        msg = client.messages.create(
-            body=message,
-            from_=from_number,
-            to=to_number
-        )
-        return True, msg.sid
-    except Exception as e:
-        return False, str(e)
+        cache_params = load_params().get("cache", {})
+    except FileNotFoundError:
+        cache_params = {}
+    return PredictionCache(model_path=MODEL_PATH, **cache_params)
+
+
+prediction_cache = get_prediction_cache()
 
-# --- Import prediction logic from src package ---
-import importlib
-import src.predict
-importlib.reload(src.predict)
-from src.predict import predict_quality
+# --- SMS Alert Dispatcher ---
+@st.cache_resource
+def get_alert_dispatcher():
+    """Background alert dispatcher shared across reruns.
+
+    Uses Twilio when credentials are set in .streamlit/secrets.toml (or the
+    environment); otherwise alerts are written to a local log file.
+    """
+    try:
+        alert_params = dict(load_params().get("alerts", {}))
+    except FileNotFoundError:
+        alert_params = {}
+    log_path = alert_params.pop("log_path", "reports/alerts.log")
+
+    credentials = twilio_credentials(st.secrets)
+    transport = TwilioTransport(**credentials) if credentials else LogTransport(log_path)
+    return AlertDispatcher(transport, **alert_params).start()
+
+
+alert_dispatcher = get_alert_dispatcher()
+
+
+# --- Persistent History ---
+@st.cache_resource
+def get_reading_store():
+    """SQLite history of every reading, prediction and alert, shared by all sessions (None if disabled)."""
+    try:
+        return open_store(load_params())
+    except FileNotFoundError:
+        return None
+
+
+reading_store = get_reading_store()
 
 # --- Sidebar: Model Selection ---
 st.sidebar.header("Configuration")
-model_choice = st.sidebar.selectbox("Choose Model", ["Random Forest", "SVM"])
+model_choice = st.sidebar.selectbox("Choose Model", ["Random Forest", "SVM", "Consensus"])
+
+cache_stats = prediction_cache.stats()
+st.sidebar.caption(
+    f"Prediction cache: {cache_stats['hits']} hits · {cache_stats['misses']} misses · "
+    f"{cache_stats['evictions']} evictions ({cache_stats['size']}/{cache_stats['maxsize']})"
+)
 
 # --- Main Interface ---
 st.title("💧 Water Contamination Detection")
@@ -145,7 +188,7 @@ else:
 
     # --- Prediction Logic ---
     if st.button("Analyze Quality", type="primary"):
-        prediction, probability, reason = predict_quality(ph, solids, model_choice, bundle)
+        prediction, probability, reason = prediction_cache.predict_quality(ph, solids, model_choice, bundle)
 
         # Display Results
         st.markdown("---")
@@ -172,6 +215,46 @@ st.markdown("---")
 st.subheader("📡 Real-Time Simulation Monitoring")
 
 enable_sms = st.checkbox("📱 Enable SMS Alerts for Contamination Events")
+if enable_sms and isinstance(alert_dispatcher.transport, LogTransport):
+    st.caption(f"Twilio configuration missing — alerts are written to `{alert_dispatcher.transport.path}`.")
+window_size = int(st.sidebar.number_input(
+    "Trend window (points)", min_value=10, max_value=100000, value=50, step=10
+))
+
+
+@st.cache_data
+def get_monitor_settings():
+    """Monitoring engine settings and the station codes of the configured raw file."""
+    try:
+        monitor_params = load_params().get("monitor", {})
+        return monitor_params, load_station_codes(monitor_params)
+    except (FileNotFoundError, KeyError, ValueError):
+        return {}, []
+
+
+@st.cache_data
+def get_drift_params():
+    try:
+        return load_params().get("drift", {})
+    except FileNotFoundError:
+        return {}
+
+
+@st.cache_data
+def get_chart_params():
+    try:
+        return load_params().get("chart", {})
+    except FileNotFoundError:
+        return {}
+
+
+monitor_params, station_codes = get_monitor_settings()
+chart_params = get_chart_params()
+n_stations = int(st.sidebar.number_input(
+    "Monitored stations", min_value=1, max_value=10000, value=1, step=1
+))
+stations = station_ids(station_codes, n_stations)
+focus_station = st.sidebar.selectbox("Charted station", stations)
 
 if 'simulation' not in st.session_state:
     st.session_state.simulation = False
@@ -186,55 +269,86 @@ with col_stop:
     if st.button("Stop Simulation"):
         st.session_state.simulation = False
 
-# Placeholder for charts
+# History of the charted station, read from the per-minute/per-hour rollups
+if reading_store is not None:
+    with st.expander(f"📜 History · station {focus_station}"):
+        history_hours = float(chart_params.get("history_hours", 24))
+        resolution = st.radio("Resolution", ["minute", "hour"], horizontal=True)
+        since = np.datetime64('now', 'ms') - np.timedelta64(int(history_hours * 3600), 's')
+        history = reading_store.rollup(resolution, start=since, station=focus_station)
+        if history.empty:
+            st.caption(f"No readings stored for this station in the last {history_hours:g} h.")
+        else:
+            st.line_chart(history.set_index("start")[["ph_mean", "tds_mean"]])
+            st.line_chart(history.set_index("start")[["unsafe_share"]], height=150)
+            alerts = reading_store.alerts(start=since, station=focus_station)
+            st.caption(f"{int(history['n'].sum())} readings · {len(alerts)} alerts in the last {history_hours:g} h")
+
+# Placeholders for the status panel and the two trend charts
 chart_placeholder = st.empty()
+ph_placeholder = st.empty()
+tds_placeholder = st.empty()
 
 if st.session_state.simulation:
-    # Initialize data storage
+    # Initialize data storage (fixed-size ring buffer; resized if the window changes)
     if 'data_log' not in st.session_state:
-        st.session_state.data_log = pd.DataFrame(columns=['Time', 'pH', 'TDS'])
-
-    # Initialize contamination state if not present
-    if 'contamination_steps' not in st.session_state:
-        st.session_state.contamination_steps = 0
-        
-    # Track SMS so we only send 1 text per event (avoids spamming cell phone once per second!)
-    if 'alert_sent_for_current_event' not in st.session_state:
-        st.session_state.alert_sent_for_current_event = False
+        st.session_state.data_log = RingBuffer(window_size)
+    elif st.session_state.data_log.capacity != window_size:
+        st.session_state.data_log = st.session_state.data_log.resized(window_size)
+    if st.session_state.get('charted_station') != focus_station:
+        st.session_state.data_log = RingBuffer(window_size)
+        st.session_state.charted_station = focus_station
+
+    # One engine advances every station per tick; rebuilt when the fleet, model or bundle changes
+    engine_key = (n_stations, model_choice, bundle.get("version") if bundle else None)
+    if st.session_state.get('monitor_key') != engine_key:
+        st.session_state.monitor = MonitoringEngine(
+            stations, bundle, model_choice, monitor_params.get("engine", "lookup"),
+            monitor_params.get("event_chance", 0.05), monitor_params.get("event_steps", (5, 15)),
+            store=reading_store,
+        )
+        st.session_state.monitor_key = engine_key
+        st.session_state.transition_log = deque(maxlen=20)
+        # Live pH/TDS sketches compared with the bundle's training sketches (None for older bundles)
+        st.session_state.drift = monitor_from_bundle(bundle, get_drift_params()) if bundle else None
+    monitor = st.session_state.monitor
+    drift = st.session_state.drift
+    focus = stations.index(focus_station)
+
+    # Chart elements only live for one script run, so each run starts with a full draw
+    chart_limits = {k: chart_params[k] for k in ("max_points", "redraw_seconds") if k in chart_params}
+    ph_chart = TrendChart("pH", trend_spec("pH", "pH Level", "blue", domain=(0, 14), band=(6.5, 8.5)), **chart_limits)
+    tds_chart = TrendChart("TDS", trend_spec("TDS", "TDS (ppm)", "brown"), **chart_limits)
 
     # Simulation Loop
     while st.session_state.simulation:
 
-        # Decide state based on persistence
-        if st.session_state.contamination_steps > 0:
-            # Continue Contamination Event
-            st.session_state.contamination_steps -= 1
-
-            # Randomly fluctuate between "Critical" and "Subtle" to show both Logic & ML
-            if np.random.rand() > 0.5:
-                # Critical (Triggers Safety Rule)
-                sim_ph = np.random.normal(3.5, 0.2)
-                sim_tds = np.random.normal(3500, 50)
+        # All stations in one vectorized step and one batched model call;
+        # only stations whose status changed come back
+        transitions = monitor.tick()
+        sim_ph, sim_tds = monitor.ph[focus], monitor.tds[focus]
+        sim_pred, sim_prob = int(monitor.prediction[focus]), monitor.probability[focus]
+
+        # O(1) append; the oldest reading is overwritten once the window is full
+        st.session_state.data_log.append(np.datetime64('now', 'ms'), sim_ph, sim_tds, sim_pred, sim_prob)
+
+        dropped = 0
+        if drift is not None and drift.observe(np.column_stack([monitor.ph, monitor.tds])) is not None:
+            # Drift alerts share the dispatcher's dedup/cooldown under a pseudo-station id
+            drifting = bool(drift.report["drifted"])
+            if enable_sms or not drifting:
+                alert_dispatcher.notify("input-drift", drifting, drift_message(drift.report) if drifting else "")
+
+        if len(transitions):
+            st.session_state.transition_log.extendleft(
+                transitions.tail(20).assign(tick=monitor.ticks).to_dict("records")
+            )
+            # Alerts only see transitions: new events queue an SMS, recovered stations
+            # close theirs so the next event may alert again
+            if enable_sms:
+                dropped = dispatch_transitions(transitions, alert_dispatcher, reading_store, model_choice)["dropped"]
             else:
-                # Subtle / Gray Zone (Triggers ML Model)
-                sim_ph = np.random.normal(6.0, 0.2)
-                sim_tds = np.random.normal(1500, 100)
-        else:
-            # Safe State
-            sim_ph = np.random.normal(7.2, 0.1)
-            sim_tds = np.random.normal(300, 10)
-
-            # Randomly trigger new contamination event (5% chance)
-            if np.random.rand() > 0.95:
-                st.session_state.contamination_steps = np.random.randint(5, 15)
-
-        current_time = pd.Timestamp.now().strftime('%H:%M:%S')
-        new_row = pd.DataFrame({'Time': [current_time], 'pH': [sim_ph], 'TDS': [sim_tds]})
-        st.session_state.data_log = pd.concat([st.session_state.data_log, new_row], ignore_index=True)
-
-        # Keep last 50 points
-        if len(st.session_state.data_log) > 50:
-            st.session_state.data_log = st.session_state.data_log.iloc[1:]
+                dispatch_transitions(transitions[transitions["prediction"] == 1], alert_dispatcher)
 
         with chart_placeholder.container():
             # 1. Metrics
@@ -242,56 +356,35 @@ if st.session_state.simulation:
             m1.metric("pH Level", f"{sim_ph:.2f}")
             m2.metric("TDS Level", f"{sim_tds:.0f} ppm")
 
-            # Predict status (ML Model)
             if bundle:
-                sim_pred, sim_prob, _ = predict_quality(sim_ph, sim_tds, model_choice, bundle)
-
                 status_text = "Safe" if sim_pred == 1 else "Unsafe"
                 status_color = "normal" if sim_pred == 1 else "off"
 
-                m3.metric("Status", status_text, delta_color=status_color)
+                m3.metric(f"Status · {focus_station}", status_text, delta_color=status_color)
 
                 if sim_pred == 0:
                     st.warning(f"⚠️ Contamination Detected (Confidence: {1-sim_prob:.1%})")
-                    
-                    # Fire SMS Alert if enabled
-                    if enable_sms and not st.session_state.alert_sent_for_current_event:
-                        alert_msg = f"🚨 WATER ALERT: Contamination detected!\npH Level: {sim_ph:.2f}\nTDS (Solids): {sim_tds:.0f} ppm\nModel Confidence: {1-sim_prob:.1%}"
-                        success, detail = send_sms_alert(alert_msg)
-                        if success:
-                            st.success("✅ SMS Alert sent successfully!")
-                        else:
-                            st.error(f"❌ Failed to send SMS: {detail}")
-                        # Mark as sent so we don't spam 
-                        st.session_state.alert_sent_for_current_event = True
-                else:
-                    # Reset SMS flag when simulation returns to Safe state
-                    st.session_state.alert_sent_for_current_event = False
-
-            # 2. Altair Charts
-            data = st.session_state.data_log.reset_index()
-
-            # pH Chart
-            ph_chart = alt.Chart(data).mark_line(color='blue').encode(
-                x=alt.X('index', axis=alt.Axis(title='Time Step')),
-                y=alt.Y('pH', scale=alt.Scale(domain=[0, 14]), title='pH Level'),
-                tooltip=['pH', 'TDS']
-            ).properties(height=200, title="Real-Time pH Trend")
-
-            # Safe Zone Background for pH (6.5 - 8.5)
-            safe_zone = pd.DataFrame({'y': [6.5], 'y2': [8.5]})
-            ph_bg = alt.Chart(safe_zone).mark_rect(opacity=0.2, color='green').encode(
-                y='y', y2='y2'
-            )
-
-            # TDS Chart
-            tds_chart = alt.Chart(data).mark_line(color='brown').encode(
-                x=alt.X('index', axis=alt.Axis(title='Time Step')),
-                y=alt.Y('TDS', title='TDS (ppm)'),
-                tooltip=['pH', 'TDS']
-            ).properties(height=200, title="Real-Time TDS Trend")
-
-            st.altair_chart(ph_bg + ph_chart, use_container_width=True)
-            st.altair_chart(tds_chart, use_container_width=True)
-
-        time.sleep(1)
+                if dropped:
+                    st.error(f"❌ Alert queue full — {dropped} SMS dropped")
+                if drift is not None and drift.report and drift.report["drifted"]:
+                    st.warning(drift_message(drift.report))
+
+                if len(monitor) > 1:
+                    unsafe = int((monitor.prediction == 0).sum())
+                    st.caption(f"{unsafe} of {len(monitor)} stations unsafe · tick {monitor.ticks}")
+                    if st.session_state.transition_log:
+                        st.dataframe(pd.DataFrame(st.session_state.transition_log), height=180,
+                                     use_container_width=True, hide_index=True)
+
+                if enable_sms and alert_dispatcher.results:
+                    last = alert_dispatcher.results[-1]
+                    if last["ok"]:
+                        st.success(f"✅ SMS Alert sent at {last['time']} ({last['detail']})")
+                    else:
+                        st.error(f"❌ Failed to send SMS after {last['attempts']} attempts: {last['detail']}")
+
+        # 2. Trend charts: new points are appended, redraws are throttled and bounded by LTTB
+        ph_chart.update(ph_placeholder, st.session_state.data_log)
+        tds_chart.update(tds_placeholder, st.session_state.data_log)
+
+        time.sleep(monitor_params.get("tick_seconds", 1.0))
@@ -0,0 +1,162 @@
+"""
+alerts.py — Non-blocking contamination alert dispatch.
+The monitoring loop only enqueues; a background thread delivers with retries.
+"""
+
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import deque
+
+from src.instrumentation import count, timer
+
+
+class LogTransport:
+    """Local stub transport: appends each alert to a text file."""
+
+    def __init__(self, path="reports/alerts.log"):
+        self.path = path
+
+    def send(self, message):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        alert_id = uuid.uuid4().hex[:12]
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(f"{time.strftime('%Y-%m-%d %H:%M:%S')} [{alert_id}] {message!r}\n")
+        return alert_id
+
+
+class TwilioTransport:
+    """SMS via Twilio; the REST client is created once, on first send."""
+
+    def __init__(self, account_sid, auth_token, from_number, to_number):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.to_number = to_number
+        self._client = None
+
+    def send(self, message):
+        if self._client is None:
+            from twilio.rest import Client
+            self._client = Client(self.account_sid, self.auth_token)
+        msg = self._client.messages.create(body=message, from_=self.from_number, to=self.to_number)
+        return msg.sid
+
+
+def twilio_credentials(secrets=None):
+    """
+    Read Twilio settings from a secrets mapping (e.g. st.secrets), falling
+    back to environment variables. Returns None if any value is missing.
+    """
+    keys = ["TWILIO_ACCOUNT_SID", "TWILIO_AUTH_TOKEN", "TWILIO_FROM_NUMBER", "TWILIO_TO_NUMBER"]
+    try:
+        values = [secrets[k] for k in keys]
+    except Exception:
+        values = [os.environ.get(k) for k in keys]
+    if not all(values):
+        return None
+    return dict(zip(["account_sid", "auth_token", "from_number", "to_number"], values))
+
+
+class AlertDispatcher:
+    """
+    Background alert delivery with per-station dedup and cooldown.
+
+    notify() is called every tick with a station id and whether it is
+    currently unsafe. The first unsafe tick of an event enqueues one alert;
+    later ticks of the same event are suppressed until the station reports
+    safe again, and a new event within `cooldown_seconds` of the last alert
+    for that station is suppressed too. Delivery happens on a worker thread
+    that retries failures with exponential backoff, so the caller only ever
+    pays for a non-blocking queue put.
+    """
+
+    def __init__(self, transport, queue_size=100, max_retries=3, backoff_seconds=1.0, cooldown_seconds=300):
+        self.transport = transport
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.cooldown_seconds = cooldown_seconds
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._lock = threading.Lock()
+        self._active_events = set()
+        self._last_alert = {}
+        self._thread = None
+        self.results = deque(maxlen=50)
+        self.dropped = 0
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="alert-dispatcher", daemon=True)
+            self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Deliver what is queued, then stop the worker."""
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join(timeout)
+            self._thread = None
+
+    def notify(self, station, unsafe, message=""):
+        """
+        Report a station's state for this tick. An alert dropped because the
+        queue is full does not open the event, so the next unsafe tick of the
+        station tries again.
+
+        Returns: "queued", "suppressed", "dropped" (queue full) or "clear"
+        """
+        with self._lock:
+            if not unsafe:
+                self._active_events.discard(station)
+                return "clear"
+            if station in self._active_events:
+                return "suppressed"
+            self._active_events.add(station)
+            last = self._last_alert.get(station)
+            if last is not None and time.monotonic() - last < self.cooldown_seconds:
+                return "suppressed"
+            self._last_alert[station] = time.monotonic()
+
+        try:
+            self._queue.put_nowait((station, message))
+        except queue.Full:
+            # Nothing was sent: undo the event and cooldown so the next unsafe tick retries
+            with self._lock:
+                self._active_events.discard(station)
+                if last is None:
+                    self._last_alert.pop(station, None)
+                else:
+                    self._last_alert[station] = last
+            self.dropped += 1
+            count("alerts_dropped")
+            return "dropped"
+        return "queued"
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def _deliver(self, station, message):
+        for attempt in range(self.max_retries + 1):
+            try:
+                with timer("alert_send"):
+                    detail = self.transport.send(message)
+                count("alerts_sent")
+                return {"station": station, "ok": True, "detail": detail, "attempts": attempt + 1}
+            except Exception as e:
+                error = str(e)
+                count("alert_send_errors")
+                if attempt < self.max_retries:
+                    time.sleep(self.backoff_seconds * 2 ** attempt)
+        count("alerts_failed")
+        return {"station": station, "ok": False, "detail": error, "attempts": self.max_retries + 1}
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            result = self._deliver(*item)
+            result["time"] = time.strftime("%H:%M:%S")
+            self.results.append(result)
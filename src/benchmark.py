@@ -0,0 +1,401 @@
+"""
+benchmark.py — Latency and scaling comparisons for inference and training.
+Times each inference engine on real processed readings, the exact vs
+approximate SVM as the training set grows, and (suite "all") the full set of
+tracked numbers: per-model latency and batch throughput, bundle load time,
+the monitoring loop's per-tick cost (engine, store, drift and charts), and
+train_models wall time and peak memory against dataset size. Results are JSON and can be checked
+against a saved baseline with a regression threshold.
+
+    python -m src.benchmark all --output reports/benchmark.json
+    python -m src.benchmark compare --output reports/benchmark.json --baseline baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.data_preprocessing import load_params, load_data, preprocess, split_data, fit_scaler
+from src.charting import TrendChart, trend_spec
+from src.drift import monitor_from_bundle
+from src.monitor import MonitoringEngine, station_ids
+from src.predict import forest_predict_proba, load_bundle, predict_batch, predict_quality, resolve_bundle_path
+from src.store import ReadingStore
+from src.stream_buffer import RingBuffer
+from src.train import fit_svm
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), "..")
+MODEL_CHOICES = ("Random Forest", "SVM", "Consensus")
+# Metric name suffixes checked for regressions, and whether larger is better
+TRACKED = {"_us": False, "_ms": False, "_seconds": False, "_mb": False, "rows_per_s": True}
+
+
+def _time_calls(fn, repeats):
+    """Return per-call latencies in microseconds."""
+    timings = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn()
+        timings[i] = (time.perf_counter() - start) * 1e6
+    return timings
+
+
+def _summary(timings):
+    return {
+        "p50_us": round(float(np.percentile(timings, 50)), 1),
+        "p99_us": round(float(np.percentile(timings, 99)), 1),
+    }
+
+
+def compare_forest_engines(bundle, X, repeats=200, batch_sizes=(1, 100, 10000)):
+    """
+    Compare sklearn's RandomForestClassifier against the flat-array evaluator.
+
+    Reports single-reading latency through predict_quality, per-batch
+    latency for each batch size, and the max absolute probability
+    difference between the two engines over X.
+    """
+    rf_model, flat = bundle["rf_model"], bundle["rf_flat"]
+    X = np.asarray(X, dtype=np.float64)
+    ph, tds = X[0]
+
+    results = {
+        "max_abs_proba_diff": float(np.max(np.abs(
+            rf_model.predict_proba(X)[:, 1] - forest_predict_proba(flat, X)[:, 1]
+        ))),
+        "single": {
+            engine: _summary(_time_calls(
+                lambda: predict_quality(ph, tds, "Random Forest", bundle, engine=engine), repeats
+            ))
+            for engine in ("sklearn", "compiled")
+        },
+        "batch": {},
+    }
+    for size in batch_sizes:
+        batch = X[np.arange(size) % len(X)]
+        batch_repeats = max(3, repeats // max(1, size // 100))
+        results["batch"][str(size)] = {
+            "sklearn": _summary(_time_calls(lambda: rf_model.predict_proba(batch), batch_repeats)),
+            "compiled": _summary(_time_calls(lambda: forest_predict_proba(flat, batch), batch_repeats)),
+        }
+    return results
+
+
+def synthetic_sample(X, y, n_samples, seed=42, jitter=0.02):
+    """
+    Resample (X, y) to `n_samples` rows with small multiplicative jitter,
+    so larger benchmark datasets keep the real pH/TDS distribution.
+    """
+    rng = np.random.default_rng(seed)
+    idx = rng.integers(0, len(X), n_samples)
+    X_big = np.asarray(X, dtype=np.float64)[idx]
+    X_big = X_big * (1 + rng.normal(0, jitter, X_big.shape))
+    return X_big, np.asarray(y)[idx]
+
+
+def compare_svm_modes(X, y, svm_params, sizes=(2000, 10000, 50000, 200000), max_exact=50000, seed=42):
+    """
+    Training time and test accuracy of the exact SVC vs the approx SVM as
+    the training set grows. Exact mode is skipped above `max_exact` rows.
+    """
+    results = []
+    for size in sizes:
+        X_all, y_all = synthetic_sample(X, y, int(size * 1.25), seed)
+        X_train, X_test, y_train, y_test = split_data(X_all, y_all, 0.2, seed)
+        scaler, X_train_scaled = fit_scaler(X_train)
+        X_test_scaled = scaler.transform(X_test)
+
+        row = {"train_samples": len(X_train)}
+        for mode in ("exact", "approx"):
+            if mode == "exact" and size > max_exact:
+                row[mode] = None
+                continue
+            _, accuracy, timing = fit_svm(
+                X_train_scaled, y_train, X_test_scaled, y_test, {**svm_params, "mode": mode}
+            )
+            row[mode] = {"accuracy": round(float(accuracy), 4), **timing}
+        results.append(row)
+        print(f"  {len(X_train):>8} rows: {row}")
+    return results
+
+
+def predict_latency(bundle, X, repeats=200, batch_sizes=(1, 100, 10000)):
+    """
+    predict_quality p50/p99 per model on real readings, and predict_batch
+    throughput (rows/s at the median batch latency) per batch size.
+    """
+    X = np.asarray(X, dtype=np.float64)
+    results = {"single": {}, "batch": {}}
+    for choice in MODEL_CHOICES:
+        rows = iter(np.resize(np.arange(len(X)), repeats))
+
+        def call():
+            ph, tds = X[next(rows)]
+            predict_quality(ph, tds, choice, bundle)
+
+        predict_quality(*X[0], choice, bundle)  # warm-up
+        results["single"][choice] = _summary(_time_calls(call, repeats))
+
+        results["batch"][choice] = {}
+        for size in batch_sizes:
+            batch = X[np.arange(size) % len(X)]
+            timings = _time_calls(lambda: predict_batch(batch, choice, bundle), max(3, repeats // max(1, size // 100)))
+            results["batch"][choice][str(size)] = {
+                **_summary(timings),
+                "rows_per_s": round(size / (np.percentile(timings, 50) / 1e6), 1),
+            }
+    return results
+
+
+def bundle_load_time(output_params, repeats=5):
+    """Cold load time of the pickle and of the bundle directory (first prediction included)."""
+    results = {}
+    paths = {"pickle": output_params["model_path"], "directory": output_params.get("bundle_dir")}
+    for kind, path in paths.items():
+        if not path or not os.path.exists(path):
+            continue
+
+        def load_and_predict():
+            predict_quality(7.0, 500, "Random Forest", load_bundle(path))
+
+        timings = _time_calls(load_and_predict, repeats) / 1000
+        results[kind] = {"p50_ms": round(float(np.percentile(timings, 50)), 2),
+                         "max_ms": round(float(timings.max()), 2)}
+    return results
+
+
+class _NullPlaceholder:
+    """Stands in for a Streamlit placeholder so chart updates cost no rendering."""
+
+    def vega_lite_chart(self, data, spec, **kwargs):
+        return self
+
+    def add_rows(self, data):
+        pass
+
+
+def simulation_tick(bundle, params, ticks=2000, station_counts=(1, 1000), window_size=50,
+                    model_choice="Random Forest"):
+    """
+    Per-tick cost of the app's monitoring loop minus rendering, per fleet
+    size: MonitoringEngine.tick() (scoring and store buffering into a
+    temporary ReadingStore), the drift monitor's observe(), the focus
+    station's ring-buffer append and both trend chart updates. Charts send
+    on every tick (no redraw throttle), as in an app ticking no faster than
+    chart.redraw_seconds.
+    """
+    monitor_params, store_params = params["monitor"], params["store"]
+    results = {}
+    with tempfile.TemporaryDirectory(prefix="bench_tick_") as tmp:
+        for n in station_counts:
+            store = ReadingStore(os.path.join(tmp, f"tick_{n}.db"), store_params["batch_size"],
+                                 store_params["flush_seconds"]).start()
+            engine = MonitoringEngine(
+                station_ids([], n), bundle, model_choice, monitor_params["engine"],
+                monitor_params["event_chance"], monitor_params["event_steps"], seed=42, store=store,
+            )
+            drift = monitor_from_bundle(bundle, params.get("drift", {}))
+            buffer = RingBuffer(window_size)
+            charts = [TrendChart(field, trend_spec(field, field, "blue"), redraw_seconds=0)
+                      for field in ("pH", "TDS")]
+            placeholder = _NullPlaceholder()
+
+            def tick():
+                engine.tick()
+                if drift is not None:
+                    drift.observe(np.column_stack([engine.ph, engine.tds]))
+                buffer.append(np.datetime64("now", "ms"), engine.ph[0], engine.tds[0],
+                              engine.prediction[0], engine.probability[0])
+                for chart in charts:
+                    chart.update(placeholder, buffer)
+
+            tick()  # first tick reports every station; keep it out of the steady-state numbers
+            row = _summary(_time_calls(tick, ticks))
+            row["us_per_station"] = round(row["p50_us"] / n, 3)
+            store.close()
+            row["store_rows"] = store.written
+            results[str(n)] = row
+            print(f"  {n:>6} stations: {row}")
+    return results
+
+
+def train_scaling(params, X, y, sizes=(5000, 20000), seed=42):
+    """
+    train_models wall time and peak RSS per dataset size, each run in a fresh
+    interpreter on a synthetic Parquet table resampled from the real data.
+    Peak RSS covers the training process and its worker processes.
+    """
+    code = (
+        "import json, resource, sys, time\n"
+        "import src.train as train\n"
+        "train.MLFLOW_AVAILABLE = False\n"
+        "params = json.load(open(sys.argv[1]))\n"
+        "start = time.perf_counter()\n"
+        "train.train_models(params)\n"
+        "wall = time.perf_counter() - start\n"
+        "peak_kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,\n"
+        "              resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)\n"
+        "print(json.dumps({'wall_seconds': round(wall, 3), 'peak_rss_mb': round(peak_kb / 1024, 1)}))\n"
+    )
+    target = params["features"]["target"]
+    results = []
+    with tempfile.TemporaryDirectory(prefix="bench_train_") as tmp:
+        for size in sizes:
+            X_big, y_big = synthetic_sample(X, y, size, seed)
+            table = pd.DataFrame(X_big, columns=params["features"]["names"])
+            table.insert(0, "Source", "synthetic")
+            table[target] = np.where(y_big == 1, "Safe", "Unsafe")
+            data_path = os.path.join(tmp, f"synthetic_{size}.parquet")
+            table.to_parquet(data_path, index=False)
+
+            run_params = json.loads(json.dumps(params))
+            run_params["data"].update({"processed_path": data_path, "split_cache": None})
+            run_params["model"]["tuned_params"] = None
+            run_params["output"].update({
+                "model_path": os.path.join(tmp, "model.pkl"),
+                "bundle_dir": os.path.join(tmp, "model"),
+                "metrics_path": os.path.join(tmp, "metrics.json"),
+            })
+            params_path = os.path.join(tmp, "params.json")
+            with open(params_path, "w") as f:
+                json.dump(run_params, f)
+
+            proc = subprocess.run([sys.executable, "-c", code, params_path], cwd=PROJECT_ROOT,
+                                  capture_output=True, text=True)
+            if proc.returncode != 0:
+                raise RuntimeError(f"train_models failed at {size} rows:\n{proc.stderr[-2000:]}")
+            row = {"samples": size, **json.loads(proc.stdout.strip().splitlines()[-1])}
+            results.append(row)
+            print(f"  {size:>8} rows: {row}")
+    return results
+
+
+def run_all(params, repeats=200, train_sizes=(5000, 20000), ticks=2000, tick_stations=(1, 1000)):
+    """Every tracked benchmark, plus enough metadata to compare runs across commits."""
+    features = params["features"]["names"]
+    target = params["features"]["target"]
+    X, y, _ = preprocess(load_data(params["data"]["processed_path"]), features, target)
+    bundle = load_bundle(resolve_bundle_path(params["output"]))
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    results = {
+        "meta": {
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpus": os.cpu_count(),
+            "bundle_version": bundle.get("version"),
+        },
+    }
+    print("⏱️  predict latency / batch throughput")
+    results["predict"] = predict_latency(bundle, X.to_numpy(), repeats)
+    print("⏱️  bundle load")
+    results["load"] = bundle_load_time(params["output"])
+    print("⏱️  monitoring tick")
+    results["tick"] = simulation_tick(bundle, params, ticks, tick_stations)
+    print("⏱️  train_models scaling")
+    results["train"] = {str(row["samples"]): row for row in train_scaling(params, X, y, train_sizes)}
+    return results
+
+
+def _flatten(tree, prefix=""):
+    """{'a': {'b': 1}} → {'a.b': 1} for numeric leaves."""
+    flat = {}
+    for key, value in tree.items():
+        path = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, path + "."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = value
+    return flat
+
+
+def check_regressions(current, baseline, threshold=0.25):
+    """
+    Compare tracked metrics present in both runs. A metric regresses when it
+    is worse than the baseline by more than `threshold` (a fraction).
+    Returns a list of {metric, baseline, current, change} records.
+    """
+    current, baseline = _flatten(current), _flatten(baseline)
+    regressions = []
+    for metric, base in baseline.items():
+        if metric.startswith("meta.") or metric not in current or not base:
+            continue
+        higher_is_better = next((better for suffix, better in TRACKED.items() if metric.endswith(suffix)), None)
+        if higher_is_better is None:
+            continue
+        change = (current[metric] - base) / abs(base)
+        if (-change if higher_is_better else change) > threshold:
+            regressions.append({"metric": metric, "baseline": base, "current": current[metric],
+                                "change": round(change, 4)})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark inference, training and the simulation loop.")
+    parser.add_argument("suite", choices=["forest", "svm", "all", "compare"],
+                        help="forest/svm: engine comparisons; all: tracked suite; "
+                             "compare: check --output against --baseline without running")
+    parser.add_argument("--repeats", type=int, default=200)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2000, 10000, 50000, 200000],
+                        help="Training-set sizes for the svm suite")
+    parser.add_argument("--max-exact", type=int, default=50000,
+                        help="Largest size at which the exact SVC is still trained")
+    parser.add_argument("--train-sizes", type=int, nargs="+", default=[5000, 20000],
+                        help="Dataset sizes for train_models scaling in the all suite")
+    parser.add_argument("--ticks", type=int, default=2000,
+                        help="Monitoring ticks timed per fleet size in the all suite")
+    parser.add_argument("--tick-stations", type=int, nargs="+", default=[1, 1000],
+                        help="Fleet sizes for the monitoring tick in the all suite")
+    parser.add_argument("--output", default="reports/benchmark.json", help="Results JSON (all/compare)")
+    parser.add_argument("--baseline", help="Earlier results JSON to check for regressions")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="Allowed slowdown as a fraction of the baseline (0.25 = 25%%)")
+    args = parser.parse_args()
+
+    params = load_params()
+
+    if args.suite in ("all", "compare"):
+        if args.suite == "all":
+            results = run_all(params, args.repeats, args.train_sizes, args.ticks, args.tick_stations)
+            os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+            with open(args.output, "w") as f:
+                json.dump(results, f, indent=2)
+            print(f"✅ Benchmark results saved to {args.output}")
+        else:
+            with open(args.output, "r") as f:
+                results = json.load(f)
+
+        if args.baseline:
+            with open(args.baseline, "r") as f:
+                regressions = check_regressions(results, json.load(f), args.threshold)
+            for r in regressions:
+                print(f"❌ {r['metric']}: {r['baseline']} → {r['current']} ({r['change']:+.1%})")
+            if regressions:
+                sys.exit(1)
+            print(f"✅ No regressions beyond {args.threshold:.0%} against {args.baseline}")
+        sys.exit(0)
+
+    features = params["features"]["names"]
+    target = params["features"]["target"]
+    X, y, _ = preprocess(load_data(params["data"]["processed_path"]), features, target)
+
+    if args.suite == "forest":
+        bundle = load_bundle(resolve_bundle_path(params["output"]))
+        results = compare_forest_engines(bundle, X.to_numpy(), repeats=args.repeats)
+    else:
+        results = compare_svm_modes(X, y, params["model"]["svm"], args.sizes, args.max_exact)
+    print(json.dumps(results, indent=2))
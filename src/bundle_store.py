@@ -0,0 +1,250 @@
+"""
+bundle_store.py — Versioned on-disk model bundle with lazily loaded components.
+Each bundle entry is stored separately and only read when first accessed.
+
+Layout of a bundle directory:
+    CURRENT                    name of the live version directory
+    <version>/manifest.json    format version, bundle version, features, lineage,
+                               and per-component files with SHA-256 checksums
+    <version>/<name>.joblib    sklearn objects (rf_model, svm_model, scaler, imputer);
+                               their NumPy arrays are memory-mapped on load
+    <version>/<name>/<path>.npy
+                               plain array components (rf_flat, lookup), memory-mapped
+
+Version directories are written once and never modified, so processes that
+have a version memory-mapped keep reading it safely while a new one is saved.
+Saving switches CURRENT atomically; prune_versions() removes old versions.
+A directory holding manifest.json directly (the original flat layout) is
+still readable.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from collections.abc import Mapping
+
+import numpy as np
+
+FORMAT_VERSION = 1
+MANIFEST = "manifest.json"
+POINTER = "CURRENT"
+METADATA_KEYS = ("features", "version", "lineage")
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _is_array_tree(value):
+    """True for (nested) dicts whose leaves are arrays or plain scalars."""
+    if isinstance(value, dict):
+        return all(_is_array_tree(v) for v in value.values())
+    return isinstance(value, (np.ndarray, int, float, bool, str, np.generic))
+
+
+def _save_array_tree(value, root, prefix, files):
+    """Write arrays as .npy files; return a JSON layout referencing them."""
+    if isinstance(value, dict):
+        return {k: _save_array_tree(v, root, f"{prefix}/{k}", files) for k, v in value.items()}
+    if isinstance(value, np.ndarray):
+        relpath = f"{prefix}.npy"
+        path = os.path.join(root, relpath)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        np.save(path, np.ascontiguousarray(value), allow_pickle=False)
+        files[relpath] = _sha256(path)
+        return {"__array__": relpath}
+    return value.item() if isinstance(value, np.generic) else value
+
+
+def _load_array_tree(layout, root, mmap_mode):
+    if isinstance(layout, dict):
+        if "__array__" in layout:
+            return np.load(os.path.join(root, layout["__array__"]), mmap_mode=mmap_mode, allow_pickle=False)
+        return {k: _load_array_tree(v, root, mmap_mode) for k, v in layout.items()}
+    return layout
+
+
+def current_version_dir(path):
+    """
+    Directory holding the live manifest of bundle directory `path`: the
+    version named by CURRENT, or `path` itself for the flat layout.
+    Returns None if `path` is not a bundle directory.
+    """
+    try:
+        with open(os.path.join(path, POINTER)) as f:
+            version_dir = os.path.join(path, f.read().strip())
+    except OSError:
+        version_dir = path
+    return version_dir if os.path.isfile(os.path.join(version_dir, MANIFEST)) else None
+
+
+def _write_components(bundle, path):
+    manifest = {
+        "format_version": FORMAT_VERSION,
+        "components": {},
+    }
+    for key, value in bundle.items():
+        if key in METADATA_KEYS:
+            manifest[key] = value
+            continue
+
+        files = {}
+        if _is_array_tree(value):
+            layout = _save_array_tree(value, path, key, files)
+            manifest["components"][key] = {"kind": "arrays", "layout": layout, "files": files}
+        else:
+            import joblib
+
+            relpath = f"{key}.joblib"
+            joblib.dump(value, os.path.join(path, relpath))
+            files[relpath] = _sha256(os.path.join(path, relpath))
+            manifest["components"][key] = {"kind": "joblib", "file": relpath, "files": files}
+
+    with open(os.path.join(path, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def save_bundle_dir(bundle, path):
+    """
+    Write `bundle` (the dict built by src/train.py) as a new version of the
+    bundle directory `path` and make it the current one.
+
+    The version is written to a hidden staging directory, renamed to its
+    final name, and only then published by replacing CURRENT (temporary
+    file + os.replace). Existing version directories are never touched, so
+    readers holding an older version, memory-mapped or not, are unaffected.
+    """
+    os.makedirs(path, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix=".staging-", dir=path)
+    os.chmod(staging, 0o755)  # mkdtemp creates it private to this user
+    try:
+        manifest = _write_components(bundle, staging)
+        name = str(bundle.get("version") or time.strftime("%Y%m%d%H%M%S"))
+        final, suffix = name, 0
+        while os.path.exists(os.path.join(path, final)):
+            suffix += 1
+            final = f"{name}-{suffix}"
+        os.rename(staging, os.path.join(path, final))
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+
+    tmp_path = os.path.join(path, POINTER + ".tmp")
+    with open(tmp_path, "w") as f:
+        f.write(final + "\n")
+    os.replace(tmp_path, os.path.join(path, POINTER))
+    return manifest
+
+
+def prune_versions(path, keep=3, staging_age=3600):
+    """
+    Delete all but the `keep` newest version directories of `path`, and
+    staging directories abandoned for over `staging_age` seconds by a save
+    that crashed. The current version is always kept.
+    Processes that already memory-mapped a deleted version keep their
+    mapping; ones that have not loaded its components yet will fail, so
+    keep enough versions to cover the slowest reader.
+
+    Returns: names of the removed directories
+    """
+    current = current_version_dir(path)
+    current = os.path.basename(current) if current and os.path.abspath(current) != os.path.abspath(path) else None
+    versions = sorted(
+        (entry for entry in os.scandir(path)
+         if entry.is_dir() and os.path.isfile(os.path.join(entry.path, MANIFEST))),
+        key=lambda entry: entry.stat().st_mtime_ns, reverse=True,
+    )
+    stale = [entry.name for entry in versions[max(keep, 1):] if entry.name != current]
+    stale += [
+        entry.name for entry in os.scandir(path)
+        if entry.name.startswith(".staging-") and time.time() - entry.stat().st_mtime > staging_age
+    ]
+    for name in stale:
+        shutil.rmtree(os.path.join(path, name), ignore_errors=True)
+    return stale
+
+
+class LazyBundle(Mapping):
+    """
+    Read-only dict-like view of a bundle directory.
+
+    The current version is resolved once, when the bundle is opened; later
+    saves publish new versions without affecting this view. Components are
+    loaded on first access and then kept. Large arrays are memory-mapped
+    copy-on-write (mmap_mode="c"): processes serving the same bundle share
+    the page cache instead of each holding a private copy, yet the arrays
+    stay writeable, which libsvm requires of support vectors.
+    Checksums of a component's files are verified the first time it is loaded.
+    """
+
+    def __init__(self, path, verify=True, mmap_mode="c"):
+        self.root = path
+        self.path = current_version_dir(path)
+        if self.path is None:
+            raise FileNotFoundError(f"No bundle manifest in {path}")
+        self.verify = verify
+        self.mmap_mode = mmap_mode
+        with open(os.path.join(self.path, MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format_version") != FORMAT_VERSION:
+            raise ValueError(
+                f"Unsupported bundle format {self.manifest.get('format_version')} in {path} "
+                f"(expected {FORMAT_VERSION})"
+            )
+        self._loaded = {}
+
+    def _keys(self):
+        metadata = [k for k in METADATA_KEYS if k in self.manifest]
+        return metadata + list(self.manifest["components"])
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    def __contains__(self, key):
+        return key in self.manifest["components"] or (key in METADATA_KEYS and key in self.manifest)
+
+    def __getitem__(self, key):
+        if key in METADATA_KEYS and key in self.manifest:
+            return self.manifest[key]
+        if key not in self._loaded:
+            self._loaded[key] = self._load(key)
+        return self._loaded[key]
+
+    def _load(self, key):
+        component = self.manifest["components"][key]
+        if not os.path.isdir(self.path):
+            raise FileNotFoundError(f"Bundle version {self.path} was pruned; reopen {self.root} to load {key}")
+        if self.verify:
+            for relpath, checksum in component["files"].items():
+                if _sha256(os.path.join(self.path, relpath)) != checksum:
+                    raise ValueError(f"Checksum mismatch for {relpath} in bundle {self.path}")
+        if component["kind"] == "arrays":
+            return _load_array_tree(component["layout"], self.path, self.mmap_mode)
+
+        # joblib (and sklearn, via unpickling) is only imported for sessions that need a model object
+        import joblib
+
+        return joblib.load(os.path.join(self.path, component["file"]), mmap_mode=self.mmap_mode)
+
+    def materialize(self):
+        """
+        Plain dict of every component read fully into memory (no memory maps),
+        for callers that modify the bundle or save it again.
+        """
+        in_memory = LazyBundle(self.path, self.verify, mmap_mode=None)
+        return {key: in_memory[key] for key in in_memory}
+
+    def loaded(self):
+        """Names of the components materialized so far."""
+        return list(self._loaded)
@@ -0,0 +1,140 @@
+"""
+charting.py — Bounded, incrementally updated trend charts for the app.
+New readings are appended to the browser-side chart with add_rows instead of
+re-sending the whole chart each tick. Once a chart holds `max_points` points
+(or the trend window, if smaller), the history is downsampled with
+Largest-Triangle-Three-Buckets and redrawn, so the browser never draws more
+than that per chart.
+"""
+
+import time
+
+import numpy as np
+import pandas as pd
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets downsampling.
+
+    Keeps the first and last points and, from each of n_out - 2 equal-width
+    buckets in between, the point forming the largest triangle with the
+    previously kept point and the mean of the next bucket. Preserves peaks
+    and dips that plain striding would skip.
+
+    Returns: sorted indices of the kept points (all indices if n_out >= len(x))
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.nan_to_num(np.asarray(y, dtype=np.float64))
+    n = len(x)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.intp)
+    kept = np.empty(n_out, dtype=np.intp)
+    kept[0], kept[-1] = 0, n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        next_hi = edges[b + 2] if b + 2 < len(edges) else n
+        cx, cy = x[hi:next_hi].mean(), y[hi:next_hi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        kept[b + 1] = a
+    return kept
+
+
+def trend_spec(field, y_title, color, domain=None, band=None):
+    """
+    Vega-Lite spec of one trend line over `index`. The line layer reads the
+    chart's (appendable) data; the optional safe band (y, y2) is inline.
+    """
+    y = {"field": field, "type": "quantitative", "title": y_title}
+    if domain is not None:
+        y["scale"] = {"domain": list(domain)}
+    line = {
+        "mark": {"type": "line", "color": color},
+        "encoding": {
+            "x": {"field": "index", "type": "quantitative", "title": "Time Step"},
+            "y": y,
+            "tooltip": [{"field": "pH", "type": "quantitative"}, {"field": "TDS", "type": "quantitative"}],
+        },
+    }
+    layers = [line]
+    if band is not None:
+        layers.insert(0, {
+            "data": {"values": [{"y": band[0], "y2": band[1]}]},
+            "mark": {"type": "rect", "opacity": 0.2, "color": "green"},
+            "encoding": {"y": {"field": "y", "type": "quantitative"}, "y2": {"field": "y2"}},
+        })
+    return {"height": 200, "title": f"Real-Time {field} Trend", "layer": layers}
+
+
+class TrendChart:
+    """
+    One trend chart fed from a RingBuffer.
+
+    update() is called every tick but sends at most once per
+    `redraw_seconds`. A send appends the readings added since the last one
+    (add_rows). The chart holds at most min(`max_points`, buffer capacity)
+    points. Before an append would exceed that limit, the chart is redrawn.
+    A window that fits in `max_points` is redrawn in full, so the chart
+    always shows the whole window. A longer window is redrawn with half
+    the limit: the newest readings, downsampled with LTTB, taken from a
+    stretch short enough that the appends still to come keep the chart
+    within the window; such redraws happen once per limit / 2 readings.
+    The chart is a fresh element on every script run (element handles do
+    not survive a rerun).
+    """
+
+    def __init__(self, field, spec, max_points=1000, redraw_seconds=1.0):
+        self.field = field
+        self.spec = spec
+        self.max_points = max_points
+        self.redraw_seconds = redraw_seconds
+        self.element = None
+        self.drawn = 0
+        self.sent = 0
+        self.redraws = 0
+        self._last_send = float("-inf")
+
+    def _frame(self, steps, log):
+        return pd.DataFrame({"index": steps, "pH": log["pH"], "TDS": log["TDS"]})
+
+    def update(self, placeholder, buffer, force=False):
+        """
+        Bring the chart in `placeholder` up to date with `buffer`.
+
+        Returns: "redraw", "append" or None (throttled or nothing new)
+        """
+        now = time.monotonic()
+        if not force and self.element is not None and now - self._last_send < self.redraw_seconds:
+            return None
+        new = buffer.appended - self.sent
+        if self.element is not None and new == 0:
+            return None
+
+        log, steps = buffer.view(), buffer.steps()
+        limit = min(self.max_points, buffer.capacity)
+        if self.element is None or new > len(buffer) or self.drawn + new > limit:
+            if buffer.capacity > self.max_points:
+                target = max(limit // 2, 1)
+                # Leave room for limit - target appended readings inside the window
+                span = buffer.capacity - (limit - target)
+                log, steps = log[-span:], steps[-span:]
+            else:
+                target = limit
+            kept = lttb(steps, log[self.field], target)
+            self.element = placeholder.vega_lite_chart(
+                self._frame(steps[kept], log[kept]), self.spec, use_container_width=True
+            )
+            self.drawn = len(kept)
+            self.redraws += 1
+            action = "redraw"
+        else:
+            self.element.add_rows(self._frame(steps[-new:], log[-new:]))
+            self.drawn += new
+            action = "append"
+        self.sent = buffer.appended
+        self._last_send = now
+        return action
@@ -5,13 +5,17 @@ Reads configuration from params.yaml.
 
 import pandas as pd
 import numpy as np
+import hashlib
 import json
 import os
+import pickle
 import yaml
 from sklearn.model_selection import train_test_split
 from sklearn.impute import SimpleImputer
 from sklearn.preprocessing import StandardScaler
 
+from src.instrumentation import configure, export, timed
+
 
 def load_params(params_path="params.yaml"):
     """Load parameters from params.yaml."""
@@ -20,18 +24,24 @@ def load_params(params_path="params.yaml"):
 
 
 def load_data(data_path):
-    """Load dataset from CSV."""
-    df = pd.read_csv(data_path)
+    """Load dataset from CSV, or Parquet (the output of src/ingest.py)."""
+    if data_path.endswith((".parquet", ".pq")):
+        df = pd.read_parquet(data_path)
+    else:
+        df = pd.read_csv(data_path)
     print(f"Dataset loaded. Shape: {df.shape}")
     print(f"Columns: {list(df.columns)}")
     return df
 
 
-def preprocess(df, features, target):
+@timed("preprocess")
+def preprocess(df, features, target, return_missing=False):
     """
     Impute missing values and return clean X, y arrays.
     Handles text labels (Safe/Unsafe) by encoding to binary (1/0).
-    Returns: X (DataFrame), y (Series), imputer (fitted SimpleImputer)
+    Returns: X (DataFrame), y (Series), imputer (fitted SimpleImputer),
+             plus, with return_missing, a boolean DataFrame marking the
+             values of X that were imputed
     """
     # Encode text labels to binary if needed
     if df[target].dtype == "object":
@@ -48,14 +58,235 @@ def preprocess(df, features, target):
 
     X = df_imputed[features]
     y = df_imputed[target]
+    if return_missing:
+        return X, y, imputer, df[features].isna().reset_index(drop=True)
     return X, y, imputer
 
 
+LABEL_CODES = {"Safe": 1, "Unsafe": 0}
+
+
+def _iter_column_chunks(data_path, columns, dtypes, chunksize):
+    """Yield DataFrames holding only `columns`, `chunksize` rows at a time."""
+    if data_path.endswith((".parquet", ".pq")):
+        import pyarrow.parquet as pq
+
+        for batch in pq.ParquetFile(data_path).iter_batches(batch_size=chunksize, columns=columns):
+            yield batch.to_pandas(categories=[c for c, d in dtypes.items() if d == "category"])
+    else:
+        yield from pd.read_csv(data_path, usecols=columns, dtype=dtypes, chunksize=chunksize)
+
+
+def _label_codes(labels):
+    """
+    int8 label codes for a categorical label column: Safe→1, Unsafe→0,
+    numeric labels as-is, and -1 for missing or Unknown/ambiguous labels.
+    The mapping is computed once per category, not once per row.
+    """
+    categories = labels.cat.categories
+    if pd.api.types.is_numeric_dtype(categories):
+        lookup = categories.to_numpy(dtype=np.int8)
+    else:
+        # CSV chunks read the target as categories of strings, so "0"/"1" count as numeric too
+        numeric = pd.to_numeric(categories, errors="coerce")
+        lookup = np.array(
+            [LABEL_CODES.get(c, -1) if np.isnan(v) else v for c, v in zip(categories, numeric)], dtype=np.int8
+        )
+    lookup = np.append(lookup, np.int8(-1))  # category code -1 (missing) indexes this slot
+    return lookup[labels.cat.codes.to_numpy()]
+
+
+@timed("preprocess_lean")
+def preprocess_lean(data_path, features, target, chunksize=100_000, return_missing=False):
+    """
+    Memory-lean equivalent of load_data → preprocess.
+
+    Reads only the feature and target columns in chunks, keeps features as
+    float32 and labels as int8, and accumulates per-feature sums and counts
+    on the way, so the imputation means need no second pass. Missing values
+    are then filled in place. The returned imputer is fitted on the means
+    alone and transforms new readings exactly like preprocess()'s imputer.
+    Returns: X (DataFrame), y (Series), imputer (fitted SimpleImputer),
+             plus the imputed-value mask with return_missing (see preprocess)
+    """
+    sums = np.zeros(len(features), dtype=np.float64)
+    counts = np.zeros(len(features), dtype=np.int64)
+    X_parts, y_parts = [], []
+
+    dtypes = {**{f: np.float32 for f in features}, target: "category"}
+    for chunk in _iter_column_chunks(data_path, features + [target], dtypes, chunksize):
+        codes = _label_codes(chunk[target])
+        keep = codes >= 0
+
+        values = chunk[features].to_numpy(dtype=np.float32)[keep]
+        sums += np.nansum(values, axis=0, dtype=np.float64)
+        counts += np.count_nonzero(~np.isnan(values), axis=0)
+        X_parts.append(values)
+        y_parts.append(codes[keep])
+        del chunk, values
+
+    X = np.concatenate(X_parts)
+    y = np.concatenate(y_parts)
+    del X_parts, y_parts
+    print(f"Loaded {len(X)} labeled samples from {data_path} ({X.nbytes + y.nbytes} bytes as float32/int8)")
+
+    means = sums / counts
+    missing = np.isnan(X)
+    missing_rows, missing_cols = np.nonzero(missing)
+    X[missing_rows, missing_cols] = means[missing_cols]
+
+    imputer = SimpleImputer(strategy="mean")
+    imputer.fit(pd.DataFrame(means.reshape(1, -1), columns=features))
+    result = pd.DataFrame(X, columns=features, copy=False), pd.Series(y, name=target), imputer
+    if return_missing:
+        return (*result, pd.DataFrame(missing, columns=features))
+    return result
+
+
+def peak_memory(fn, *args, **kwargs):
+    """Run `fn` under tracemalloc; return (result, peak traced bytes)."""
+    import tracemalloc
+
+    tracemalloc.start()
+    try:
+        result = fn(*args, **kwargs)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, peak
+
+
+def memory_report(data_path, features, target, chunksize=100_000):
+    """Peak traced memory of the default and the lean preprocessing paths."""
+    def default_path():
+        return preprocess(load_data(data_path), features, target)
+
+    file_bytes = os.path.getsize(data_path)
+    (X, _, _), default_peak = peak_memory(default_path)
+    (X_lean, _, _), lean_peak = peak_memory(preprocess_lean, data_path, features, target, chunksize)
+    return {
+        "data_path": data_path,
+        "file_bytes": file_bytes,
+        "samples": int(len(X)),
+        "default_peak_bytes": default_peak,
+        "lean_peak_bytes": lean_peak,
+        "reduction": round(1 - lean_peak / default_peak, 4),
+        "max_abs_feature_diff": float(np.nanmax(np.abs(X.to_numpy() - X_lean.to_numpy(dtype=np.float64)))),
+    }
+
+
 def split_data(X, y, test_size=0.2, random_state=42):
     """Split into train/test sets."""
     return train_test_split(X, y, test_size=test_size, random_state=random_state)
 
 
+SPLIT_PARTS = ("X_train", "X_test", "y_train", "y_test")
+MISSING_PARTS = ("missing_train", "missing_test")   # which values of X_train/X_test were imputed
+SPLIT_CACHE_FORMAT = 2
+SPLIT_MANIFEST = "manifest.json"
+
+
+def split_cache_key(params):
+    """
+    Content hash identifying a set of preprocessed splits: the bytes of the
+    processed CSV plus every params.yaml setting that changes the result.
+    """
+    digest = hashlib.sha256()
+    with open(params["data"]["processed_path"], "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    relevant = {
+        "test_size": params["data"]["test_size"],
+        "random_state": params["data"]["random_state"],
+        "lean": bool(params["data"].get("lean")),
+        "features": params["features"],
+        "format": SPLIT_CACHE_FORMAT,
+    }
+    digest.update(json.dumps(relevant, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def _read_split_cache(cache_dir, key):
+    """Return the cached splits, imputer and missing masks, or None if the cache is missing or stale."""
+    try:
+        with open(os.path.join(cache_dir, SPLIT_MANIFEST), "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if manifest.get("key") != key:
+        return None
+
+    # Missing, truncated or corrupt files count as a miss (pyarrow.ArrowInvalid is a ValueError)
+    try:
+        parts = {
+            name: pd.read_parquet(os.path.join(cache_dir, f"{name}.parquet")) for name in SPLIT_PARTS + MISSING_PARTS
+        }
+        with open(os.path.join(cache_dir, "imputer.pkl"), "rb") as f:
+            imputer = pickle.load(f)
+        target = manifest["target"]
+        splits = parts["X_train"], parts["X_test"], parts["y_train"][target], parts["y_test"][target]
+    except (OSError, ValueError, KeyError, EOFError, pickle.UnpicklingError) as e:
+        print(f"⚠️  Split cache in {cache_dir} is unreadable ({type(e).__name__}); rebuilding")
+        return None
+    if any(len(part) != manifest.get("rows", {}).get(name, len(part)) for name, part in zip(SPLIT_PARTS, splits)):
+        print(f"⚠️  Split cache in {cache_dir} does not match its manifest; rebuilding")
+        return None
+    return splits, imputer, {"train": parts["missing_train"], "test": parts["missing_test"]}
+
+
+def _write_split_cache(cache_dir, key, splits, imputer, target, missing):
+    os.makedirs(cache_dir, exist_ok=True)
+    for name, part in zip(SPLIT_PARTS + MISSING_PARTS, (*splits, missing["train"], missing["test"])):
+        frame = part.to_frame(target) if isinstance(part, pd.Series) else part
+        frame.to_parquet(os.path.join(cache_dir, f"{name}.parquet"))
+    with open(os.path.join(cache_dir, "imputer.pkl"), "wb") as f:
+        pickle.dump(imputer, f)
+
+    # The manifest goes last so an interrupted write is treated as a miss
+    tmp_path = os.path.join(cache_dir, SPLIT_MANIFEST + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump({"key": key, "target": target, "rows": {n: len(p) for n, p in zip(SPLIT_PARTS, splits)}}, f, indent=2)
+    os.replace(tmp_path, os.path.join(cache_dir, SPLIT_MANIFEST))
+
+
+def load_splits(params, with_missing=False):
+    """
+    Imputed train/test splits for the configured dataset, via the split cache.
+
+    The cache directory (params["data"]["split_cache"]) holds one Parquet file
+    per split and per missing-value mask plus the fitted imputer, and is reused as long as the CSV
+    content and the data/features params hash to the same key; otherwise the
+    splits are recomputed with load_data → preprocess → split_data (or
+    preprocess_lean when params["data"]["lean"] is set) and the cache is
+    rewritten.
+    Returns: X_train, X_test, y_train, y_test, imputer, and with
+             with_missing a dict {"train": mask, "test": mask} of boolean
+             DataFrames marking the imputed values of X_train and X_test
+    """
+    cache_dir = params["data"].get("split_cache")
+    key = split_cache_key(params)
+    cached = _read_split_cache(cache_dir, key) if cache_dir else None
+    if cached is not None:
+        print(f"✅ Loaded cached splits from {cache_dir} ({key[:12]})")
+        splits, imputer, missing = cached
+        return (*splits, imputer, missing) if with_missing else (*splits, imputer)
+
+    features = params["features"]["names"]
+    target = params["features"]["target"]
+    if params["data"].get("lean"):
+        X, y, imputer, mask = preprocess_lean(params["data"]["processed_path"], features, target,
+                                              params["data"].get("chunksize", 100_000), return_missing=True)
+    else:
+        df = load_data(params["data"]["processed_path"])
+        X, y, imputer, mask = preprocess(df, features, target, return_missing=True)
+    splits = split_data(X, y, params["data"]["test_size"], params["data"]["random_state"])
+    missing = {"train": mask.loc[splits[0].index], "test": mask.loc[splits[1].index]}
+    if cache_dir:
+        _write_split_cache(cache_dir, key, splits, imputer, target, missing)
+        print(f"✅ Cached splits to {cache_dir} ({key[:12]})")
+    return (*splits, imputer, missing) if with_missing else (*splits, imputer)
+
+
 def fit_scaler(X_train):
     """Fit StandardScaler on training data."""
     scaler = StandardScaler()
@@ -84,14 +315,30 @@ def add_noise(df, ph_std=1.5, tds_std=80.0, seed=42):
 
 if __name__ == "__main__":
     # ── Standalone: preprocess data and save summary ──
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Preprocess data and save a summary.")
+    parser.add_argument("--memory-report", action="store_true",
+                        help="Also compare peak memory of the default and lean preprocessing paths")
+    args = parser.parse_args()
     params = load_params()
+    configure(params)
 
-    data_path = params["data"]["processed_path"]
     features = params["features"]["names"]
     target = params["features"]["target"]
 
-    df = load_data(data_path)
-    X, y, imputer = preprocess(df, features, target)
+    if args.memory_report:
+        report = memory_report(params["data"]["processed_path"], features, target,
+                               params["data"].get("chunksize", 100_000))
+        os.makedirs("reports", exist_ok=True)
+        with open("reports/preprocess_memory.json", "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"✅ Peak memory: {report['default_peak_bytes'] / 1e6:.1f} MB default, "
+              f"{report['lean_peak_bytes'] / 1e6:.1f} MB lean ({report['reduction']:.0%} less)")
+
+    X_train, X_test, y_train, y_test, imputer = load_splits(params)
+    X = pd.concat([X_train, X_test])
+    y = pd.concat([y_train, y_test])
 
     summary = {
         "total_samples": int(len(X)),
@@ -115,3 +362,4 @@ if __name__ == "__main__":
 
     print(f"\n✅ Data summary saved to reports/data_summary.json")
     print(json.dumps(summary, indent=2))
+    export(params)
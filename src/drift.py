@@ -0,0 +1,260 @@
+"""
+drift.py — Streaming input drift detection with constant-memory sketches.
+Every feature keeps running moments (Welford) and a histogram over fixed
+cut points taken from the training data. Both merge by addition, so live
+sketches can be combined across windows, stations or processes. src/train.py
+stores the training sketches in the bundle as "drift_reference"; the
+DriftMonitor compares live traffic against them with PSI and KS scores.
+"""
+
+import numpy as np
+
+from src.instrumentation import count, gauge
+
+PSI_EPSILON = 1e-4   # floor for empty bins in the PSI log ratio
+
+
+class FeatureSketch:
+    """
+    Running moments plus a fixed-bin histogram of one feature.
+
+    `cuts` are the interior bin edges (len(cuts) + 1 bins, the outer two
+    open-ended). Memory is fixed by the number of bins regardless of how
+    many values are added. Missing values are counted but kept out of the
+    moments and the histogram.
+    """
+
+    def __init__(self, cuts):
+        self.cuts = np.asarray(cuts, dtype=np.float64)
+        self.counts = np.zeros(len(self.cuts) + 1, dtype=np.int64)
+        self.n = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.missing = 0
+        self.min = np.inf
+        self.max = -np.inf
+
+    @classmethod
+    def from_values(cls, values, bins):
+        """Sketch of `values` with cut points at their equal-frequency quantiles."""
+        values = np.asarray(values, dtype=np.float64)
+        finite = values[np.isfinite(values)]
+        cuts = np.unique(np.quantile(finite, np.linspace(0, 1, bins + 1)[1:-1])) if finite.size else []
+        sketch = cls(cuts)
+        sketch.update(values)
+        return sketch
+
+    def update(self, values):
+        """Add a batch of values (one vectorized pass)."""
+        values = np.asarray(values, dtype=np.float64).ravel()
+        finite = values[np.isfinite(values)]
+        self.missing += values.size - finite.size
+        if not finite.size:
+            return
+        self.counts += np.bincount(np.searchsorted(self.cuts, finite, side="right"), minlength=len(self.counts))
+        self._merge_moments(finite.size, float(finite.mean()), float(((finite - finite.mean()) ** 2).sum()))
+        self.min = min(self.min, float(finite.min()))
+        self.max = max(self.max, float(finite.max()))
+
+    def _merge_moments(self, n, mean, m2):
+        # Chan et al. pairwise update of (count, mean, sum of squared deviations)
+        total = self.n + n
+        delta = mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += m2 + delta ** 2 * self.n * n / total
+        self.n = total
+
+    def merge(self, other):
+        """Fold another sketch with the same cut points into this one."""
+        if not np.array_equal(self.cuts, other.cuts):
+            raise ValueError("Sketches with different cut points cannot be merged")
+        self.counts += other.counts
+        self.missing += other.missing
+        if other.n:
+            self._merge_moments(other.n, other.mean, other.m2)
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+        return self
+
+    def copy(self):
+        return FeatureSketch(self.cuts).merge(self)
+
+    @property
+    def seen(self):
+        """Values added so far, missing ones included."""
+        return self.n + self.missing
+
+    @property
+    def std(self):
+        return float(np.sqrt(self.m2 / self.n)) if self.n else 0.0
+
+    def distribution(self):
+        return self.counts / max(self.counts.sum(), 1)
+
+    def quantiles(self, qs):
+        """Approximate quantiles, interpolating linearly inside each bin."""
+        if not self.n:
+            return np.full(len(qs), np.nan)
+        edges = np.concatenate([[self.min], np.clip(self.cuts, self.min, self.max), [self.max]])
+        cdf = np.concatenate([[0.0], np.cumsum(self.distribution())])
+        return np.interp(qs, cdf, edges)
+
+    def to_dict(self):
+        """Plain arrays and numbers (stored in the bundle as an array tree)."""
+        return {
+            "cuts": self.cuts, "counts": self.counts, "n": int(self.n), "mean": float(self.mean),
+            "m2": float(self.m2), "missing": int(self.missing), "min": float(self.min), "max": float(self.max),
+        }
+
+    @classmethod
+    def from_dict(cls, state):
+        sketch = cls(np.asarray(state["cuts"]))
+        sketch.counts = np.array(state["counts"], dtype=np.int64)
+        for key in ("n", "mean", "m2", "missing", "min", "max"):
+            setattr(sketch, key, state[key])
+        return sketch
+
+
+def build_reference(X, features, bins=20):
+    """Per-feature training sketches for bundle["drift_reference"]."""
+    X = np.asarray(X, dtype=np.float64)
+    return {name: FeatureSketch.from_values(X[:, i], bins).to_dict() for i, name in enumerate(features)}
+
+
+def psi(reference, live):
+    """Population stability index between two sketches' bin distributions."""
+    p = np.maximum(reference.distribution(), PSI_EPSILON)
+    q = np.maximum(live.distribution(), PSI_EPSILON)
+    return float(np.sum((q - p) * np.log(q / p)))
+
+
+def ks(reference, live):
+    """Kolmogorov–Smirnov distance evaluated at the shared cut points."""
+    return float(np.max(np.abs(np.cumsum(reference.distribution()) - np.cumsum(live.distribution()))))
+
+
+def compare(reference, live):
+    """Drift scores of one feature: PSI, KS and the mean shift in training standard deviations."""
+    return {
+        "psi": round(psi(reference, live), 4),
+        "ks": round(ks(reference, live), 4),
+        "mean_shift_std": round((live.mean - reference.mean) / reference.std, 4) if reference.std else 0.0,
+        "reference_mean": round(reference.mean, 4),
+        "live_mean": round(live.mean, 4),
+        "live_median": round(float(live.quantiles([0.5])[0]), 4),
+        "reference_missing_rate": round(reference.missing / max(reference.seen, 1), 4),
+        "live_missing_rate": round(live.missing / max(live.seen, 1), 4),
+        "readings": live.seen,
+    }
+
+
+class DriftMonitor:
+    """
+    Live sketches of incoming readings, checked against the bundle's reference.
+
+    Readings go into the current sketch generation; after `window` readings
+    it becomes the previous generation and a new one starts. Checks score
+    previous + current merged, so they always cover the last one to two
+    windows in constant memory. Small batches (single readings) are copied
+    into a fixed `buffer_size` staging array and folded into the sketches
+    when it fills, so a reading costs one row copy; larger batches cost one
+    searchsorted/bincount per feature. A check runs every `check_every`
+    readings, once at least `min_readings` are in the window. A feature
+    drifts when its PSI or KS reaches the threshold.
+    """
+
+    def __init__(self, reference, features, window=5000, check_every=1000, min_readings=500,
+                 psi_threshold=0.25, ks_threshold=0.15, buffer_size=256):
+        self.features = list(features)
+        self.reference = {name: FeatureSketch.from_dict(reference[name]) for name in self.features}
+        self.window = window
+        self.check_every = check_every
+        self.min_readings = min_readings
+        self.psi_threshold = psi_threshold
+        self.ks_threshold = ks_threshold
+        self._current = self._empty()
+        self._previous = None
+        self._buffer = np.empty((buffer_size, len(self.features)))
+        self._buffered = 0
+        self._since_check = 0
+        self.report = None
+
+    def _empty(self):
+        return {name: FeatureSketch(self.reference[name].cuts) for name in self.features}
+
+    def _fold(self, X):
+        for i, name in enumerate(self.features):
+            self._current[name].update(X[:, i])
+        if self._current[self.features[0]].seen >= self.window:
+            self._previous, self._current = self._current, self._empty()
+
+    def _flush_buffer(self):
+        if self._buffered:
+            self._fold(self._buffer[:self._buffered])
+            self._buffered = 0
+
+    def observe(self, X):
+        """
+        Add a batch of readings (n_samples, n_features) in feature order.
+
+        Returns: the new drift report when this batch triggered a check, else None
+        """
+        X = np.asarray(X, dtype=np.float64).reshape(-1, len(self.features))
+        n = len(X)
+        if self._buffered + n <= len(self._buffer):
+            self._buffer[self._buffered:self._buffered + n] = X
+            self._buffered += n
+            if self._buffered == len(self._buffer):
+                self._flush_buffer()
+        else:
+            self._flush_buffer()
+            self._fold(X)
+        self._since_check += n
+        if self._since_check >= self.check_every:
+            self._since_check = 0
+            return self.check()
+        return None
+
+    def live(self):
+        """Merged sketches of the previous and current windows."""
+        self._flush_buffer()
+        if self._previous is None:
+            return {name: sketch.copy() for name, sketch in self._current.items()}
+        return {name: self._previous[name].copy().merge(self._current[name]) for name in self.features}
+
+    def check(self):
+        """Score every feature now; updates self.report and the drift metrics."""
+        live = self.live()
+        readings = live[self.features[0]].seen
+        if readings < self.min_readings:
+            return None
+        scores = {name: compare(self.reference[name], live[name]) for name in self.features}
+        drifted = [
+            name for name, s in scores.items()
+            if s["psi"] >= self.psi_threshold or s["ks"] >= self.ks_threshold
+        ]
+        for name, s in scores.items():
+            gauge(f"drift_psi_{name}", s["psi"])
+            gauge(f"drift_ks_{name}", s["ks"])
+        count("drift_checks")
+        if drifted:
+            count("drift_alerts")
+        self.report = {"features": scores, "drifted": drifted, "readings": readings}
+        return self.report
+
+
+def drift_message(report):
+    parts = []
+    for name in report["drifted"]:
+        s = report["features"][name]
+        parts.append(f"{name} (PSI {s['psi']:.2f}, KS {s['ks']:.2f}, "
+                     f"mean {s['live_mean']:.4g} vs {s['reference_mean']:.4g} in training)")
+    return "📉 Input drift detected: " + "; ".join(parts)
+
+
+def monitor_from_bundle(bundle, drift_params):
+    """DriftMonitor for the bundle's reference, or None for bundles trained without one."""
+    if "drift_reference" not in bundle:
+        return None
+    settings = {k: v for k, v in drift_params.items() if k != "bins"}
+    return DriftMonitor(bundle["drift_reference"], bundle["features"], **settings)
@@ -1,13 +1,16 @@
 """
 evaluate.py — Evaluate the trained model and generate reports.
-Produces classification reports, confusion matrix plots, and metrics JSON.
+Produces classification reports, confusion matrix plots, and metrics JSON,
+with bootstrap confidence intervals, per-Source breakdowns, and additional
+labeled datasets scored in parallel worker processes.
 """
 
 import json
 import os
-import pickle
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
+import pandas as pd
 import matplotlib
 matplotlib.use("Agg")  # Non-interactive backend for CI
 import matplotlib.pyplot as plt
@@ -18,55 +21,193 @@ from sklearn.metrics import (
     ConfusionMatrixDisplay,
 )
 
-from src.data_preprocessing import load_params, load_data, preprocess, split_data, fit_scaler
-
+from src.data_preprocessing import load_params, load_data, load_splits, fit_scaler, _label_codes
+from src.instrumentation import configure, export, timed
+from src.predict import load_bundle, predict_batch, resolve_bundle_path
+
+MODEL_CHOICES = ("Random Forest", "SVM", "Consensus")
+METRICS = ("accuracy", "precision", "recall", "f1")
+
+
+def metrics_from_counts(counts):
+    """
+    Accuracy and Safe-class precision/recall/F1 from confusion counts.
+    `counts` has shape (..., 4) ordered TN, FP, FN, TP; undefined ratios are NaN.
+    """
+    tn, fp, fn, tp = np.moveaxis(np.asarray(counts, dtype=np.float64), -1, 0)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        precision = tp / (tp + fp)
+        recall = tp / (tp + fn)
+        return {
+            "accuracy": (tp + tn) / (tn + fp + fn + tp),
+            "precision": precision,
+            "recall": recall,
+            "f1": 2 * tp / (2 * tp + fp + fn),
+        }
+
+
+def bootstrap_metrics(y_true, y_pred, n_resamples=1000, confidence=0.95, seed=42, block_elements=1 << 22):
+    """
+    Point estimates and percentile bootstrap intervals for METRICS.
+
+    Each row's confusion cell (TN/FP/FN/TP) is computed once; every resample
+    is a row of an index matrix into those cells, and a single bincount per
+    block of resamples yields all confusion counts. The model is never
+    called again. Blocks keep the index matrix under `block_elements` entries.
+    """
+    y_true = np.asarray(y_true).astype(np.int64)
+    cells = (2 * y_true + np.asarray(y_pred).astype(np.int64)).astype(np.int8)
+    n = len(cells)
+    result = {"samples": int(n)}
+    if n == 0:
+        return result
+
+    point = metrics_from_counts(np.bincount(cells, minlength=4))
+    rng = np.random.default_rng(seed)
+    block = max(1, block_elements // n)
+    counts = np.empty((n_resamples, 4), dtype=np.int64)
+    for start in range(0, n_resamples, block):
+        size = min(block, n_resamples - start)
+        resampled = cells[rng.integers(0, n, (size, n))]
+        offsets = 4 * np.arange(size)[:, None]
+        counts[start:start + size] = np.bincount((resampled + offsets).ravel(), minlength=4 * size).reshape(size, 4)
+
+    tail = (1 - confidence) / 2 * 100
+    samples = metrics_from_counts(counts)
+    for name in METRICS:
+        low, high = np.nanpercentile(samples[name], [tail, 100 - tail]) if not np.isnan(samples[name]).all() \
+            else (np.nan, np.nan)
+        result[name] = {
+            "value": _round(point[name]),
+            "ci_low": _round(low),
+            "ci_high": _round(high),
+        }
+    return result
+
+
+def _round(value):
+    """JSON-friendly rounding (NaN becomes null)."""
+    return None if np.isnan(value) else round(float(value), 4)
+
+
+def breakdown(y_true, predictions, groups, bootstrap):
+    """bootstrap_metrics for every model overall and for each value of `groups`."""
+    y_true = np.asarray(y_true)
+    groups = np.asarray(groups)
+    result = {choice: bootstrap_metrics(y_true, pred, **bootstrap) for choice, pred in predictions.items()}
+    result["by_source"] = {
+        str(group): {
+            choice: bootstrap_metrics(y_true[mask], pred[mask], **bootstrap)
+            for choice, pred in predictions.items()
+        }
+        for group in pd.unique(groups)
+        for mask in [groups == group]
+    }
+    return result
 
-def evaluate_models(params):
-    """Load saved model bundle, evaluate on test set, save reports."""
-    # ── Load data ──
-    data_path = params["data"]["processed_path"]
-    features = params["features"]["names"]
-    target = params["features"]["target"]
-    test_size = params["data"]["test_size"]
-    random_state = params["data"]["random_state"]
 
+def labeled_sources(data_path, target, index):
+    """
+    Source of each row of a split. Split indices are positions among the
+    rows preprocess() keeps (those with a Safe/Unsafe or numeric label).
+    """
     df = load_data(data_path)
-    X, y, _ = preprocess(df, features, target)
-    X_train, X_test, y_train, y_test = split_data(X, y, test_size, random_state)
+    if "Source" not in df:
+        return np.full(len(index), "all", dtype=object)
+    keep = _label_codes(df[target].astype("category")) >= 0
+    return df["Source"].to_numpy(dtype=object)[keep][np.asarray(index)]
+
+
+def evaluate_dataset(name, data_path, model_path, features, target, bootstrap):
+    """
+    Score every labeled row of another processed table with each model.
+    Features are imputed with the bundle's imputer, as at inference time.
+    Runs in a worker process.
+    """
+    bundle = load_bundle(model_path)
+    df = load_data(data_path)
+    keep = _label_codes(df[target].astype("category"))
+    df, y_true = df[keep >= 0], keep[keep >= 0]
 
-    # ── Load model bundle ──
-    model_path = params["output"]["model_path"]
-    with open(model_path, "rb") as f:
-        bundle = pickle.load(f)
+    X = bundle["imputer"].transform(df[features].apply(pd.to_numeric, errors="coerce"))
+    predictions = {choice: predict_batch(X, choice, bundle)[0] for choice in MODEL_CHOICES}
+    groups = df["Source"].to_numpy(dtype=object) if "Source" in df else np.full(len(df), "all", dtype=object)
+    return name, {"path": data_path, **breakdown(y_true, predictions, groups, bootstrap)}
 
-    rf_model = bundle["rf_model"]
-    svm_model = bundle["svm_model"]
-    scaler = bundle["scaler"]
+
+def evaluate_test_split(params, X_test, y_test, bundle, bootstrap):
+    """Per-model reports, bootstrap intervals and per-Source breakdown on the test split."""
+    target = params["features"]["target"]
+
+    # Score with the app's prediction path (argmax of predict_proba)
+    predictions = {choice: predict_batch(X_test, choice, bundle)[0] for choice in MODEL_CHOICES}
 
     # ── Evaluate Random Forest ──
-    rf_pred = rf_model.predict(X_test)
+    rf_pred = predictions["Random Forest"]
     rf_accuracy = accuracy_score(y_test, rf_pred)
     rf_report = classification_report(y_test, rf_pred, output_dict=True)
     print(f"✅ Random Forest Test Accuracy: {rf_accuracy:.4f}")
     print(classification_report(y_test, rf_pred))
 
     # ── Evaluate SVM ──
-    X_test_scaled = scaler.transform(X_test)
-    svm_pred = svm_model.predict(X_test_scaled)
+    svm_pred = predictions["SVM"]
     svm_accuracy = accuracy_score(y_test, svm_pred)
     svm_report = classification_report(y_test, svm_pred, output_dict=True)
     print(f"✅ SVM Test Accuracy: {svm_accuracy:.4f}")
     print(classification_report(y_test, svm_pred))
 
-    # ── Save evaluation metrics ──
-    os.makedirs("reports", exist_ok=True)
+    # ── Bootstrap intervals and per-Source breakdown on the test split ──
+    sources = labeled_sources(params["data"]["processed_path"], target, X_test.index)
+    test_breakdown = breakdown(y_test, predictions, sources, bootstrap)
+    for choice in MODEL_CHOICES:
+        acc = test_breakdown[choice]["accuracy"]
+        print(f"✅ {choice} accuracy {acc['value']:.4f} "
+              f"({bootstrap.get('confidence', 0.95):.0%} CI {acc['ci_low']:.4f}–{acc['ci_high']:.4f})")
 
     eval_metrics = {
         "rf_test_accuracy": round(rf_accuracy, 4),
         "svm_test_accuracy": round(svm_accuracy, 4),
         "rf_classification_report": rf_report,
         "svm_classification_report": svm_report,
+        "test": test_breakdown,
+        "datasets": {},
     }
+    return eval_metrics, predictions
+
+
+@timed("evaluate_models")
+def evaluate_models(params):
+    """Load saved model bundle, evaluate on test set, save reports."""
+    eval_params = params.get("evaluate", {})
+    bootstrap = eval_params.get("bootstrap", {})
+    features = params["features"]["names"]
+    target = params["features"]["target"]
+    model_path = resolve_bundle_path(params["output"])
+
+    # ── Load data ──
+    X_train, X_test, y_train, y_test, _ = load_splits(params)
+
+    # ── Load model bundle ──
+    bundle = load_bundle(model_path)
+
+    # ── Score additional datasets in worker processes meanwhile ──
+    datasets = eval_params.get("datasets", {})
+    with ProcessPoolExecutor(max_workers=eval_params.get("workers", 2)) as pool:
+        futures = [
+            pool.submit(evaluate_dataset, name, path, model_path, features, target, bootstrap)
+            for name, path in datasets.items()
+        ]
+        eval_metrics, predictions = evaluate_test_split(params, X_test, y_test, bundle, bootstrap)
+        for future in futures:
+            name, result = future.result()
+            eval_metrics["datasets"][name] = result
+            print(f"✅ {name}: {result['Random Forest']['samples']} samples, RF accuracy "
+                  f"{result['Random Forest']['accuracy']['value']:.4f}, SVM accuracy "
+                  f"{result['SVM']['accuracy']['value']:.4f}")
+    rf_pred, svm_pred = predictions["Random Forest"], predictions["SVM"]
+
+    # ── Save evaluation metrics ──
+    os.makedirs("reports", exist_ok=True)
     eval_path = params["output"]["eval_metrics_path"]
     with open(eval_path, "w") as f:
         json.dump(eval_metrics, f, indent=2)
@@ -96,4 +237,6 @@ def evaluate_models(params):
 
 if __name__ == "__main__":
     params = load_params()
+    configure(params)
     evaluate_models(params)
+    export(params)
@@ -0,0 +1,174 @@
+"""
+ingest.py — Build the processed pH/TDS table from the raw source files.
+Each source in params.yaml `ingest.sources` maps its own column names onto
+pH and TDS (directly, or from electrical conductivity). Sources are streamed
+in chunks and processed in parallel, one Parquet part per source; a source is
+only re-read when its file or its mapping changed since the last run.
+"""
+
+import hashlib
+import json
+import os
+import time
+import unicodedata
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.data_preprocessing import load_params
+
+PARTS_MANIFEST = "manifest.json"
+LABELS = np.array(["Unsafe", "Safe", "Unknown"], dtype=object)
+
+
+def _normalize(column):
+    """Collapse whitespace and unify look-alike characters (µ vs μ) in a column name."""
+    return " ".join(unicodedata.normalize("NFKC", str(column)).split())
+
+
+def source_fingerprint(path, source, rules):
+    """SHA-256 of the raw file bytes, the source's mapping, and the shared rules."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    digest.update(json.dumps({"source": source, "rules": rules}, sort_keys=True).encode())
+    return digest.hexdigest()
+
+
+def transform_chunk(chunk, name, source, rules):
+    """
+    Map one raw chunk onto Source/pH/TDS/Classification (vectorized).
+
+    pH readings above `rules["ph_valid_max"]` are taken as a lost decimal
+    point and rescaled to one integer digit (86 → 8.6, 742 → 7.42). TDS comes from the source's TDS
+    column, or from conductivity × `rules["tds_per_conductivity"]`. A reading
+    is Safe when pH is within [ph_min, ph_max] and TDS ≤ tds_max (a missing
+    value does not count against it), and Unknown when both are missing.
+    """
+    ph = pd.to_numeric(chunk[source["ph"]], errors="coerce").to_numpy(dtype=np.float64)
+    misplaced = ph > rules["ph_valid_max"]
+    ph[misplaced] /= 10.0 ** np.floor(np.log10(ph[misplaced]))
+    if "tds" in source:
+        tds = pd.to_numeric(chunk[source["tds"]], errors="coerce").to_numpy(dtype=np.float64)
+    else:
+        conductivity = pd.to_numeric(chunk[source["conductivity"]], errors="coerce").to_numpy(dtype=np.float64)
+        tds = conductivity * rules["tds_per_conductivity"]
+
+    ph_missing, tds_missing = np.isnan(ph), np.isnan(tds)
+    ph_ok = ph_missing | ((ph >= rules["ph_min"]) & (ph <= rules["ph_max"]))
+    tds_ok = tds_missing | (tds <= rules["tds_max"])
+    label = np.where(ph_missing & tds_missing, 2, (ph_ok & tds_ok).astype(np.int64))
+
+    return pd.DataFrame({
+        "Source": name,
+        "pH": ph,
+        "TDS": tds,
+        "Classification": LABELS[label],
+    })
+
+
+def ingest_source(name, source, raw_dir, part_path, rules, chunksize):
+    """
+    Stream one raw file into its Parquet part. Runs in a worker process.
+    The part is written to a temporary file and renamed when complete.
+
+    Returns: (name, rows, seconds)
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    start = time.perf_counter()
+    path = os.path.join(raw_dir, source["file"])
+    encoding = source.get("encoding", "utf-8")
+
+    # Resolve the mapped names against the file's actual (whitespace-normalized) header
+    header = pd.read_csv(path, nrows=0, encoding=encoding).columns
+    by_normalized = {_normalize(c): c for c in header}
+    mapped = {key: by_normalized[_normalize(source[key])] for key in ("ph", "tds", "conductivity") if key in source}
+    resolved = {**source, **mapped}
+
+    tmp_path = part_path + ".tmp"
+    writer, rows = None, 0
+    try:
+        for chunk in pd.read_csv(path, usecols=list(mapped.values()), dtype=str,
+                                 encoding=encoding, chunksize=chunksize):
+            table = pa.Table.from_pandas(transform_chunk(chunk, name, resolved, rules), preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(tmp_path, table.schema)
+            writer.write_table(table)
+            rows += table.num_rows
+    finally:
+        if writer is not None:
+            writer.close()
+    os.replace(tmp_path, part_path)
+    return name, rows, time.perf_counter() - start
+
+
+def ingest(params):
+    """Refresh changed source parts in parallel, then write the combined table."""
+    ingest_params = params["ingest"]
+    raw_dir = ingest_params["raw_dir"]
+    parts_dir = ingest_params["parts_dir"]
+    rules = ingest_params["rules"]
+    sources = ingest_params["sources"]
+    os.makedirs(parts_dir, exist_ok=True)
+
+    manifest_path = os.path.join(parts_dir, PARTS_MANIFEST)
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+
+    fingerprints = {
+        name: source_fingerprint(os.path.join(raw_dir, source["file"]), source, rules)
+        for name, source in sources.items()
+    }
+    stale = [
+        name for name in sources
+        if manifest.get(name, {}).get("fingerprint") != fingerprints[name]
+        or not os.path.exists(os.path.join(parts_dir, f"{name}.parquet"))
+    ]
+    print(f"Sources: {len(sources)} configured, {len(stale)} to ingest, {len(sources) - len(stale)} unchanged")
+
+    if stale:
+        with ProcessPoolExecutor(max_workers=min(ingest_params["workers"], len(stale))) as pool:
+            futures = [
+                pool.submit(ingest_source, name, sources[name], raw_dir,
+                            os.path.join(parts_dir, f"{name}.parquet"), rules, ingest_params["chunksize"])
+                for name in stale
+            ]
+            for future in futures:
+                name, rows, seconds = future.result()
+                manifest[name] = {"fingerprint": fingerprints[name], "rows": rows, "seconds": round(seconds, 3)}
+                print(f"✅ Ingested {name}: {rows} rows in {seconds:.2f}s")
+
+    # Forget parts of sources that were removed from params.yaml
+    for name in set(manifest) - set(sources):
+        manifest.pop(name)
+        part_path = os.path.join(parts_dir, f"{name}.parquet")
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+    tmp_path = manifest_path + ".tmp"
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, manifest_path)
+
+    combined = pd.concat(
+        [pd.read_parquet(os.path.join(parts_dir, f"{name}.parquet")) for name in sources],
+        ignore_index=True,
+    )
+    output_path = ingest_params["output_path"]
+    os.makedirs(os.path.dirname(output_path) or ".", exist_ok=True)
+    combined.to_parquet(output_path, index=False)
+    print(f"✅ Processed table saved to {output_path} ({len(combined)} rows)")
+    print(combined.groupby("Source", sort=False)["Classification"].value_counts().unstack(fill_value=0))
+    return combined
+
+
+if __name__ == "__main__":
+    params = load_params()
+    ingest(params)
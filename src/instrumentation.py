@@ -0,0 +1,274 @@
+"""
+instrumentation.py — Opt-in timers, counters and histograms for hot paths.
+Disabled by default: an instrumented call then costs one flag check. Enable
+with WQ_INSTRUMENT=1 or the `instrumentation` section of params.yaml, and
+export as Prometheus text or JSON. Also provides a sampling profiler that
+dumps the hottest stacks of a run in collapsed (flame graph) format.
+"""
+
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from contextlib import contextmanager
+
+LATENCY_BUCKETS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 60000)
+
+
+class Histogram:
+    """Fixed-bucket cumulative histogram (Prometheus-style upper bounds)."""
+
+    def __init__(self, buckets):
+        self.buckets = list(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def snapshot(self):
+        cumulative, running = {}, 0
+        for bound, n in zip(self.buckets + ["+Inf"], self.counts):
+            running += n
+            cumulative[str(bound)] = running
+        return {
+            "buckets": cumulative,
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+        }
+
+
+class Registry:
+    """Process-wide counters, gauges and histograms; thread-safe, off unless enabled."""
+
+    def __init__(self):
+        self.enabled = os.environ.get("WQ_INSTRUMENT", "") not in ("", "0")
+        self._lock = threading.Lock()
+        self.counters = {}
+        self.gauges = {}
+        self.histograms = {}
+
+    def count(self, name, value=1):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name, value):
+        if not self.enabled:
+            return
+        with self._lock:
+            self.gauges[name] = value
+
+    def observe(self, name, value, buckets=LATENCY_BUCKETS_MS):
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram(buckets)
+            histogram.observe(value)
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "counters": dict(self.counters),
+                "gauges": dict(self.gauges),
+                "histograms": {name: h.snapshot() for name, h in self.histograms.items()},
+            }
+
+
+REGISTRY = Registry()
+
+
+def enable(on=True):
+    REGISTRY.enabled = on
+
+
+def configure(params):
+    """Enable collection when params["instrumentation"]["enabled"] is set (WQ_INSTRUMENT also works)."""
+    if params.get("instrumentation", {}).get("enabled"):
+        enable()
+    return REGISTRY.enabled
+
+
+def count(name, value=1):
+    REGISTRY.count(name, value)
+
+
+def gauge(name, value):
+    """Record the latest value of `name` (e.g. a drift score)."""
+    REGISTRY.set(name, value)
+
+
+@contextmanager
+def timer(name):
+    """Time a block into the `<name>_ms` histogram and `<name>_calls` counter."""
+    if not REGISTRY.enabled:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        REGISTRY.observe(f"{name}_ms", (time.perf_counter() - start) * 1000)
+        REGISTRY.count(f"{name}_calls")
+
+
+def timed(name):
+    """Decorator form of timer(); errors are also counted as `<name>_errors`."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not REGISTRY.enabled:
+                return fn(*args, **kwargs)
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            except Exception:
+                REGISTRY.count(f"{name}_errors")
+                raise
+            finally:
+                REGISTRY.observe(f"{name}_ms", (time.perf_counter() - start) * 1000)
+                REGISTRY.count(f"{name}_calls")
+        return wrapper
+    return decorator
+
+
+def _metric_name(name):
+    return "water_" + "".join(c if c.isalnum() else "_" for c in name)
+
+
+def prometheus_text(snapshot=None):
+    """Render a registry snapshot in the Prometheus text exposition format."""
+    snapshot = snapshot or REGISTRY.snapshot()
+    lines = []
+    for name, value in sorted(snapshot["counters"].items()):
+        metric = _metric_name(name) + "_total"
+        lines += [f"# TYPE {metric} counter", f"{metric} {value}"]
+    for name, value in sorted(snapshot.get("gauges", {}).items()):
+        metric = _metric_name(name)
+        lines += [f"# TYPE {metric} gauge", f"{metric} {value}"]
+    for name, histogram in sorted(snapshot["histograms"].items()):
+        metric = _metric_name(name)
+        lines.append(f"# TYPE {metric} histogram")
+        for bound, cumulative in histogram["buckets"].items():
+            lines.append(f'{metric}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f"{metric}_sum {histogram['mean'] * histogram['count']}")
+        lines.append(f"{metric}_count {histogram['count']}")
+    return "\n".join(lines) + "\n"
+
+
+def export(params):
+    """Write the registry to the JSON and Prometheus paths in params["instrumentation"]."""
+    if not REGISTRY.enabled:
+        return
+    settings = params.get("instrumentation", {})
+    snapshot = REGISTRY.snapshot()
+    for key, render in (("json_path", lambda: json.dumps(snapshot, indent=2)),
+                        ("prometheus_path", lambda: prometheus_text(snapshot))):
+        path = settings.get(key)
+        if path:
+            os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+            with open(path, "w") as f:
+                f.write(render())
+            print(f"✅ Instrumentation written to {path}")
+
+
+def start_exporter(params):
+    """
+    Export the registry every `instrumentation.export_seconds` on a daemon
+    thread, for long-running processes (the app). Returns the thread, or
+    None when instrumentation is off.
+    """
+    if not REGISTRY.enabled:
+        return None
+    seconds = params.get("instrumentation", {}).get("export_seconds", 60)
+
+    def run():
+        while True:
+            time.sleep(seconds)
+            export(params)
+
+    thread = threading.Thread(target=run, name="instrumentation-export", daemon=True)
+    thread.start()
+    return thread
+
+
+class SamplingProfiler:
+    """
+    Wall-clock sampling profiler for the current process.
+
+    A daemon thread snapshots every other thread's stack each
+    `interval_ms` via sys._current_frames() and counts collapsed stacks
+    ("module:function;module:function ..."). Overhead is one stack walk per
+    sample, independent of how many Python calls the profiled code makes.
+    Stacks inside worker processes (e.g. parallel model fits) are not seen.
+    """
+
+    def __init__(self, interval_ms=5.0, max_depth=64):
+        self.interval = interval_ms / 1000
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def start(self):
+        self._thread = threading.Thread(target=self._sample, name="sampling-profiler", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def dump(self, path, top=50):
+        """Write the `top` hottest stacks as collapsed "stack count" lines."""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w") as f:
+            for stack, n in self.stacks.most_common(top):
+                f.write(f"{stack} {n}\n")
+
+
+@contextmanager
+def profiled(params):
+    """Run a block under SamplingProfiler when params["instrumentation"]["profile"] is set."""
+    settings = params.get("instrumentation", {})
+    if not settings.get("profile"):
+        yield None
+        return
+    profiler = SamplingProfiler(settings.get("profile_interval_ms", 5.0)).start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        profiler.dump(settings["profile_path"])
+        print(f"✅ {profiler.samples} profile samples; hottest stacks saved to {settings['profile_path']}")
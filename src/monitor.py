@@ -0,0 +1,261 @@
+"""
+monitor.py — Vectorized multi-station monitoring engine.
+Advances every station's simulated sensor stream per tick as NumPy arrays,
+scores all stations with one batched model call, and reports only the
+stations whose status changed. Used by the app's real-time section and, from
+the command line, as a headless load test:
+
+    python -m src.monitor --stations 1 100 1000 10000 --ticks 200
+"""
+
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.data_preprocessing import load_params
+from src.predict import load_bundle, predict_batch, resolve_bundle_path
+
+# Reading distributions per station state: safe, critical (far outside the
+# safe ranges) and subtle (gray zone left to the model)
+SAFE, CRITICAL, SUBTLE = 0, 1, 2
+PH_MEAN = np.array([7.2, 3.5, 6.0])
+PH_STD = np.array([0.1, 0.2, 0.2])
+TDS_MEAN = np.array([300.0, 3500.0, 1500.0])
+TDS_STD = np.array([10.0, 50.0, 100.0])
+
+
+def load_station_codes(monitor_params):
+    """Unique station codes from the configured raw file, in file order."""
+    codes = pd.read_csv(
+        monitor_params["stations_file"], usecols=[monitor_params["station_column"]],
+        dtype=str, encoding=monitor_params.get("encoding", "utf-8"),
+    )[monitor_params["station_column"]].dropna().str.strip()
+    return codes[codes != ""].drop_duplicates().tolist()
+
+
+def station_ids(codes, n):
+    """`n` station ids: the known codes first, then synthetic SIM ids."""
+    ids = list(codes[:n])
+    return ids + [f"SIM{i:05d}" for i in range(len(ids), n)]
+
+
+class MonitoringEngine:
+    """
+    N simulated station streams advanced together.
+
+    Per-station state lives in arrays: the remaining `contamination_steps`
+    of an ongoing event, the latest pH/TDS reading, and the latest
+    prediction and safe-class probability. tick() draws every station's
+    reading at once, scores them in one predict_batch call, and returns the
+    stations whose prediction changed (on the first tick, every station).
+    Callers render and alert on those transitions only, so a steady fleet
+    costs nothing beyond the tick itself. With a ReadingStore, every
+    station's reading and prediction is also buffered for persistence.
+    """
+
+    def __init__(self, stations, bundle, model_choice="Random Forest", engine="lookup",
+                 event_chance=0.05, event_steps=(5, 15), seed=None, store=None):
+        self.stations = np.asarray(stations, dtype=object)
+        self.bundle = bundle
+        self.model_choice = model_choice
+        self.engine = engine
+        self.event_chance = event_chance
+        self.event_steps = tuple(event_steps)
+        self._rng = np.random.default_rng(seed)
+        self.store = store
+
+        n = len(self.stations)
+        self.contamination_steps = np.zeros(n, dtype=np.int32)
+        self.ph = np.full(n, np.nan)
+        self.tds = np.full(n, np.nan)
+        self.prediction = np.full(n, -1, dtype=np.int8)
+        self.probability = np.full(n, np.nan)
+        self.ticks = 0
+
+    def __len__(self):
+        return len(self.stations)
+
+    def advance(self):
+        """Draw the next reading of every station and update event state."""
+        n, rng = len(self), self._rng
+        active = self.contamination_steps > 0
+        self.contamination_steps[active] -= 1
+
+        # During an event each tick is critical or subtle with equal chance
+        state = np.where(active, np.where(rng.random(n) < 0.5, CRITICAL, SUBTLE), SAFE)
+        self.ph = PH_MEAN[state] + PH_STD[state] * rng.standard_normal(n)
+        self.tds = TDS_MEAN[state] + TDS_STD[state] * rng.standard_normal(n)
+
+        # Stations that were safe this tick may start an event on the next one
+        started = ~active & (rng.random(n) < self.event_chance)
+        self.contamination_steps[started] = rng.integers(*self.event_steps, size=int(started.sum()))
+
+    def score(self):
+        """Score every station with one batched model call; return changed indices."""
+        if self.bundle is None:
+            return np.empty(0, dtype=np.intp)
+        predictions, probabilities = predict_batch(
+            np.column_stack([self.ph, self.tds]), self.model_choice, self.bundle, self.engine
+        )
+        changed = np.flatnonzero(predictions != self.prediction)
+        self.prediction[:] = predictions
+        self.probability = np.asarray(probabilities, dtype=np.float64)
+        return changed
+
+    def tick(self):
+        """
+        Advance and score all stations.
+
+        Returns: DataFrame of the stations whose status changed, with columns
+                 station, prediction, probability, pH, TDS
+        """
+        self.advance()
+        changed = self.score()
+        self.ticks += 1
+        if self.store is not None:
+            self.store.add_readings(np.datetime64("now", "ms"), self.stations, self.ph, self.tds,
+                                    self.prediction, self.probability, self.model_choice)
+        return pd.DataFrame({
+            "station": self.stations[changed],
+            "prediction": self.prediction[changed],
+            "probability": self.probability[changed],
+            "pH": self.ph[changed],
+            "TDS": self.tds[changed],
+        })
+
+    def snapshot(self):
+        """Current state of every station (for tables and exports)."""
+        return pd.DataFrame({
+            "station": self.stations,
+            "prediction": self.prediction,
+            "probability": self.probability,
+            "pH": self.ph,
+            "TDS": self.tds,
+            "contamination_steps": self.contamination_steps,
+        })
+
+
+def alert_message(row):
+    return (f"🚨 WATER ALERT: Contamination detected at station {row.station}!\n"
+            f"pH Level: {row.pH:.2f}\nTDS (Solids): {row.TDS:.0f} ppm\n"
+            f"Model Confidence: {1 - row.probability:.1%}")
+
+
+def dispatch_transitions(transitions, dispatcher, store=None, model_choice=None):
+    """
+    Forward status changes to an AlertDispatcher. Stations that turned
+    unsafe queue an alert; stations that turned safe close their event.
+    With a ReadingStore, the outcome of every unsafe transition is recorded.
+
+    Returns: {"queued": n, "suppressed": n, "dropped": n, "clear": n}
+    """
+    outcomes = {"queued": 0, "suppressed": 0, "dropped": 0, "clear": 0}
+    alerts = []
+    for row in transitions.itertuples(index=False):
+        unsafe = row.prediction == 0
+        message = alert_message(row) if unsafe else ""
+        outcome = dispatcher.notify(row.station, unsafe, message)
+        outcomes[outcome] += 1
+        if unsafe:
+            alerts.append((row.station, outcome, message))
+    if store is not None and alerts:
+        store.add_alerts(np.datetime64("now", "ms"), *zip(*alerts), model_choice)
+    return outcomes
+
+
+def load_test(bundle, codes, station_counts, ticks, monitor_params, model_choice="Random Forest",
+              dispatcher=None, store=None, seed=42):
+    """
+    Headless run of `ticks` ticks per fleet size. Reports tick latency
+    (including alert dispatch and store buffering when a dispatcher or
+    store is given) and how many transitions each tick produced.
+    """
+    results = {}
+    for n in station_counts:
+        engine = MonitoringEngine(
+            station_ids(codes, n), bundle, model_choice, monitor_params["engine"],
+            monitor_params["event_chance"], monitor_params["event_steps"], seed, store,
+        )
+        engine.tick()  # first tick reports every station; keep it out of the steady-state numbers
+        durations, transitions, turned_unsafe = [], 0, 0
+        for _ in range(ticks):
+            start = time.perf_counter()
+            changed = engine.tick()
+            if dispatcher is not None:
+                dispatch_transitions(changed, dispatcher, store, model_choice)
+            durations.append((time.perf_counter() - start) * 1000)
+            transitions += len(changed)
+            turned_unsafe += int((changed["prediction"] == 0).sum())
+
+        durations = np.array(durations)
+        results[str(n)] = {
+            "stations": n,
+            "ticks": ticks,
+            "tick_ms_p50": round(float(np.percentile(durations, 50)), 4),
+            "tick_ms_p99": round(float(np.percentile(durations, 99)), 4),
+            "tick_ms_mean": round(float(durations.mean()), 4),
+            "us_per_station": round(float(durations.mean()) * 1000 / n, 4),
+            "transitions_per_tick": round(transitions / ticks, 2),
+            "turned_unsafe_per_tick": round(turned_unsafe / ticks, 2),
+            "unsafe_share": round(float((engine.prediction == 0).mean()), 4),
+        }
+        row = results[str(n)]
+        print(f"  {n:>6} stations: p50 {row['tick_ms_p50']:.2f} ms, p99 {row['tick_ms_p99']:.2f} ms, "
+              f"{row['transitions_per_tick']:.1f} transitions/tick")
+    return results
+
+
+if __name__ == "__main__":
+    params = load_params()
+    monitor_params = params["monitor"]
+    parser = argparse.ArgumentParser(description="Headless load test of the multi-station monitoring engine.")
+    parser.add_argument("--stations", type=int, nargs="+", default=[1, 100, 1000, 10000],
+                        help="Fleet sizes to run")
+    parser.add_argument("--ticks", type=int, default=200, help="Ticks per fleet size")
+    parser.add_argument("--model", default="Random Forest", choices=["Random Forest", "SVM", "Consensus"])
+    parser.add_argument("--engine", default=monitor_params["engine"], choices=["sklearn", "compiled", "lookup"])
+    parser.add_argument("--alert-log", help="Dispatch alerts to this log file (default: no alerting)")
+    parser.add_argument("--store", help="Also persist every reading to this SQLite file (see src/store.py)")
+    parser.add_argument("--output", default=monitor_params["report_path"])
+    args = parser.parse_args()
+
+    monitor_params = {**monitor_params, "engine": args.engine}
+    bundle = load_bundle(resolve_bundle_path(params["output"]))
+    codes = load_station_codes(monitor_params)
+    print(f"✅ {len(codes)} station codes loaded from {monitor_params['stations_file']}")
+
+    dispatcher = None
+    if args.alert_log:
+        from src.alerts import AlertDispatcher, LogTransport
+        alert_params = {k: v for k, v in params.get("alerts", {}).items() if k != "log_path"}
+        dispatcher = AlertDispatcher(LogTransport(args.alert_log), **alert_params).start()
+
+    store = None
+    if args.store:
+        from src.store import ReadingStore
+        store = ReadingStore(args.store, params["store"]["batch_size"], params["store"]["flush_seconds"]).start()
+
+    print(f"⏱️  {args.model} / {args.engine} engine, {args.ticks} ticks per fleet size")
+    results = {
+        "model": args.model,
+        "engine": args.engine,
+        "bundle_version": bundle.get("version"),
+        "fleets": load_test(bundle, codes, args.stations, args.ticks, monitor_params, args.model, dispatcher, store),
+    }
+    if dispatcher is not None:
+        dispatcher.stop(timeout=5)
+        results["alerts_dropped"] = dispatcher.dropped
+    if store is not None:
+        start = time.perf_counter()
+        store.close()
+        results["store_rows"] = store.written
+        results["store_close_seconds"] = round(time.perf_counter() - start, 3)
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Load test results saved to {args.output}")
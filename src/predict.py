@@ -3,18 +3,260 @@ predict.py — ML-only prediction logic.
 Used by the Streamlit app for inference.
 """
 
+import argparse
+import os
+import pickle
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+
 import numpy as np
 
+from src.bundle_store import MANIFEST, POINTER, LazyBundle, current_version_dir
+from src.instrumentation import timed
+
+# Above this many rows sklearn's forest traversal beats the flat evaluator
+COMPILED_MAX_ROWS = 512
+
+
+@timed("load_bundle")
+def load_bundle(model_path="water_model.pkl"):
+    """
+    Load the trained model bundle written by src/train.py.
+
+    A bundle directory (see src/bundle_store.py) is opened lazily, so only
+    the components a caller touches are read; a .pkl file is unpickled whole.
+    """
+    if os.path.isdir(model_path):
+        return LazyBundle(model_path)
+    with open(model_path, "rb") as f:
+        return pickle.load(f)
+
+
+def resolve_bundle_path(output_params):
+    """Prefer the lazy bundle directory from params["output"], else the .pkl."""
+    bundle_dir = output_params.get("bundle_dir")
+    if bundle_dir and current_version_dir(bundle_dir):
+        return bundle_dir
+    return output_params["model_path"]
+
+
+def _feature_matrix(data, bundle):
+    """
+    Coerce a batch of readings into a float (n_samples, n_features) array.
+
+    DataFrames are reordered to bundle["features"]; arrays are assumed to
+    already be in that column order (pH, TDS). A single reading is promoted
+    to a one-row batch.
+    """
+    features = bundle.get("features", ["pH", "TDS"])
+    if hasattr(data, "columns"):
+        data = data[features].to_numpy()
+    X = np.asarray(data, dtype=np.float64)
+    if X.ndim == 1:
+        X = X.reshape(1, -1)
+    if X.shape[1] != len(features):
+        raise ValueError(
+            f"Expected {len(features)} feature columns {features}, got shape {X.shape}"
+        )
+    return X
+
+
+def _score(model, X):
+    """
+    Single predict_proba pass; the label is the argmax class.
+
+    Avoids the separate model.predict call, which would run the whole
+    forest (or the SVM kernel expansion) a second time on the same input.
+    """
+    proba = model.predict_proba(X)
+    predictions = model.classes_[np.argmax(proba, axis=1)]
+    return predictions.astype(int), proba[:, 1].astype(float)
+
+
+def forest_predict_proba(flat, X):
+    """
+    Evaluate a flattened Random Forest (see src.train.flatten_forest).
+
+    Every (sample, tree) pair advances one level per step as a single
+    vectorized gather over the node table, so a batch walks all trees at
+    once with no sklearn dispatch; pairs that reach a leaf drop out of the
+    working set. Inputs are cast to float32 first, as sklearn's trees do,
+    so threshold comparisons match sklearn exactly, and NaN features follow
+    each node's `missing_left` routing as in sklearn.
+
+    This beats sklearn by far for single readings and small batches; for
+    batches of many thousands sklearn's compiled traversal is faster.
+    """
+    X = np.asarray(X, dtype=np.float32)
+    n_samples, n_features = X.shape
+    n_trees = len(flat["roots"])
+    children = flat["children"].ravel()
+
+    # One entry per (sample, tree) pair, sample-major
+    nodes = np.tile(flat["roots"], n_samples)
+    offsets = np.repeat(np.arange(n_samples) * n_features, n_trees)
+    active = np.arange(nodes.size)
+    current = nodes
+    for _ in range(flat["max_depth"]):
+        x = X.ravel().take(offsets + flat["feature"].take(current))
+        right = np.where(np.isnan(x), ~flat["missing_left"].take(current), x > flat["threshold"].take(current))
+        current = children.take(2 * current + right)
+        nodes[active] = current
+        live = ~flat["leaf"].take(current)
+        active, current, offsets = active[live], current[live], offsets[live]
+        if not active.size:
+            break
+
+    n_classes = flat["value"].shape[1]
+    return flat["value"].take(nodes, axis=0).reshape(n_samples, n_trees, n_classes).mean(axis=1)
+
+
+def _score_forest(X, bundle, engine):
+    """Score the Random Forest with sklearn or, if exported, the flat evaluator."""
+    flat = bundle.get("rf_flat")
+    # Flat forests exported before missing-value routing leave NaN features to sklearn
+    if engine == "compiled" and flat is not None and ("missing_left" in flat or not np.isnan(X).any()):
+        proba = forest_predict_proba(flat, X)
+        predictions = flat["classes"][np.argmax(proba, axis=1)]
+        return predictions.astype(int), proba[:, 1].astype(float)
+    return _score(bundle["rf_model"], X)
+
+
+def lookup_predict_proba(surface, model_choice, X):
+    """
+    Bilinear lookup of the safe-class probability on a precomputed surface
+    (see src.train.build_lookup_surface).
+
+    Returns:
+        (probabilities, fallback)
+        fallback: True where the reading is outside the grid, lands in a
+                  cell flagged when the surface was built, or interpolates to
+                  within the surface threshold of 0.5, where the remaining
+                  error could still flip the label
+    """
+    ph_axis, tds_axis = surface["ph_axis"], surface["log_tds_axis"]
+    model_surface = surface["models"][model_choice]
+    grid = model_surface["grid"]
+
+    ph = X[:, 0]
+    log_tds = np.log1p(np.maximum(X[:, 1], 0.0))
+    gx = (ph - ph_axis[0]) / (ph_axis[1] - ph_axis[0])
+    gy = (log_tds - tds_axis[0]) / (tds_axis[1] - tds_axis[0])
+    outside = (
+        (ph < ph_axis[0]) | (ph > ph_axis[-1])
+        | (X[:, 1] < 0) | (log_tds > tds_axis[-1])
+        | ~np.isfinite(gx) | ~np.isfinite(gy)
+    )
+
+    i = np.clip(np.floor(np.nan_to_num(gx)), 0, len(ph_axis) - 2).astype(np.intp)
+    j = np.clip(np.floor(np.nan_to_num(gy)), 0, len(tds_axis) - 2).astype(np.intp)
+    tx = np.clip(np.nan_to_num(gx) - i, 0.0, 1.0)
+    ty = np.clip(np.nan_to_num(gy) - j, 0.0, 1.0)
+
+    probabilities = (
+        (1 - tx) * (1 - ty) * grid[i, j]
+        + tx * (1 - ty) * grid[i + 1, j]
+        + (1 - tx) * ty * grid[i, j + 1]
+        + tx * ty * grid[i + 1, j + 1]
+    )
+    fallback = (
+        outside | model_surface["fallback"][i, j]
+        | (np.abs(probabilities - 0.5) <= surface["threshold"])
+    )
+    return probabilities, fallback
+
+
+def _score_lookup(model_choice, X, bundle):
+    """Score from the lookup surface, using the real model for flagged readings."""
+    probabilities, fallback = lookup_predict_proba(bundle["lookup"], model_choice, X)
+    predictions = (probabilities > 0.5).astype(int)
+    n_fallback = int(fallback.sum())
+    if n_fallback:
+        engine = "compiled" if n_fallback <= COMPILED_MAX_ROWS else "sklearn"
+        predictions[fallback], probabilities[fallback] = _score_model(
+            model_choice, X[fallback], bundle, engine
+        )
+    return predictions, probabilities
+
+
+def _score_model(model_choice, X, bundle, engine):
+    """Score one model ("Random Forest" or "SVM") with the requested engine."""
+    if engine == "lookup" and model_choice in bundle.get("lookup", {}).get("models", {}):
+        return _score_lookup(model_choice, X, bundle)
+    if model_choice == "Random Forest":
+        return _score_forest(X, bundle, engine)
+    return _score(bundle["svm_model"], bundle["scaler"].transform(X))
+
+
+def predict_consensus(data, bundle, engine="sklearn"):
+    """
+    Score a batch with both Random Forest and SVM.
+
+    The input matrix is built once and each model runs a single
+    predict_proba pass, so the cost is roughly one call per model.
+
+    Returns:
+        dict with arrays:
+        rf_prediction, rf_probability, svm_prediction, svm_probability,
+        agree: True where both models return the same label
+        prediction: 1 only when both models say safe
+        probability: the lower of the two safe-class probabilities
+    """
+    X = _feature_matrix(data, bundle)
+    rf_pred, rf_prob = _score_model("Random Forest", X, bundle, engine)
+    svm_pred, svm_prob = _score_model("SVM", X, bundle, engine)
+
+    return {
+        "rf_prediction": rf_pred,
+        "rf_probability": rf_prob,
+        "svm_prediction": svm_pred,
+        "svm_probability": svm_prob,
+        "agree": rf_pred == svm_pred,
+        "prediction": rf_pred & svm_pred,
+        "probability": np.minimum(rf_prob, svm_prob),
+    }
+
+
+@timed("predict_batch")
+def predict_batch(data, model_choice, bundle, engine="sklearn"):
+    """
+    Run ML model prediction for a batch of water readings.
+
+    Args:
+        data: DataFrame with bundle["features"] columns, or array of shape
+              (n_samples, 2) in the same column order
+        model_choice: "Random Forest", "SVM" or "Consensus"
+        bundle: dict with rf_model, svm_model, scaler keys
+        engine: "sklearn"; "compiled" to evaluate the forest from
+                bundle["rf_flat"]; or "lookup" to interpolate the
+                precomputed bundle["lookup"] surfaces. Engines whose bundle
+                entry is absent fall back to sklearn.
+
+    Returns:
+        (predictions, probabilities)
+        predictions: int array, 1 = safe, 0 = unsafe
+        probabilities: float array, probability of the safe class
+    """
+    if model_choice == "Consensus":
+        result = predict_consensus(data, bundle, engine)
+        return result["prediction"], result["probability"]
+
+    X = _feature_matrix(data, bundle)
+    return _score_model(model_choice, X, bundle, engine)
+
 
-def predict_quality(ph, tds, model_choice, bundle):
+@timed("predict_quality")
+def predict_quality(ph, tds, model_choice, bundle, engine="sklearn"):
     """
     Run ML model prediction for water quality.
 
     Args:
         ph: pH level
         tds: TDS (Solids) value
-        model_choice: "Random Forest" or "SVM"
+        model_choice: "Random Forest", "SVM" or "Consensus"
         bundle: dict with rf_model, svm_model, scaler keys
+        engine: "sklearn", "compiled" or "lookup" (see predict_batch)
 
     Returns:
         (prediction, probability, reason)
@@ -22,22 +264,282 @@ def predict_quality(ph, tds, model_choice, bundle):
         probability: confidence for the predicted class
         reason: explanation string
     """
-    input_data = np.array([[ph, tds]])
+    if model_choice == "Consensus":
+        result = predict_consensus([[ph, tds]], bundle, engine)
+        agreement = "agree" if result["agree"][0] else "disagree"
+        reason = (
+            f"Model Prediction: Consensus (RF {result['rf_probability'][0]:.1%} safe, "
+            f"SVM {result['svm_probability'][0]:.1%} safe — models {agreement})"
+        )
+        return int(result["prediction"][0]), float(result["probability"][0]), reason
 
-    if model_choice == "Random Forest":
-        model = bundle["rf_model"]
-        prediction = model.predict(input_data)[0]
-        probability = model.predict_proba(input_data)[0][1]
-    else:  # SVM
-        model = bundle["svm_model"]
-        scaler = bundle["scaler"]
-        input_scaled = scaler.transform(input_data)
-        prediction = model.predict(input_scaled)[0]
-        probability = model.predict_proba(input_scaled)[0][1]
+    predictions, probabilities = predict_batch([[ph, tds]], model_choice, bundle, engine)
 
     # Use exact probability instead of artificial smoothing
     # (Removed np.random.uniform smoothing to keep confidences consistent)
 
     reason = f"Model Prediction: {model_choice}"
 
-    return int(prediction), float(probability), reason
+    return int(predictions[0]), float(probabilities[0]), reason
+
+
+def file_signature(path):
+    """
+    (mtime_ns, size) of a file, or None if it does not exist. For a bundle
+    directory this is the signature of its CURRENT pointer, which every save
+    replaces (or of the manifest, for the flat layout).
+    """
+    if path is not None and os.path.isdir(path):
+        pointer = os.path.join(path, POINTER)
+        path = pointer if os.path.exists(pointer) else os.path.join(path, MANIFEST)
+    try:
+        stat = os.stat(path)
+    except (OSError, TypeError):
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache in front of predict_quality.
+
+    Readings are quantized to `ph_decimals` / `tds_decimals` and keyed on
+    (model choice, engine, bundle version, pH, TDS); a hit skips the models
+    entirely. The prediction is computed from the quantized values, so a
+    cached answer is exactly what the model returns for its key.
+
+    If `model_path` is given, the cache clears itself whenever that file's
+    modification time or size changes, i.e. after retraining.
+    """
+
+    def __init__(self, maxsize=4096, ph_decimals=2, tds_decimals=0, model_path=None):
+        self.maxsize = maxsize
+        self.ph_decimals = ph_decimals
+        self.tds_decimals = tds_decimals
+        self.model_path = model_path
+        self._signature = file_signature(model_path)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def predict_quality(self, ph, tds, model_choice, bundle, engine="sklearn"):
+        """Cached equivalent of src.predict.predict_quality."""
+        if self.model_path is not None:
+            signature = file_signature(self.model_path)
+            if signature != self._signature:
+                self.clear()
+                self._signature = signature
+
+        ph = round(float(ph), self.ph_decimals)
+        tds = round(float(tds), self.tds_decimals)
+        key = (model_choice, engine, bundle.get("version"), ph, tds)
+
+        with self._lock:
+            result = self._entries.get(key)
+            if result is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return result
+            self.misses += 1
+
+        result = predict_quality(ph, tds, model_choice, bundle, engine)
+
+        with self._lock:
+            self._entries[key] = result
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return result
+
+    def clear(self):
+        """Drop every cached prediction (counters are kept)."""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Hit/miss/eviction counters and current size."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+
+# ── Offline scoring CLI ──
+
+_WORKER_BUNDLE = None
+
+
+def _init_worker(model_path):
+    """Process-pool initializer: load the bundle once per worker."""
+    global _WORKER_BUNDLE
+    _WORKER_BUNDLE = load_bundle(model_path)
+
+
+def score_chunk(chunk, model_choice, bundle=None, engine="sklearn"):
+    """
+    Impute and score one DataFrame chunk.
+
+    Feature columns are coerced to numeric and filled with the bundle's
+    training-time imputer, then scored with predict_batch. Returns the
+    chunk with Prediction (1 = safe) and Probability (safe class) appended.
+    """
+    import pandas as pd
+
+    bundle = bundle if bundle is not None else _WORKER_BUNDLE
+    features = bundle["features"]
+    X = chunk[features].apply(pd.to_numeric, errors="coerce")
+    if "imputer" in bundle:
+        X = bundle["imputer"].transform(X)
+    predictions, probabilities = predict_batch(X, model_choice, bundle, engine)
+    return chunk.assign(Prediction=predictions, Probability=probabilities)
+
+
+class _ChunkWriter:
+    """
+    Append scored chunks to a CSV or Parquet file, in order.
+
+    Chunks of one CSV can infer different types for the same column (all
+    missing, then text; integers, then floats), while a Parquet file has a
+    single schema. The schema is therefore fixed from the first chunk with
+    every column widened: integers to float64 (except Prediction), and text
+    or all-missing columns to string. Later chunks are cast to it; a value
+    that still does not fit raises ValueError naming the column.
+    """
+
+    def __init__(self, output_path):
+        self.output_path = output_path
+        self.parquet = output_path.endswith((".parquet", ".pq"))
+        self._writer = None
+        self._first = True
+        self._rows = 0
+
+    @staticmethod
+    def _schema(table):
+        import pyarrow as pa
+
+        fields = []
+        for field in table.schema:
+            column = table.column(field.name)
+            if field.name == "Prediction":
+                kind = pa.int64()
+            elif column.null_count == len(column) or pa.types.is_string(field.type) \
+                    or pa.types.is_large_string(field.type):
+                kind = pa.string()
+            elif pa.types.is_integer(field.type):
+                kind = pa.float64()
+            else:
+                kind = field.type
+            fields.append(pa.field(field.name, kind))
+        return pa.schema(fields)
+
+    def _cast(self, table):
+        import pyarrow as pa
+
+        schema = self._writer.schema
+        if table.schema.names != schema.names:
+            raise ValueError(f"Rows from {self._rows}: columns {table.schema.names} differ from {schema.names}")
+        columns = []
+        for field in schema:
+            try:
+                columns.append(table.column(field.name).cast(field.type))
+            except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+                raise ValueError(
+                    f"Column '{field.name}' in rows {self._rows}–{self._rows + len(table) - 1} "
+                    f"cannot be written as {field.type} ({e})"
+                ) from e
+        return pa.Table.from_arrays(columns, schema=schema)
+
+    def write(self, chunk):
+        if self.parquet:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            if self._writer is None:
+                self._writer = pq.ParquetWriter(self.output_path, self._schema(table))
+            self._writer.write_table(self._cast(table))
+        else:
+            chunk.to_csv(self.output_path, mode="w" if self._first else "a", header=self._first, index=False)
+        self._first = False
+        self._rows += len(chunk)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+
+    def abort(self):
+        """Close and delete a partially written output."""
+        self.close()
+        if not self._first and os.path.exists(self.output_path):
+            os.remove(self.output_path)
+
+
+def score_csv(input_path, output_path, model_choice="Random Forest", model_path="water_model.pkl",
+              chunksize=100_000, workers=0, engine="sklearn"):
+    """
+    Stream a CSV through the model and write predictions incrementally.
+
+    The input is read `chunksize` rows at a time. With `workers` > 0 chunks
+    are scored in a process pool whose workers each load the bundle once;
+    at most two chunks per worker are in flight and results are written in
+    input order, so memory stays flat regardless of input size. A run that
+    fails deletes its partial output.
+
+    Returns: number of rows scored
+    """
+    import pandas as pd
+
+    reader = pd.read_csv(input_path, chunksize=chunksize)
+    writer = _ChunkWriter(output_path)
+    rows = 0
+    try:
+        if workers > 0:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(model_path,)) as pool:
+                pending = deque()
+                for chunk in reader:
+                    pending.append(pool.submit(score_chunk, chunk, model_choice, None, engine))
+                    if len(pending) >= 2 * workers:
+                        scored = pending.popleft().result()
+                        writer.write(scored)
+                        rows += len(scored)
+                while pending:
+                    scored = pending.popleft().result()
+                    writer.write(scored)
+                    rows += len(scored)
+        else:
+            bundle = load_bundle(model_path)
+            for chunk in reader:
+                scored = score_chunk(chunk, model_choice, bundle, engine)
+                writer.write(scored)
+                rows += len(scored)
+    except BaseException:
+        writer.abort()
+        raise
+    writer.close()
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Score a CSV of pH/TDS readings offline.")
+    parser.add_argument("input", help="Input CSV with the bundle's feature columns")
+    parser.add_argument("output", help="Output path (.csv, or .parquet which requires pyarrow)")
+    parser.add_argument("--model", default="Random Forest", choices=["Random Forest", "SVM", "Consensus"])
+    parser.add_argument("--engine", default="sklearn", choices=["sklearn", "compiled", "lookup"])
+    parser.add_argument("--model-path", default="water_model.pkl", help="Bundle .pkl file or bundle directory")
+    parser.add_argument("--chunksize", type=int, default=100_000)
+    parser.add_argument("--workers", type=int, default=0, help="Process-pool size (0 = score in-process)")
+    args = parser.parse_args()
+
+    n_rows = score_csv(args.input, args.output, args.model, args.model_path,
+                       args.chunksize, args.workers, args.engine)
+    print(f"✅ Scored {n_rows} rows → {args.output}")
@@ -0,0 +1,264 @@
+"""
+serve.py — Headless asyncio inference service with micro-batching.
+Loads the model bundle once and scores concurrent HTTP requests in batches.
+
+    python -m src.serve
+
+Endpoints:
+    POST /predict   {"model": "SVM", "readings": [{"pH": 7.1, "TDS": 320}, ...]}
+                    or a single reading {"pH": 7.1, "TDS": 320}
+    GET  /metrics   latency and batch-size histograms, latest input drift report (JSON)
+    GET  /metrics/prometheus
+                    the same plus src.instrumentation's registry, as Prometheus text
+    GET  /health    liveness probe
+"""
+
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from src.data_preprocessing import load_params
+from src.drift import monitor_from_bundle
+from src.instrumentation import REGISTRY, Histogram, configure, prometheus_text
+from src.predict import load_bundle, predict_batch, resolve_bundle_path
+
+MODEL_CHOICES = ("Random Forest", "SVM", "Consensus")
+
+
+class MicroBatcher:
+    """
+    Gather concurrent scoring requests into micro-batches.
+
+    A batch is closed when it holds `max_batch_size` readings or when
+    `max_wait_ms` has passed since its first request, whichever comes
+    first. Each batch is scored with one predict_batch call per model
+    choice, in an executor so the event loop keeps accepting requests. If
+    that call fails, the batch's requests are scored one by one so the
+    error only reaches the request that caused it.
+    """
+
+    def __init__(self, bundle, max_batch_size=256, max_wait_ms=5.0, engine="sklearn", executor=None):
+        self.bundle = bundle
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.engine = engine
+        self.executor = executor or ThreadPoolExecutor(max_workers=1)
+        self.queue = asyncio.Queue()
+        self.batch_sizes = Histogram([1, 2, 4, 8, 16, 32, 64, 128, 256, 512, 1024])
+        self.batch_latency_ms = Histogram([0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000])
+
+    async def submit(self, X, model_choice):
+        """Queue an (n, 2) array of readings and wait for its predictions."""
+        future = asyncio.get_running_loop().create_future()
+        await self.queue.put((X, model_choice, future))
+        return await future
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            rows = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while rows < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                rows += len(item[0])
+            await self._score(batch, loop)
+
+    async def _score(self, batch, loop):
+        start = time.perf_counter()
+        self.batch_sizes.observe(sum(len(X) for X, _, _ in batch))
+
+        for model_choice in {choice for _, choice, _ in batch}:
+            items = [(X, future) for X, choice, future in batch if choice == model_choice]
+            X_all = np.concatenate([X for X, _ in items])
+            try:
+                predictions, probabilities = await loop.run_in_executor(
+                    self.executor, predict_batch, X_all, model_choice, self.bundle, self.engine
+                )
+            except Exception as e:
+                if len(items) == 1:
+                    if not items[0][1].done():
+                        items[0][1].set_exception(e)
+                else:
+                    # Score the requests one by one so only the bad one fails
+                    for X, future in items:
+                        await self._score_one(X, model_choice, future, loop)
+                continue
+
+            offset = 0
+            for X, future in items:
+                end = offset + len(X)
+                if not future.done():
+                    future.set_result((predictions[offset:end], probabilities[offset:end]))
+                offset = end
+
+        self.batch_latency_ms.observe((time.perf_counter() - start) * 1000)
+
+    async def _score_one(self, X, model_choice, future, loop):
+        try:
+            result = await loop.run_in_executor(
+                self.executor, predict_batch, X, model_choice, self.bundle, self.engine
+            )
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+
+class InferenceService:
+    """Minimal HTTP/1.1 front end over a MicroBatcher."""
+
+    def __init__(self, batcher, drift_params=None):
+        self.batcher = batcher
+        self.features = batcher.bundle.get("features", ["pH", "TDS"])
+        self.drift = monitor_from_bundle(batcher.bundle, drift_params) if drift_params else None
+        self.request_latency_ms = Histogram([0.5, 1, 2, 5, 10, 25, 50, 100, 250, 500, 1000])
+        self.requests = 0
+        self.readings = 0
+
+    def _parse_readings(self, payload):
+        if not isinstance(payload, dict):
+            raise ValueError("Request body must be a JSON object")
+        readings = payload["readings"] if "readings" in payload else [payload]
+        if not isinstance(readings, list) or not all(isinstance(r, dict) for r in readings):
+            raise ValueError("'readings' must be a list of JSON objects")
+        model_choice = payload.get("model", "Random Forest")
+        if model_choice not in MODEL_CHOICES:
+            raise ValueError(f"Unknown model '{model_choice}'")
+        X = np.array([[float(r[f]) for f in self.features] for r in readings], dtype=np.float64)
+        if not np.isfinite(X).all():
+            raise ValueError(f"Readings must be finite numbers ({', '.join(self.features)})")
+        return X.reshape(-1, len(self.features)), model_choice
+
+    async def _predict(self, body):
+        start = time.perf_counter()
+        X, model_choice = self._parse_readings(json.loads(body or b"{}"))
+        if self.drift is not None:
+            self.drift.observe(X)
+        predictions, probabilities = await self.batcher.submit(X, model_choice)
+        self.request_latency_ms.observe((time.perf_counter() - start) * 1000)
+        self.requests += 1
+        self.readings += len(X)
+        return {
+            "model": model_choice,
+            "predictions": predictions.tolist(),
+            "probabilities": probabilities.tolist(),
+        }
+
+    def metrics(self):
+        return {
+            "requests": self.requests,
+            "readings": self.readings,
+            "request_latency_ms": self.request_latency_ms.snapshot(),
+            "batch_latency_ms": self.batcher.batch_latency_ms.snapshot(),
+            "batch_size": self.batcher.batch_sizes.snapshot(),
+            "drift": self.drift.report if self.drift is not None else None,
+        }
+
+    def prometheus(self):
+        """Service histograms and counters merged with the instrumentation registry."""
+        snapshot = REGISTRY.snapshot()
+        snapshot["counters"].update({"service_requests": self.requests, "service_readings": self.readings})
+        snapshot["histograms"].update({
+            "service_request_latency_ms": self.request_latency_ms.snapshot(),
+            "service_batch_latency_ms": self.batcher.batch_latency_ms.snapshot(),
+            "service_batch_size": self.batcher.batch_sizes.snapshot(),
+        })
+        return prometheus_text(snapshot)
+
+    async def _route(self, method, path, body):
+        if method == "POST" and path == "/predict":
+            try:
+                return 200, await self._predict(body)
+            except (KeyError, ValueError, TypeError) as e:
+                return 400, {"error": str(e)}
+        if method == "GET" and path == "/metrics":
+            return 200, self.metrics()
+        if method == "GET" and path == "/metrics/prometheus":
+            return 200, self.prometheus()
+        if method == "GET" and path == "/health":
+            return 200, {"status": "ok"}
+        return 404, {"error": f"No route for {method} {path}"}
+
+    async def handle(self, reader, writer):
+        """Serve one keep-alive connection."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get("content-length", 0)))
+
+                status, payload = await self._route(method, path, body)
+                if isinstance(payload, str):
+                    data, content_type = payload.encode(), "text/plain; version=0.0.4"
+                else:
+                    data, content_type = json.dumps(payload).encode(), "application/json"
+                reason = {200: "OK", 400: "Bad Request", 404: "Not Found"}[status]
+                writer.write(
+                    f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+                    f"Content-Length: {len(data)}\r\n\r\n".encode() + data
+                )
+                await writer.drain()
+                if headers.get("connection", "").lower() == "close":
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+
+async def serve(model_path, host="0.0.0.0", port=8000, max_batch_size=256, max_wait_ms=5.0, engine="sklearn",
+                drift_params=None):
+    """Load the bundle once and serve until cancelled."""
+    batcher = MicroBatcher(load_bundle(model_path), max_batch_size, max_wait_ms, engine)
+    service = InferenceService(batcher, drift_params)
+    batch_task = asyncio.create_task(batcher.run())
+    server = await asyncio.start_server(service.handle, host, port)
+    print(f"✅ Inference service listening on http://{host}:{port} "
+          f"(max batch {max_batch_size}, max wait {max_wait_ms} ms)")
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        batch_task.cancel()
+
+
+if __name__ == "__main__":
+    params = load_params()
+    configure(params)
+    serve_params = params.get("serve", {})
+
+    parser = argparse.ArgumentParser(description="Run the micro-batching inference service.")
+    parser.add_argument("--host", default=serve_params.get("host", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=serve_params.get("port", 8000))
+    parser.add_argument("--max-batch-size", type=int, default=serve_params.get("max_batch_size", 256))
+    parser.add_argument("--max-wait-ms", type=float, default=serve_params.get("max_wait_ms", 5.0))
+    parser.add_argument("--engine", default=serve_params.get("engine", "sklearn"),
+                        choices=["sklearn", "compiled", "lookup"])
+    parser.add_argument("--model-path", default=resolve_bundle_path(params["output"]))
+    args = parser.parse_args()
+
+    asyncio.run(serve(args.model_path, args.host, args.port, args.max_batch_size, args.max_wait_ms, args.engine,
+                      params.get("drift")))
@@ -0,0 +1,93 @@
+"""
+startup_report.py — Headless cold-start and rerun timing for the Streamlit app.
+Measures import cost per dependency, bundle load, first prediction, and
+(when Streamlit is installed) full script runs through streamlit.testing.
+
+    python -m src.startup_report
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+from src.data_preprocessing import load_params
+from src.predict import load_bundle, predict_quality, resolve_bundle_path
+
+PROJECT_ROOT = os.path.join(os.path.dirname(__file__), "..")
+IMPORTS = ["numpy", "pandas", "streamlit", "altair", "twilio.rest", "sklearn", "src.predict"]
+
+
+def time_import(module):
+    """Cold import time of `module` in ms, in a fresh interpreter (None if missing)."""
+    code = (
+        "import time; t = time.perf_counter(); "
+        f"import {module}; print((time.perf_counter() - t) * 1000)"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", code], cwd=PROJECT_ROOT, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        return None
+    return round(float(result.stdout.strip().splitlines()[-1]), 1)
+
+
+def time_app_runs(reruns=5, timeout=60):
+    """Time the first script run and subsequent reruns of app/main.py headlessly."""
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return {"skipped": "streamlit not installed"}
+
+    app = AppTest.from_file(os.path.abspath(os.path.join(PROJECT_ROOT, "app", "main.py")), default_timeout=timeout)
+    start = time.perf_counter()
+    app.run()
+    first_run_ms = (time.perf_counter() - start) * 1000
+
+    rerun_ms = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        app.run()
+        rerun_ms.append((time.perf_counter() - start) * 1000)
+
+    return {
+        "first_run_ms": round(first_run_ms, 1),
+        "rerun_ms": [round(t, 1) for t in rerun_ms],
+        "exceptions": [str(e.value) for e in app.exception],
+    }
+
+
+def startup_report(model_path, reruns=5):
+    """Collect the timing report as a dict."""
+    report = {"imports_ms": {module: time_import(module) for module in IMPORTS}}
+
+    start = time.perf_counter()
+    bundle = load_bundle(model_path)
+    report["bundle_load_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    report["first_prediction_ms"] = {}
+    for model_choice in ["Random Forest", "SVM"]:
+        start = time.perf_counter()
+        predict_quality(7.0, 500, model_choice, bundle)
+        report["first_prediction_ms"][model_choice] = round((time.perf_counter() - start) * 1000, 1)
+
+    report["app"] = time_app_runs(reruns)
+    return report
+
+
+if __name__ == "__main__":
+    params = load_params()
+    parser = argparse.ArgumentParser(description="Report app cold-start and rerun latency.")
+    parser.add_argument("--model-path", default=resolve_bundle_path(params["output"]))
+    parser.add_argument("--reruns", type=int, default=5)
+    parser.add_argument("--output", default="reports/startup_report.json")
+    args = parser.parse_args()
+
+    report = startup_report(args.model_path, args.reruns)
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(json.dumps(report, indent=2))
+    print(f"\n✅ Startup report saved to {args.output}")
@@ -0,0 +1,365 @@
+"""
+store.py — Persistent, append-only store of monitoring readings and alerts.
+Local SQLite indexed by (station, time). Readings are buffered and written in
+batches; per-minute and per-hour rollups are updated in the same transaction,
+so history views and audits read summaries instead of raw rows:
+
+    python -m src.store --station 1393 --since 2026-10-17T00:00 --resolution hour
+"""
+
+import argparse
+import os
+import sqlite3
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.data_preprocessing import load_params
+
+RESOLUTIONS = {"minute": 60_000, "hour": 3_600_000}
+READING_COLUMNS = ["ts", "station", "ph", "tds", "prediction", "probability", "model"]
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS readings (
+    ts INTEGER NOT NULL,            -- epoch milliseconds (UTC)
+    station TEXT NOT NULL,
+    ph REAL,
+    tds REAL,
+    prediction INTEGER,
+    probability REAL,
+    model TEXT
+);
+CREATE INDEX IF NOT EXISTS readings_station_ts ON readings (station, ts);
+CREATE INDEX IF NOT EXISTS readings_ts ON readings (ts);
+
+CREATE TABLE IF NOT EXISTS alerts (
+    ts INTEGER NOT NULL,
+    station TEXT NOT NULL,
+    model TEXT,
+    outcome TEXT,                   -- queued / suppressed / dropped
+    message TEXT
+);
+CREATE INDEX IF NOT EXISTS alerts_station_ts ON alerts (station, ts);
+CREATE INDEX IF NOT EXISTS alerts_ts ON alerts (ts);
+
+CREATE TABLE IF NOT EXISTS rollups (
+    resolution TEXT NOT NULL,       -- minute / hour
+    station TEXT NOT NULL,
+    start INTEGER NOT NULL,         -- bucket start, epoch milliseconds
+    n INTEGER NOT NULL,
+    unsafe INTEGER NOT NULL,
+    ph_sum REAL, ph_min REAL, ph_max REAL,
+    tds_sum REAL, tds_min REAL, tds_max REAL,
+    probability_sum REAL,
+    ph_n INTEGER NOT NULL DEFAULT 0,           -- non-missing values behind each sum
+    tds_n INTEGER NOT NULL DEFAULT 0,
+    probability_n INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (resolution, station, start)
+) WITHOUT ROWID;
+"""
+
+ROLLUP_COLUMNS = ["resolution", "station", "start", "n", "unsafe", "ph_sum", "ph_min", "ph_max",
+                  "tds_sum", "tds_min", "tds_max", "probability_sum", "ph_n", "tds_n", "probability_n"]
+
+# Merges a batch's partial aggregates into existing buckets (SQLite >= 3.24).
+# Multi-argument min()/max() return NULL if any argument is NULL, hence the coalesce.
+UPSERT_ROLLUP = f"""
+INSERT INTO rollups ({", ".join(ROLLUP_COLUMNS)}) VALUES ({", ".join("?" * len(ROLLUP_COLUMNS))})
+ON CONFLICT (resolution, station, start) DO UPDATE SET
+    n = n + excluded.n,
+    unsafe = unsafe + excluded.unsafe,
+    ph_sum = ph_sum + excluded.ph_sum,
+    ph_min = min(coalesce(ph_min, excluded.ph_min), coalesce(excluded.ph_min, ph_min)),
+    ph_max = max(coalesce(ph_max, excluded.ph_max), coalesce(excluded.ph_max, ph_max)),
+    tds_sum = tds_sum + excluded.tds_sum,
+    tds_min = min(coalesce(tds_min, excluded.tds_min), coalesce(excluded.tds_min, tds_min)),
+    tds_max = max(coalesce(tds_max, excluded.tds_max), coalesce(excluded.tds_max, tds_max)),
+    probability_sum = probability_sum + excluded.probability_sum,
+    ph_n = ph_n + excluded.ph_n,
+    tds_n = tds_n + excluded.tds_n,
+    probability_n = probability_n + excluded.probability_n
+"""
+
+# Rollups written before the per-column counts existed assumed no missing values
+MIGRATIONS = [
+    ("ph_n", "ALTER TABLE rollups ADD COLUMN ph_n INTEGER NOT NULL DEFAULT 0; UPDATE rollups SET ph_n = n;"),
+    ("tds_n", "ALTER TABLE rollups ADD COLUMN tds_n INTEGER NOT NULL DEFAULT 0; UPDATE rollups SET tds_n = n;"),
+    ("probability_n", "ALTER TABLE rollups ADD COLUMN probability_n INTEGER NOT NULL DEFAULT 0; "
+                      "UPDATE rollups SET probability_n = n;"),
+]
+
+
+def to_epoch_ms(value):
+    """Epoch milliseconds (UTC) of a timestamp-like value; None passes through."""
+    if value is None:
+        return None
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    return int(pd.Timestamp(value).value // 1_000_000)
+
+
+class ReadingStore:
+    """
+    Append-only SQLite store of readings, predictions and alerts.
+
+    add_readings() and add_alerts() only buffer rows in memory. The buffer
+    is written in one transaction once it holds `batch_size` rows or
+    `flush_seconds` have passed since the last write, and on flush()/close().
+    Each write also folds the batch, grouped by station and bucket, into the
+    minute and hour rollups. After start(), writes run on a background
+    thread, so the caller never waits on SQLite. Thread-safe, so one store
+    can be shared by every app session.
+
+    Retention: raw readings, alerts and minute rollups older than
+    `retention_days`, and hour rollups older than `rollup_retention_days`,
+    are deleted by prune(), which the writer thread runs every
+    `prune_seconds`. None keeps the data forever.
+    """
+
+    def __init__(self, path, batch_size=5000, flush_seconds=5.0, retention_days=None,
+                 rollup_retention_days=None, prune_seconds=3600.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.retention_days = retention_days
+        self.rollup_retention_days = rollup_retention_days
+        self.prune_seconds = prune_seconds
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(rollups)")}
+        for column, script in MIGRATIONS:
+            if column not in columns:
+                self._conn.executescript(script)
+        self._lock = threading.Lock()        # buffers
+        self._db_lock = threading.Lock()     # connection
+        self._due = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._chunks = []
+        self._pending = 0
+        self._alerts = []
+        self._last_flush = time.monotonic()
+        self._last_prune = float("-inf")
+        self.written = 0
+
+    def add_readings(self, ts, stations, ph, tds, prediction, probability, model):
+        """Buffer one reading per station, all taken at `ts` (columnar, no per-row work)."""
+        n = len(stations)
+        chunk = {
+            "ts": np.full(n, to_epoch_ms(ts), dtype=np.int64),
+            "station": np.asarray(stations, dtype=object),
+            "ph": np.asarray(ph, dtype=np.float64),
+            "tds": np.asarray(tds, dtype=np.float64),
+            "prediction": np.asarray(prediction, dtype=np.int64),
+            "probability": np.asarray(probability, dtype=np.float64),
+            "model": np.full(n, model, dtype=object),
+        }
+        with self._lock:
+            self._chunks.append(chunk)
+            self._pending += n
+            due = (self._pending >= self.batch_size
+                   or time.monotonic() - self._last_flush >= self.flush_seconds)
+        if due:
+            if self._thread is not None:
+                self._due.set()
+            else:
+                self.flush()
+
+    def add_alerts(self, ts, stations, outcomes, messages, model):
+        """Buffer alert outcomes (written with the next batch of readings)."""
+        ts = to_epoch_ms(ts)
+        with self._lock:
+            self._alerts.extend((ts, s, model, o, m) for s, o, m in zip(stations, outcomes, messages))
+
+    @staticmethod
+    def _rollup_rows(frame):
+        """Per-(station, bucket) partial aggregates of a batch, for UPSERT_ROLLUP."""
+        frame = frame.assign(unsafe=(frame["prediction"] == 0).astype(np.int64))
+        rows = []
+        for resolution, width in RESOLUTIONS.items():
+            grouped = frame.assign(start=frame["ts"] // width * width).groupby(["station", "start"], sort=False)
+            sums = grouped[["unsafe", "ph", "tds", "probability"]].sum()
+            counts = grouped[["ph", "tds", "probability"]].count()
+            mins = grouped[["ph", "tds"]].min()
+            maxs = grouped[["ph", "tds"]].max()
+            rows += zip(
+                [resolution] * len(sums), sums.index.get_level_values(0).tolist(),
+                sums.index.get_level_values(1).tolist(), grouped.size().tolist(), sums["unsafe"].tolist(),
+                sums["ph"].tolist(), mins["ph"].tolist(), maxs["ph"].tolist(),
+                sums["tds"].tolist(), mins["tds"].tolist(), maxs["tds"].tolist(), sums["probability"].tolist(),
+                counts["ph"].tolist(), counts["tds"].tolist(), counts["probability"].tolist(),
+            )
+        return rows
+
+    def start(self):
+        """Write batches on a background thread from now on."""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="store-writer", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        while not self._stopping:
+            self._due.wait(self.flush_seconds)
+            self._due.clear()
+            self.flush()
+            if time.monotonic() - self._last_prune >= self.prune_seconds:
+                self.prune()
+
+    def flush(self):
+        """Write buffered rows and update the rollups in one transaction."""
+        with self._lock:
+            chunks, self._chunks, self._pending = self._chunks, [], 0
+            alerts, self._alerts = self._alerts, []
+            self._last_flush = time.monotonic()
+        if not chunks and not alerts:
+            return 0
+        frame = pd.DataFrame({
+            column: np.concatenate([chunk[column] for chunk in chunks]) if chunks else []
+            for column in READING_COLUMNS
+        })
+        rollups = self._rollup_rows(frame) if len(frame) else []
+        with self._db_lock, self._conn:
+            self._conn.executemany(
+                "INSERT INTO readings VALUES (?, ?, ?, ?, ?, ?, ?)",
+                zip(*(frame[column].tolist() for column in READING_COLUMNS)),
+            )
+            self._conn.executemany(UPSERT_ROLLUP, rollups)
+            self._conn.executemany("INSERT INTO alerts VALUES (?, ?, ?, ?, ?)", alerts)
+        self.written += len(frame)
+        return len(frame)
+
+    def prune(self, now=None):
+        """
+        Delete rows older than the retention settings.
+
+        Returns: {"readings": n, "alerts": n, "rollups": n} rows deleted
+        """
+        self._last_prune = time.monotonic()
+        now = to_epoch_ms(np.datetime64("now", "ms") if now is None else now)
+        deleted = {"readings": 0, "alerts": 0, "rollups": 0}
+        day = 86_400_000
+        with self._db_lock, self._conn:
+            if self.retention_days is not None:
+                cutoff = now - int(self.retention_days * day)
+                deleted["readings"] = self._conn.execute("DELETE FROM readings WHERE ts < ?", (cutoff,)).rowcount
+                deleted["alerts"] = self._conn.execute("DELETE FROM alerts WHERE ts < ?", (cutoff,)).rowcount
+                deleted["rollups"] += self._conn.execute(
+                    "DELETE FROM rollups WHERE resolution = 'minute' AND start < ?", (cutoff,)).rowcount
+            if self.rollup_retention_days is not None:
+                cutoff = now - int(self.rollup_retention_days * day)
+                deleted["rollups"] += self._conn.execute(
+                    "DELETE FROM rollups WHERE resolution = 'hour' AND start < ?", (cutoff,)).rowcount
+        return deleted
+
+    def close(self):
+        """Stop the writer thread, write what is buffered, and close the database."""
+        if self._thread is not None:
+            self._stopping = True
+            self._due.set()
+            self._thread.join()
+            self._thread = None
+        self.flush()
+        self._conn.close()
+
+    def _query(self, sql, time_column, start, end, station, conditions=()):
+        """Run `sql` filtered by station and a [start, end) range on `time_column`."""
+        conditions = list(conditions)
+        for clause, value in (("station = ?", station), (f"{time_column} >= ?", to_epoch_ms(start)),
+                              (f"{time_column} < ?", to_epoch_ms(end))):
+            if value is not None:
+                conditions.append((clause, value))
+        if conditions:
+            sql += " WHERE " + " AND ".join(clause for clause, _ in conditions)
+        with self._db_lock:
+            return pd.read_sql_query(sql, self._conn, params=[value for _, value in conditions])
+
+    def readings(self, start=None, end=None, station=None):
+        """Raw readings with start <= ts < end (optionally one station), oldest first."""
+        frame = self._query("SELECT * FROM readings", "ts", start, end, station)
+        frame = frame.sort_values(["ts", "station"], kind="stable", ignore_index=True)
+        frame["ts"] = pd.to_datetime(frame["ts"], unit="ms")
+        return frame
+
+    def alerts(self, start=None, end=None, station=None):
+        """Alert outcomes with start <= ts < end (optionally one station)."""
+        frame = self._query("SELECT * FROM alerts", "ts", start, end, station)
+        frame = frame.sort_values("ts", kind="stable", ignore_index=True)
+        frame["ts"] = pd.to_datetime(frame["ts"], unit="ms")
+        return frame
+
+    def rollup(self, resolution="minute", start=None, end=None, station=None):
+        """
+        Per-bucket summaries from the rollup table: readings, unsafe share,
+        mean/min/max pH and TDS, and mean safe-class probability. Means and
+        extremes skip missing values (NULL when a bucket has none). Buckets
+        are selected by their start time.
+        """
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"resolution must be one of {list(RESOLUTIONS)}")
+        # Means divide by the non-missing count; SQLite returns NULL for a zero divisor
+        sql = ("SELECT station, start, n, unsafe, ph_sum / ph_n AS ph_mean, ph_min, ph_max, "
+               "tds_sum / tds_n AS tds_mean, tds_min, tds_max, "
+               "probability_sum / probability_n AS probability_mean FROM rollups")
+        frame = self._query(sql, "start", start, end, station, [("resolution = ?", resolution)])
+        frame = frame.sort_values(["start", "station"], kind="stable", ignore_index=True)
+        frame["unsafe_share"] = frame["unsafe"] / frame["n"]
+        frame["start"] = pd.to_datetime(frame["start"], unit="ms")
+        return frame
+
+    def stats(self):
+        with self._db_lock:
+            total = self._conn.execute("SELECT count(*) FROM readings").fetchone()[0]
+        pending = self._pending
+        return {"rows": total, "pending": pending, "written": self.written}
+
+
+def open_store(params):
+    """ReadingStore configured from params["store"] (None if disabled)."""
+    store_params = params.get("store", {})
+    if not store_params.get("enabled"):
+        return None
+    return ReadingStore(
+        store_params["path"], store_params["batch_size"], store_params["flush_seconds"],
+        store_params.get("retention_days"), store_params.get("rollup_retention_days"),
+    ).start()
+
+
+if __name__ == "__main__":
+    params = load_params()
+    parser = argparse.ArgumentParser(description="Query stored monitoring history.")
+    parser.add_argument("--station", help="Station code (default: all stations)")
+    parser.add_argument("--since", help="Start time, e.g. 2026-10-17T08:00 (UTC)")
+    parser.add_argument("--until", help="End time (exclusive, UTC)")
+    parser.add_argument("--resolution", default="hour", choices=[*RESOLUTIONS, "raw", "alerts"])
+    parser.add_argument("--output", help="Write the result to this CSV instead of printing it")
+    parser.add_argument("--prune", action="store_true",
+                        help="Delete rows older than store.retention_days / rollup_retention_days first")
+    args = parser.parse_args()
+
+    if not os.path.exists(params["store"]["path"]):
+        print(f"❌ No monitoring history at {params['store']['path']} (run the app or src.monitor --store first)")
+        raise SystemExit(1)
+    store = ReadingStore(params["store"]["path"], retention_days=params["store"].get("retention_days"),
+                         rollup_retention_days=params["store"].get("rollup_retention_days"))
+    if args.prune:
+        deleted = store.prune()
+        print(f"✅ Pruned {deleted['readings']} readings, {deleted['alerts']} alerts, {deleted['rollups']} rollups")
+    if args.resolution == "raw":
+        result = store.readings(args.since, args.until, args.station)
+    elif args.resolution == "alerts":
+        result = store.alerts(args.since, args.until, args.station)
+    else:
+        result = store.rollup(args.resolution, args.since, args.until, args.station)
+    store.close()
+
+    if args.output:
+        result.to_csv(args.output, index=False)
+        print(f"✅ {len(result)} rows saved to {args.output}")
+    else:
+        print(result.to_string(index=False))
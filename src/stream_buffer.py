@@ -0,0 +1,66 @@
+"""
+stream_buffer.py — Fixed-capacity ring buffer for the real-time sensor stream.
+Replaces per-tick DataFrame concatenation in the simulation loop.
+"""
+
+import numpy as np
+
+READING_DTYPE = np.dtype([
+    ("timestamp", "datetime64[ms]"),
+    ("pH", np.float64),
+    ("TDS", np.float64),
+    ("prediction", np.int8),
+    ("probability", np.float64),
+])
+
+
+class RingBuffer:
+    """
+    Preallocated ring buffer of (timestamp, pH, TDS, prediction, probability).
+
+    Storage is mirrored: every record is written at slot i and i + capacity,
+    so the last `len(self)` records are always one contiguous slice. append()
+    is O(1) and view() returns that slice without copying, oldest first.
+    """
+
+    def __init__(self, capacity=50):
+        if capacity < 1:
+            raise ValueError("capacity must be at least 1")
+        self.capacity = capacity
+        self._data = np.zeros(2 * capacity, dtype=READING_DTYPE)
+        self._start = 0
+        self._size = 0
+        self.appended = 0
+
+    def __len__(self):
+        return self._size
+
+    def append(self, timestamp, ph, tds, prediction=-1, probability=np.nan):
+        """Add one reading, overwriting the oldest once the buffer is full."""
+        slot = (self._start + self._size) % self.capacity
+        record = (np.datetime64(timestamp, "ms"), ph, tds, prediction, probability)
+        self._data[slot] = record
+        self._data[slot + self.capacity] = record
+        if self._size < self.capacity:
+            self._size += 1
+        else:
+            self._start = (self._start + 1) % self.capacity
+        self.appended += 1
+
+    def view(self):
+        """Zero-copy structured-array view of the buffered readings, oldest first."""
+        return self._data[self._start:self._start + self._size]
+
+    def steps(self):
+        """Running tick numbers of the buffered readings (for chart x-axes)."""
+        return np.arange(self.appended - self._size, self.appended)
+
+    def resized(self, capacity):
+        """Return a new buffer of `capacity` holding the most recent readings."""
+        buffer = RingBuffer(capacity)
+        tail = self.view()[-capacity:]
+        buffer._data[:len(tail)] = tail
+        buffer._data[capacity:capacity + len(tail)] = tail
+        buffer._size = len(tail)
+        buffer.appended = self.appended
+        return buffer
@@ -3,16 +3,26 @@ train.py — Train RF and SVM models with MLflow experiment tracking.
 Reads hyperparameters from params.yaml, saves model bundle to water_model.pkl.
 """
 
+import copy
 import json
 import os
 import pickle
+import time
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 import yaml
 from sklearn.ensemble import RandomForestClassifier
+from sklearn.kernel_approximation import Nystroem
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline
 from sklearn.svm import SVC
 
-from src.data_preprocessing import load_params, load_data, preprocess, split_data, fit_scaler
+from src.bundle_store import prune_versions, save_bundle_dir
+from src.data_preprocessing import load_params, load_splits, fit_scaler
+from src.drift import build_reference
+from src.instrumentation import configure, export, profiled, timed
+from src.predict import predict_batch
 
 # ── Try to import MLflow (optional dependency) ──
 try:
@@ -24,41 +34,309 @@ except ImportError:
     print("⚠️  MLflow not installed. Training will proceed without experiment tracking.")
 
 
+def flatten_forest(rf_model):
+    """
+    Export a fitted RandomForestClassifier as contiguous node arrays.
+
+    All trees are concatenated into one node table; `roots` holds the index
+    of each tree's root and `children[i]` the (left, right) node indices.
+    Leaves point back at themselves with an infinite threshold, so a walk
+    that overshoots a leaf stays on it. `missing_left` is sklearn's
+    per-node routing of missing (NaN) values. `value` holds per-node class
+    probabilities (rows sum to 1), matching each tree's predict_proba.
+    """
+    trees = [est.tree_ for est in rf_model.estimators_]
+    sizes = np.array([t.node_count for t in trees])
+    roots = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    feature, threshold, children, leaf, missing_left, value = [], [], [], [], [], []
+    for tree, offset in zip(trees, roots):
+        is_leaf = tree.children_left == -1
+        own_index = np.arange(tree.node_count) + offset
+        feature.append(np.where(is_leaf, 0, tree.feature))
+        threshold.append(np.where(is_leaf, np.inf, tree.threshold))
+        children.append(np.column_stack([
+            np.where(is_leaf, own_index, tree.children_left + offset),
+            np.where(is_leaf, own_index, tree.children_right + offset),
+        ]))
+        leaf.append(is_leaf)
+        missing_left.append(~is_leaf & (np.asarray(tree.missing_go_to_left) != 0))
+        node_value = tree.value[:, 0, :]
+        value.append(node_value / node_value.sum(axis=1, keepdims=True))
+
+    return {
+        "feature": np.ascontiguousarray(np.concatenate(feature), dtype=np.intp),
+        "threshold": np.ascontiguousarray(np.concatenate(threshold), dtype=np.float64),
+        "children": np.ascontiguousarray(np.concatenate(children), dtype=np.intp),
+        "leaf": np.concatenate(leaf),
+        "missing_left": np.concatenate(missing_left),
+        "value": np.ascontiguousarray(np.concatenate(value), dtype=np.float64),
+        "roots": roots.astype(np.intp),
+        "max_depth": int(max(t.max_depth for t in trees)),
+        "classes": np.asarray(rf_model.classes_),
+    }
+
+
+def _cell_index(axis, values):
+    """Index of the grid cell [axis[i], axis[i + 1]) holding each value (may be out of range)."""
+    return np.searchsorted(axis, values, side="right") - 1
+
+
+def split_cells(flat, ph_axis, log_tds_axis):
+    """
+    Cells of the pH × log1p(TDS) grid that contain a split of the forest.
+
+    Inside a cell with no split every tree is constant, so the bilinear
+    estimate is exact there; a split anywhere inside a cell (not just near
+    its centre) makes the forest jump. Each internal node's region is
+    tracked from the root down, and its split is marked only along the part
+    of the threshold line that lies inside that region. Thresholds within a
+    float32 rounding step of a grid line mark the cells on both sides.
+    """
+    n_nodes = len(flat["threshold"])
+    lo = np.full((n_nodes, 2), -np.inf)
+    hi = np.full((n_nodes, 2), np.inf)
+    frontier = flat["roots"]
+    for _ in range(flat["max_depth"]):
+        frontier = frontier[~flat["leaf"][frontier]]
+        if not frontier.size:
+            break
+        feature, threshold = flat["feature"][frontier], flat["threshold"][frontier]
+        left, right = flat["children"][frontier, 0], flat["children"][frontier, 1]
+        lo[left], hi[left] = lo[frontier], hi[frontier]
+        lo[right], hi[right] = lo[frontier], hi[frontier]
+        hi[left, feature] = threshold
+        lo[right, feature] = threshold
+        frontier = np.concatenate([left, right])
+
+    def to_axis(values, feature):
+        return values if feature == 0 else np.log1p(np.maximum(values, 0.0))
+
+    axes = (ph_axis, log_tds_axis)
+    shape = (len(ph_axis) - 1, len(log_tds_axis) - 1)
+    # Difference arrays: +1 where a marked run starts, -1 just past its end;
+    # pH splits run along the TDS axis and TDS splits along the pH axis
+    marks = [np.zeros((shape[0], shape[1] + 1), dtype=np.int64), np.zeros((shape[0] + 1, shape[1]), dtype=np.int64)]
+    internal = np.flatnonzero(~flat["leaf"])
+    for feature in (0, 1):
+        nodes = internal[flat["feature"][internal] == feature]
+        other = 1 - feature
+        threshold = flat["threshold"][nodes]
+        eps = np.abs(threshold) * 1e-6 + 1e-9
+        # Cell range covered along the other axis, clipped to the grid
+        start = np.clip(_cell_index(axes[other], to_axis(lo[nodes, other], other)), 0, shape[other] - 1)
+        stop = np.clip(_cell_index(axes[other], to_axis(hi[nodes, other], other)), 0, shape[other] - 1) + 1
+        for offset in (-eps, eps):
+            cell = _cell_index(axes[feature], to_axis(threshold + offset, feature))
+            inside = (cell >= 0) & (cell < shape[feature])
+            at, begin, end = cell[inside], start[inside], stop[inside]
+            if feature == 0:
+                np.add.at(marks[0], (at, begin), 1)
+                np.add.at(marks[0], (at, end), -1)
+            else:
+                np.add.at(marks[1], (begin, at), 1)
+                np.add.at(marks[1], (end, at), -1)
+    return (np.cumsum(marks[0], axis=1)[:, :-1] > 0) | (np.cumsum(marks[1], axis=0)[:-1] > 0)
+
+
+def build_lookup_surface(bundle, lookup_params, model_choices=("Random Forest", "SVM")):
+    """
+    Precompute each model's safe-class probability on a pH × TDS grid.
+
+    The pH axis is linear over 0-14; the TDS axis is uniform in log1p(TDS)
+    up to `tds_max`, so low concentrations get the finest resolution. Every
+    cell is also evaluated on a `subgrid` × `subgrid` set of interior points
+    and compared with the bilinear estimate there; cells whose deviation
+    exceeds `max_deviation` are flagged so inference falls back to the real
+    model. Cells whose corners and interior points disagree on the label
+    (the decision boundary crosses the sampled points) are flagged too. For
+    the Random Forest, every cell that contains a split is flagged as well
+    (see split_cells), so the unflagged cells are exact. For the SVM the
+    sampling bounds the error but is no guarantee: a boundary that enters
+    and leaves a cell between sample points goes unnoticed.
+    Surfaces of models not in `model_choices` are carried over from
+    bundle["lookup"] unchanged.
+    """
+    ph_axis = np.linspace(0.0, 14.0, lookup_params["ph_points"])
+    tds_axis = np.linspace(0.0, np.log1p(lookup_params["tds_max"]), lookup_params["tds_points"])
+    steps = lookup_params.get("subgrid", 2)
+    fractions = (np.arange(steps) + 0.5) / steps
+
+    def evaluate(model_choice, ph_values, log_tds_values):
+        ph_grid, log_tds_grid = np.meshgrid(ph_values, log_tds_values, indexing="ij")
+        X = np.column_stack([ph_grid.ravel(), np.expm1(log_tds_grid.ravel())])
+        _, probabilities = predict_batch(X, model_choice, bundle)
+        return probabilities.reshape(ph_grid.shape)
+
+    models = dict(bundle["lookup"]["models"]) if "lookup" in bundle else {}
+    for model_choice in model_choices:
+        grid = evaluate(model_choice, ph_axis, tds_axis)
+        deviation = np.zeros((len(ph_axis) - 1, len(tds_axis) - 1))
+        corners = np.stack([grid[:-1, :-1], grid[1:, :-1], grid[:-1, 1:], grid[1:, 1:]])
+        low, high = corners.min(axis=0), corners.max(axis=0)
+        for fx in fractions:
+            for fy in fractions:
+                exact = evaluate(model_choice, ph_axis[:-1] + fx * np.diff(ph_axis),
+                                 tds_axis[:-1] + fy * np.diff(tds_axis))
+                bilinear = ((1 - fx) * (1 - fy) * grid[:-1, :-1] + fx * (1 - fy) * grid[1:, :-1]
+                            + (1 - fx) * fy * grid[:-1, 1:] + fx * fy * grid[1:, 1:])
+                deviation = np.maximum(deviation, np.abs(exact - bilinear))
+                low, high = np.minimum(low, exact), np.maximum(high, exact)
+        # The label is "safe" above 0.5 (argmax of predict_proba)
+        fallback = (deviation > lookup_params["max_deviation"]) | ((low <= 0.5) & (high > 0.5))
+        if model_choice == "Random Forest" and "rf_flat" in bundle:
+            fallback |= split_cells(bundle["rf_flat"], ph_axis, tds_axis)
+        models[model_choice] = {
+            "grid": grid,
+            "deviation": deviation.astype(np.float32),
+            "fallback": fallback,
+            "max_deviation": float(deviation.max()),
+        }
+        print(
+            f"✅ {model_choice} lookup surface: max deviation {deviation.max():.4f}, "
+            f"{fallback.mean():.1%} of cells fall back to the model"
+        )
+
+    return {
+        "ph_axis": ph_axis,
+        "log_tds_axis": tds_axis,
+        "threshold": lookup_params["max_deviation"],
+        "models": models,
+    }
+
+
+def _timed_fit(model, X_train, y_train, X_test, y_test):
+    """Fit and score `model`, measuring wall-clock and CPU time of the fit."""
+    wall_start, cpu_start = time.perf_counter(), time.process_time()
+    model.fit(X_train, y_train)
+    timing = {
+        "wall_seconds": round(time.perf_counter() - wall_start, 3),
+        "cpu_seconds": round(time.process_time() - cpu_start, 3),
+    }
+    return model, model.score(X_test, y_test), timing
+
+
+def build_random_forest(rf_params):
+    """Build the (unfitted) Random Forest from params["model"]["rf"]."""
+    return RandomForestClassifier(
+        n_estimators=rf_params["n_estimators"],
+        max_depth=rf_params.get("max_depth"),
+        min_samples_leaf=rf_params.get("min_samples_leaf", 1),
+        random_state=rf_params["random_state"],
+        n_jobs=rf_params.get("n_jobs"),
+    )
+
+
+def fit_random_forest(X_train, y_train, X_test, y_test, rf_params):
+    """Train the Random Forest; trees are built on `n_jobs` cores."""
+    rf_model = build_random_forest(rf_params)
+    rf_model, accuracy, timing = _timed_fit(rf_model, X_train, y_train, X_test, y_test)
+    # Parallelism is for training only; single-reading inference is faster without a thread pool
+    rf_model.n_jobs = None
+    return rf_model, accuracy, timing
+
+
+def build_svm(svm_params):
+    """
+    Build the (unfitted) SVM selected by svm_params["mode"].
+
+    "exact" is an SVC, whose fit scales quadratically to cubically with the
+    sample count and, with probability=True, adds an internal 5-fold Platt
+    calibration. "approx" maps inputs through a Nystroem approximation of
+    the same kernel and fits a logistic-loss linear model with SGD: linear
+    in the sample count, with probabilities from the loss itself instead of
+    a separate calibration pass. Both expose predict_proba and classes_, so
+    either fits the bundle's svm_model slot.
+    """
+    mode = svm_params.get("mode", "exact")
+    if mode == "exact":
+        return SVC(
+            kernel=svm_params["kernel"],
+            C=svm_params.get("C", 1.0),
+            gamma=svm_params.get("gamma", "scale"),
+            probability=svm_params["probability"],
+            random_state=svm_params["random_state"],
+        )
+    if mode == "approx":
+        return Pipeline([
+            ("kernel_map", Nystroem(
+                kernel=svm_params["kernel"],
+                # On standardized inputs SVC's gamma="scale" equals Nystroem's default 1/n_features
+                gamma=None if svm_params.get("gamma", "scale") == "scale" else svm_params["gamma"],
+                n_components=svm_params.get("n_components", 300),
+                random_state=svm_params["random_state"],
+            )),
+            ("linear", SGDClassifier(
+                loss="log_loss",
+                alpha=svm_params.get("alpha", 1e-4),
+                random_state=svm_params["random_state"],
+            )),
+        ])
+    raise ValueError(f"Unknown svm mode '{mode}' (expected 'exact' or 'approx')")
+
+
+def fit_svm(X_train_scaled, y_train, X_test_scaled, y_test, svm_params):
+    """Train the SVM on standardized features."""
+    svm_model = build_svm(svm_params)
+    return _timed_fit(svm_model, X_train_scaled, y_train, X_test_scaled, y_test)
+
+
+def apply_tuned_params(params):
+    """
+    Overlay the best hyperparameters found by src/tune.py.
+
+    params["model"]["tuned_params"] names a YAML file shaped like
+    {"model": {"rf": {...}, "svm": {...}}}; if it is unset or missing,
+    params are returned unchanged.
+    """
+    tuned_path = params["model"].get("tuned_params")
+    if not tuned_path or not os.path.exists(tuned_path):
+        return params
+    with open(tuned_path, "r") as f:
+        tuned = (yaml.safe_load(f) or {}).get("model", {})
+
+    params = copy.deepcopy(params)
+    for family in ("rf", "svm"):
+        params["model"][family].update(tuned.get(family, {}))
+    print(f"✅ Applied tuned hyperparameters from {tuned_path}: {tuned}")
+    return params
+
+
+@timed("train_models")
 def train_models(params):
     """Train Random Forest and SVM models, log to MLflow, and save bundle."""
+    params = apply_tuned_params(params)
+
     # ── Load & preprocess ──
-    data_path = params["data"]["processed_path"]
     features = params["features"]["names"]
-    target = params["features"]["target"]
     test_size = params["data"]["test_size"]
-    random_state = params["data"]["random_state"]
 
-    df = load_data(data_path)
-    X, y, imputer = preprocess(df, features, target)
-    X_train, X_test, y_train, y_test = split_data(X, y, test_size, random_state)
+    X_train, X_test, y_train, y_test, imputer, missing = load_splits(params, with_missing=True)
     scaler, X_train_scaled = fit_scaler(X_train)
     X_test_scaled = scaler.transform(X_test)
 
-    # ── Train Random Forest ──
+    # ── Train Random Forest & SVM (optionally side by side in two processes) ──
     rf_params = params["model"]["rf"]
-    rf_model = RandomForestClassifier(
-        n_estimators=rf_params["n_estimators"],
-        random_state=rf_params["random_state"],
-    )
-    rf_model.fit(X_train, y_train)
-    rf_accuracy = rf_model.score(X_test, y_test)
-    print(f"✅ Random Forest Accuracy: {rf_accuracy:.4f}")
-
-    # ── Train SVM ──
     svm_params = params["model"]["svm"]
-    svm_model = SVC(
-        kernel=svm_params["kernel"],
-        probability=svm_params["probability"],
-        random_state=svm_params["random_state"],
-    )
-    svm_model.fit(X_train_scaled, y_train)
-    svm_accuracy = svm_model.score(X_test_scaled, y_test)
-    print(f"✅ SVM Accuracy: {svm_accuracy:.4f}")
+    parallel = params["model"].get("parallel", False)
+    if parallel and params.get("instrumentation", {}).get("profile"):
+        # The sampling profiler only sees this process; worker processes would leave it nothing to sample
+        print("⚠️  instrumentation.profile is on; fitting the models serially so the profile covers them")
+        parallel = False
+    if parallel:
+        with ProcessPoolExecutor(max_workers=2) as pool:
+            rf_future = pool.submit(fit_random_forest, X_train, y_train, X_test, y_test, rf_params)
+            svm_future = pool.submit(fit_svm, X_train_scaled, y_train, X_test_scaled, y_test, svm_params)
+            rf_model, rf_accuracy, rf_timing = rf_future.result()
+            svm_model, svm_accuracy, svm_timing = svm_future.result()
+    else:
+        rf_model, rf_accuracy, rf_timing = fit_random_forest(X_train, y_train, X_test, y_test, rf_params)
+        svm_model, svm_accuracy, svm_timing = fit_svm(X_train_scaled, y_train, X_test_scaled, y_test, svm_params)
+
+    print(f"✅ Random Forest Accuracy: {rf_accuracy:.4f} "
+          f"({rf_timing['wall_seconds']:.2f}s wall, {rf_timing['cpu_seconds']:.2f}s CPU)")
+    print(f"✅ SVM Accuracy: {svm_accuracy:.4f} "
+          f"({svm_timing['wall_seconds']:.2f}s wall, {svm_timing['cpu_seconds']:.2f}s CPU)")
 
     # ── MLflow Logging ──
     if MLFLOW_AVAILABLE:
@@ -67,12 +345,16 @@ def train_models(params):
             # Log params
             mlflow.log_param("rf_n_estimators", rf_params["n_estimators"])
             mlflow.log_param("svm_kernel", svm_params["kernel"])
+            mlflow.log_param("svm_mode", svm_params.get("mode", "exact"))
+            mlflow.log_param("tuned_params", params["model"].get("tuned_params"))
             mlflow.log_param("test_size", test_size)
             mlflow.log_param("features", features)
 
             # Log metrics
             mlflow.log_metric("rf_accuracy", rf_accuracy)
             mlflow.log_metric("svm_accuracy", svm_accuracy)
+            mlflow.log_metric("rf_train_wall_seconds", rf_timing["wall_seconds"])
+            mlflow.log_metric("svm_train_wall_seconds", svm_timing["wall_seconds"])
 
             # Log models
             mlflow.sklearn.log_model(rf_model, "rf_model")
@@ -82,23 +364,54 @@ def train_models(params):
 
     # ── Save model bundle ──
     model_path = params["output"]["model_path"]
+    version = time.strftime("%Y%m%d%H%M%S")
+    # Non-missing values per feature behind the imputer means (train and test rows)
+    imputer_counts = ((~missing["train"]).sum() + (~missing["test"]).sum())[features].astype(int).tolist()
     bundle = {
         "rf_model": rf_model,
         "svm_model": svm_model,
         "scaler": scaler,
         "imputer": imputer,
         "features": features,
+        "rf_flat": flatten_forest(rf_model),
+        # Training-time feature sketches that src/drift.py compares live readings against. Built from
+        # the raw values: live readings are not imputed, so imputed means would skew the histogram
+        "drift_reference": build_reference(X_train.mask(missing["train"]), features,
+                                           params.get("drift", {}).get("bins", 20)),
+        "version": version,
+        # src/update.py appends one entry per incremental update
+        "lineage": [{
+            "version": version,
+            "parent": None,
+            "kind": "full",
+            "rows": len(X_train),
+            "imputer_counts": imputer_counts,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }],
     }
+    if "lookup" in params:
+        bundle["lookup"] = build_lookup_surface(bundle, params["lookup"])
     with open(model_path, "wb") as f:
         pickle.dump(bundle, f)
     print(f"✅ Model bundle saved to {model_path}")
 
+    bundle_dir = params["output"].get("bundle_dir")
+    if bundle_dir:
+        save_bundle_dir(bundle, bundle_dir)
+        prune_versions(bundle_dir, params["output"].get("keep_versions", 3))
+        print(f"✅ Lazy-loading bundle saved to {bundle_dir}/{version}")
+
     # ── Save training metrics ──
     metrics = {
         "rf_accuracy": round(rf_accuracy, 4),
         "svm_accuracy": round(svm_accuracy, 4),
         "train_samples": len(X_train),
         "test_samples": len(X_test),
+        "rf_train_wall_seconds": rf_timing["wall_seconds"],
+        "rf_train_cpu_seconds": rf_timing["cpu_seconds"],
+        "svm_train_wall_seconds": svm_timing["wall_seconds"],
+        "svm_train_cpu_seconds": svm_timing["cpu_seconds"],
+        "parallel_models": bool(parallel),
     }
     os.makedirs("reports", exist_ok=True)
     metrics_path = params["output"]["metrics_path"]
@@ -111,4 +424,7 @@ def train_models(params):
 
 if __name__ == "__main__":
     params = load_params()
-    train_models(params)
+    configure(params)
+    with profiled(params):
+        train_models(params)
+    export(params)
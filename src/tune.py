@@ -0,0 +1,202 @@
+"""
+tune.py — Parallel hyperparameter search for RF and SVM with successive halving.
+Cross-validation folds are built once, shared with worker processes through
+memory-mapped arrays, and every candidate is scored on the same folds.
+Writes the best parameters to tuned_params.yaml for src/train.py.
+"""
+
+import itertools
+import json
+import math
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import yaml
+from sklearn.model_selection import StratifiedKFold
+
+from src.data_preprocessing import load_params, load_splits, fit_scaler
+from src.train import build_random_forest, build_svm
+
+_FOLDS = None
+
+
+def prepare_folds(X_train, y_train, n_folds, random_state, folds_dir):
+    """
+    Split the training set into stratified folds and save each fold's
+    arrays (raw and standardized) as .npy files in `folds_dir`.
+
+    Each fold also gets a fixed shuffled order of its training rows, so a
+    rung that uses fraction r of the data trains on the first r·n rows of
+    that order and the subsets grow monotonically from rung to rung.
+    """
+    X = np.asarray(X_train, dtype=np.float64)
+    y = np.asarray(y_train)
+    rng = np.random.default_rng(random_state)
+    splitter = StratifiedKFold(n_splits=n_folds, shuffle=True, random_state=random_state)
+
+    for k, (train_idx, val_idx) in enumerate(splitter.split(X, y)):
+        scaler, X_tr_scaled = fit_scaler(X[train_idx])
+        arrays = {
+            "X_tr": X[train_idx],
+            "X_tr_scaled": X_tr_scaled,
+            "y_tr": y[train_idx],
+            "X_val": X[val_idx],
+            "X_val_scaled": scaler.transform(X[val_idx]),
+            "y_val": y[val_idx],
+            "order": rng.permutation(len(train_idx)),
+        }
+        for name, array in arrays.items():
+            np.save(os.path.join(folds_dir, f"fold{k}_{name}.npy"), array)
+
+
+def _load_folds(folds_dir, n_folds):
+    """Memory-map every fold array (read-only, shared across processes)."""
+    names = ["X_tr", "X_tr_scaled", "y_tr", "X_val", "X_val_scaled", "y_val", "order"]
+    return [
+        {name: np.load(os.path.join(folds_dir, f"fold{k}_{name}.npy"), mmap_mode="r") for name in names}
+        for k in range(n_folds)
+    ]
+
+
+def _init_worker(folds_dir, n_folds):
+    global _FOLDS
+    _FOLDS = _load_folds(folds_dir, n_folds)
+
+
+def evaluate_candidate(family, model_params, fold_index, fraction):
+    """
+    Fit one candidate on `fraction` of one fold's training rows and score
+    it on that fold's validation rows. Runs inside a worker process.
+
+    Returns: (accuracy, fit_seconds, score_seconds)
+    """
+    fold = _FOLDS[fold_index]
+    n_rows = max(2, int(math.ceil(fraction * len(fold["order"]))))
+    rows = np.sort(fold["order"][:n_rows])
+
+    if family == "rf":
+        model = build_random_forest(model_params)
+        X_tr, X_val = fold["X_tr"][rows], fold["X_val"]
+    else:
+        model = build_svm(model_params)
+        X_tr, X_val = np.array(fold["X_tr_scaled"][rows]), np.array(fold["X_val_scaled"])
+
+    start = time.perf_counter()
+    model.fit(X_tr, fold["y_tr"][rows])
+    fit_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    accuracy = model.score(X_val, fold["y_val"])
+    score_seconds = time.perf_counter() - start
+    return float(accuracy), fit_seconds, score_seconds
+
+
+def candidate_grid(base_params, search_space):
+    """Every combination of `search_space` values, overlaid on `base_params`."""
+    keys = list(search_space)
+    for values in itertools.product(*(search_space[k] for k in keys)):
+        yield {**base_params, **dict(zip(keys, values))}
+
+
+def successive_halving(pool, family, candidates, n_folds, eta, min_fraction):
+    """
+    Evaluate candidates on growing fractions of the training folds.
+
+    Every rung scores the surviving candidates on all folds in parallel,
+    keeps the best 1/eta by mean validation accuracy, and multiplies the
+    data fraction by eta, until one candidate remains or the full folds
+    have been used. Returns one result record per candidate and the winner.
+    """
+    records = [{"params": c, "rungs": [], "eliminated_at_fraction": None} for c in candidates]
+    survivors = list(range(len(records)))
+    # Largest power of 1/eta that is still >= min_fraction, so the last rung lands on 1.0
+    fraction = float(eta) ** -math.floor(math.log(1 / min_fraction, eta) + 1e-9)
+
+    while True:
+        futures = {
+            (i, k): pool.submit(evaluate_candidate, family, records[i]["params"], k, fraction)
+            for i in survivors for k in range(n_folds)
+        }
+        for i in survivors:
+            results = [futures[(i, k)].result() for k in range(n_folds)]
+            records[i]["rungs"].append({
+                "fraction": round(fraction, 4),
+                "accuracy": round(float(np.mean([r[0] for r in results])), 5),
+                "fit_seconds": round(sum(r[1] for r in results), 3),
+                "score_seconds": round(sum(r[2] for r in results), 3),
+            })
+
+        ranked = sorted(survivors, key=lambda i: records[i]["rungs"][-1]["accuracy"], reverse=True)
+        print(f"  {family} rung @ {fraction:.0%} of data: {len(survivors)} candidates, "
+              f"best acc {records[ranked[0]]['rungs'][-1]['accuracy']:.4f}")
+        if fraction >= 1.0 or len(survivors) == 1:
+            break
+
+        keep = max(1, len(survivors) // eta)
+        for i in ranked[keep:]:
+            records[i]["eliminated_at_fraction"] = round(fraction, 4)
+        survivors = ranked[:keep]
+        fraction = min(fraction * eta, 1.0)
+
+    best = max(survivors, key=lambda i: records[i]["rungs"][-1]["accuracy"])
+    for record in records:
+        record["total_seconds"] = round(sum(r["fit_seconds"] + r["score_seconds"] for r in record["rungs"]), 3)
+    return records, records[best]
+
+
+def tune(params):
+    """Run the search for both model families and write the results."""
+    tune_params = params["tune"]
+    n_folds = tune_params["n_folds"]
+
+    # ── Build folds once (held-out test split is never seen by tuning) ──
+    start = time.perf_counter()
+    X_train, _, y_train, _, _ = load_splits(params)
+    folds_dir = tempfile.mkdtemp(prefix="tune_folds_")
+    prepare_folds(X_train, y_train, n_folds, params["data"]["random_state"], folds_dir)
+    fold_seconds = time.perf_counter() - start
+    print(f"✅ Built {n_folds} folds in {fold_seconds:.2f}s")
+
+    results = {"fold_preparation_seconds": round(fold_seconds, 3)}
+    best_params = {}
+    try:
+        with ProcessPoolExecutor(max_workers=tune_params["workers"], initializer=_init_worker,
+                                 initargs=(folds_dir, n_folds)) as pool:
+            for family in ("rf", "svm"):
+                base = dict(params["model"][family])
+                if family == "rf":
+                    base["n_jobs"] = 1  # parallelism comes from the pool, not from each forest
+                candidates = list(candidate_grid(base, tune_params["search"][family]))
+                start = time.perf_counter()
+                records, best = successive_halving(
+                    pool, family, candidates, n_folds, tune_params["eta"], tune_params["min_fraction"]
+                )
+                results[family] = {
+                    "wall_seconds": round(time.perf_counter() - start, 3),
+                    "best": best,
+                    "candidates": records,
+                }
+                best_params[family] = {k: best["params"][k] for k in tune_params["search"][family]}
+                print(f"✅ Best {family}: {best_params[family]} "
+                      f"(cv accuracy {best['rungs'][-1]['accuracy']:.4f})")
+    finally:
+        shutil.rmtree(folds_dir, ignore_errors=True)
+
+    with open(tune_params["output_path"], "w") as f:
+        yaml.safe_dump({"model": best_params}, f, sort_keys=False)
+    print(f"✅ Tuned parameters saved to {tune_params['output_path']}")
+
+    os.makedirs(os.path.dirname(tune_params["results_path"]) or ".", exist_ok=True)
+    with open(tune_params["results_path"], "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Tuning results saved to {tune_params['results_path']}")
+    return best_params, results
+
+
+if __name__ == "__main__":
+    params = load_params()
+    tune(params)
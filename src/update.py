@@ -0,0 +1,227 @@
+"""
+update.py — Incremental model update from newly labeled readings.
+Refreshes an existing bundle using only the new rows instead of retraining
+on the full history:
+
+    python -m src.update data/new_readings.csv
+
+Random Forest: warm-start grows `update.new_trees` trees on the new rows and
+retires the same number of oldest trees, so the forest keeps a fixed size.
+Imputer: means are updated as running averages. SVM: the approx model
+(Nystroem + SGD) is updated online with partial_fit, together with the
+scaler's running moments; an exact SVC cannot be updated and stays as is.
+The drift reference sketches (src/drift.py) absorb the new rows as well.
+"""
+
+import argparse
+import copy
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+from src.bundle_store import LazyBundle, prune_versions, save_bundle_dir
+from src.data_preprocessing import load_params, load_data, _label_codes
+from src.drift import FeatureSketch
+from src.instrumentation import timed
+from src.predict import load_bundle, predict_batch, resolve_bundle_path
+from src.train import build_lookup_surface, flatten_forest
+
+
+def _new_version(parent):
+    version = time.strftime("%Y%m%d%H%M%S")
+    return version if version != parent else f"{version}-1"
+
+
+def update_imputer(imputer, X_new, seen):
+    """
+    Fold the non-missing values of X_new into the imputer's means.
+    `seen` is the per-feature count behind the current means.
+    Returns the new per-feature counts.
+    """
+    X_new = np.asarray(X_new, dtype=np.float64)
+    new_counts = np.count_nonzero(~np.isnan(X_new), axis=0)
+    new_sums = np.nansum(X_new, axis=0)
+    total = seen + new_counts
+    imputer.statistics_ = np.where(
+        total > 0, (imputer.statistics_ * seen + new_sums) / np.maximum(total, 1), imputer.statistics_
+    )
+    return total
+
+
+def grow_forest(rf_model, X_new, y_new, new_trees, retire=True):
+    """
+    Add `new_trees` trees fitted on the new rows (warm start), then drop the
+    same number of oldest trees when `retire` is set.
+    """
+    n_old = len(rf_model.estimators_)
+    rf_model.warm_start = True
+    rf_model.n_estimators = n_old + new_trees
+    rf_model.fit(X_new, y_new)
+    rf_model.warm_start = False
+    retired = 0
+    if retire:
+        rf_model.estimators_ = rf_model.estimators_[new_trees:]
+        rf_model.n_estimators = len(rf_model.estimators_)
+        retired = new_trees
+    return retired
+
+
+def is_online_svm(svm_model):
+    """True for the approx SVM (Nystroem + SGD), which supports partial_fit."""
+    return hasattr(svm_model, "steps") and hasattr(svm_model.steps[-1][1], "partial_fit")
+
+
+@timed("update_bundle")
+def update_bundle(bundle, X_new, y_new, update_params, lookup_params=None, test_size=0.2):
+    """
+    Return a new bundle updated with the labeled rows (X_new, y_new).
+
+    The input bundle is not modified. A LazyBundle is read into memory first,
+    so nothing in the result is memory-mapped from the loaded version's
+    files. The returned bundle gets a new version
+    and a lineage entry recording the parent version, the row count, the
+    tree turnover, and the parent's accuracy on the new rows.
+
+    The imputer means are weighted by the per-feature non-missing counts
+    recorded in the lineage. Bundles without them are assumed to have had
+    no missing values, with the imputer fitted on train and test rows
+    (`test_size` is the test share of the original split).
+    """
+    start = time.perf_counter()
+    bundle = bundle.materialize() if isinstance(bundle, LazyBundle) else dict(bundle)
+    parent = bundle.get("version")
+    features = bundle["features"]
+    X_raw = pd.DataFrame(np.asarray(X_new, dtype=np.float64), columns=features)
+    y_new = np.asarray(y_new).astype(np.int64)
+    classes = set(bundle["rf_model"].classes_.tolist())
+
+    _, old_probs = predict_batch(bundle["imputer"].transform(X_raw), "Random Forest", bundle)
+    parent_accuracy = float(((old_probs > 0.5).astype(np.int64) == y_new).mean())
+
+    lineage = list(bundle.get("lineage", []))
+    if lineage and "imputer_counts" in lineage[-1]:
+        seen = np.asarray(lineage[-1]["imputer_counts"], dtype=np.int64)
+    else:
+        # The scaler only saw the training rows; the imputer was fitted on train and test
+        seen = np.full(len(features), round(int(np.max(bundle["scaler"].n_samples_seen_)) / (1 - test_size)))
+
+    imputer = copy.deepcopy(bundle["imputer"])
+    imputer_counts = update_imputer(imputer, X_raw.to_numpy(), seen)
+    X_imputed = imputer.transform(X_raw)
+
+    rf_model = copy.deepcopy(bundle["rf_model"])
+    trees_added = trees_retired = 0
+    if set(np.unique(y_new).tolist()) == classes:
+        trees_added = update_params["new_trees"]
+        trees_retired = grow_forest(rf_model, X_imputed, y_new, trees_added, update_params.get("retire_trees", True))
+    else:
+        print("⚠️  New rows do not contain every class; the forest is left unchanged")
+
+    scaler, svm_model = bundle["scaler"], bundle["svm_model"]
+    svm_updated = is_online_svm(svm_model)
+    if svm_updated:
+        scaler = copy.deepcopy(scaler)
+        scaler.partial_fit(X_imputed)
+        svm_model = copy.deepcopy(svm_model)
+        kernel_map, linear = svm_model[:-1], svm_model.steps[-1][1]
+        linear.partial_fit(kernel_map.transform(scaler.transform(X_imputed)), y_new)
+    else:
+        # An SVC fitted on the old scaling would drift if the scaler moved under it
+        print("⚠️  Exact SVC cannot be updated incrementally; SVM and scaler unchanged "
+              "(use model.svm.mode: approx for online updates)")
+
+    if "drift_reference" in bundle:
+        # The forest now also reflects the new rows, so the drift reference absorbs their raw values too
+        reference = {}
+        for i, name in enumerate(features):
+            sketch = FeatureSketch.from_dict(bundle["drift_reference"][name])
+            sketch.update(X_raw.iloc[:, i].to_numpy())
+            reference[name] = sketch.to_dict()
+        bundle["drift_reference"] = reference
+
+    version = _new_version(parent)
+    bundle.update({
+        "rf_model": rf_model,
+        "svm_model": svm_model,
+        "scaler": scaler,
+        "imputer": imputer,
+        "rf_flat": flatten_forest(rf_model),
+        "version": version,
+    })
+    if lookup_params is not None and "lookup" in bundle:
+        changed = (["Random Forest"] if trees_added else []) + (["SVM"] if svm_updated else [])
+        bundle["lookup"] = build_lookup_surface(bundle, lookup_params, changed)
+
+    lineage.append({
+        "version": version,
+        "parent": parent,
+        "kind": "incremental",
+        "rows": int(len(y_new)),
+        "trees_added": trees_added,
+        "trees_retired": trees_retired,
+        "svm_updated": svm_updated,
+        "parent_accuracy_on_new_rows": round(parent_accuracy, 4),
+        "imputer_counts": imputer_counts.tolist(),
+        "seconds": round(time.perf_counter() - start, 3),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    })
+    bundle["lineage"] = lineage
+    return bundle
+
+
+def load_new_rows(data_path, features, target):
+    """Labeled rows of a new readings file (Unknown/unlabeled rows are skipped)."""
+    df = load_data(data_path)
+    codes = _label_codes(df[target].astype("category"))
+    df = df[codes >= 0]
+    return df[features].apply(pd.to_numeric, errors="coerce"), codes[codes >= 0]
+
+
+def save_updated_bundle(bundle, path, keep_versions=3):
+    """Save to a .pkl file (replaced atomically) or, for any other path, as a bundle directory version."""
+    if path.endswith(".pkl"):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            pickle.dump(bundle, f)
+        os.replace(tmp_path, path)
+        print(f"✅ Model bundle saved to {path}")
+    else:
+        save_bundle_dir(bundle, path)
+        prune_versions(path, keep_versions)
+        print(f"✅ Lazy-loading bundle saved to {path}/{bundle['version']}")
+
+
+if __name__ == "__main__":
+    params = load_params()
+    parser = argparse.ArgumentParser(description="Update the model bundle with newly labeled readings.")
+    parser.add_argument("input", help="CSV/Parquet of new labeled readings (feature and target columns)")
+    parser.add_argument("--model-path",
+                        help="Bundle to update: a .pkl file or bundle directory (default: the trained bundle, "
+                             "whose .pkl and bundle directory are both rewritten)")
+    parser.add_argument("--output", help="Save the updated bundle here instead of back to --model-path")
+    args = parser.parse_args()
+
+    features = params["features"]["names"]
+    X_new, y_new = load_new_rows(args.input, features, params["features"]["target"])
+    if len(y_new) < params["update"]["min_rows"]:
+        print(f"❌ Only {len(y_new)} labeled rows; need at least {params['update']['min_rows']}")
+        raise SystemExit(1)
+
+    model_path = args.model_path or resolve_bundle_path(params["output"])
+    bundle = update_bundle(load_bundle(model_path), X_new, y_new, params["update"], params.get("lookup"),
+                           params["data"]["test_size"])
+    entry = bundle["lineage"][-1]
+    print(f"✅ Bundle {entry['parent']} → {entry['version']}: {entry['rows']} rows, "
+          f"+{entry['trees_added']}/-{entry['trees_retired']} trees in {entry['seconds']:.2f}s "
+          f"(parent accuracy on new rows {entry['parent_accuracy_on_new_rows']:.4f})")
+
+    if args.output or args.model_path:
+        targets = [args.output or args.model_path]
+    else:
+        # The trained bundle: keep the pickle and the bundle directory in step, as train.py writes them
+        targets = [params["output"]["model_path"]] + [p for p in [params["output"].get("bundle_dir")] if p]
+    for target in targets:
+        save_updated_bundle(bundle, target, params["output"].get("keep_versions", 3))
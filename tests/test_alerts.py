@@ -0,0 +1,102 @@
+"""
+test_alerts.py — AlertDispatcher dedup, cooldown, retries and queue-full rollback.
+"""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from src import alerts  # noqa: E402
+from src.alerts import AlertDispatcher  # noqa: E402
+
+
+class RecordingTransport:
+    """Fails the first `failures` sends, then records messages."""
+
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.calls = 0
+        self.sent = []
+
+    def send(self, message):
+        self.calls += 1
+        if self.calls <= self.failures:
+            raise ConnectionError(f"send {self.calls} failed")
+        self.sent.append(message)
+        return f"id{len(self.sent)}"
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(alerts.time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_event_alerts_once_until_clear(clock):
+    dispatcher = AlertDispatcher(RecordingTransport(), cooldown_seconds=0)
+    assert dispatcher.notify("A", True, "a1") == "queued"
+    assert dispatcher.notify("A", True, "a2") == "suppressed"
+    assert dispatcher.notify("B", True, "b1") == "queued"
+    assert dispatcher.notify("A", False) == "clear"
+    assert dispatcher.notify("A", True, "a3") == "queued"
+    assert dispatcher.pending() == 3
+
+
+def test_cooldown_suppresses_new_events(clock):
+    dispatcher = AlertDispatcher(RecordingTransport(), cooldown_seconds=300)
+    assert dispatcher.notify("A", True) == "queued"
+    dispatcher.notify("A", False)
+    clock[0] += 299
+    assert dispatcher.notify("A", True) == "suppressed"
+    dispatcher.notify("A", False)
+    clock[0] += 1
+    assert dispatcher.notify("A", True) == "queued"
+
+
+def test_retries_with_backoff_then_succeeds(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(alerts.time, "sleep", sleeps.append)
+    transport = RecordingTransport(failures=2)
+    dispatcher = AlertDispatcher(transport, max_retries=3, backoff_seconds=0.5).start()
+    dispatcher.notify("A", True, "alert")
+    dispatcher.stop(timeout=5)
+    assert transport.sent == ["alert"]
+    assert sleeps == [0.5, 1.0]
+    assert dispatcher.results[-1]["ok"] and dispatcher.results[-1]["attempts"] == 3
+
+
+def test_gives_up_after_max_retries(monkeypatch):
+    monkeypatch.setattr(alerts.time, "sleep", lambda seconds: None)
+    transport = RecordingTransport(failures=10)
+    dispatcher = AlertDispatcher(transport, max_retries=2).start()
+    dispatcher.notify("A", True, "alert")
+    dispatcher.stop(timeout=5)
+    result = dispatcher.results[-1]
+    assert not result["ok"] and result["attempts"] == 3 and transport.calls == 3
+    assert result["detail"] == "send 3 failed"
+
+
+def test_dropped_alert_rolls_back_event_and_cooldown(clock):
+    dispatcher = AlertDispatcher(RecordingTransport(), queue_size=1, cooldown_seconds=300)
+    assert dispatcher.notify("A", True) == "queued"
+    assert dispatcher.notify("B", True) == "dropped"
+    assert dispatcher.dropped == 1
+    # Nothing was sent for B: neither the event nor the cooldown may block a retry
+    dispatcher._queue.get_nowait()
+    assert dispatcher.notify("B", True) == "queued"
+
+
+def test_dropped_alert_restores_previous_cooldown(clock):
+    dispatcher = AlertDispatcher(RecordingTransport(), queue_size=1, cooldown_seconds=300)
+    assert dispatcher.notify("A", True) == "queued"
+    dispatcher._queue.get_nowait()
+    dispatcher.notify("A", False)
+    clock[0] += 400
+    dispatcher.notify("C", True)  # fills the queue
+    assert dispatcher.notify("A", True) == "dropped"
+    dispatcher._queue.get_nowait()
+    dispatcher.notify("A", False)
+    # A's cooldown still dates from its first alert, which has long expired
+    assert dispatcher.notify("A", True) == "queued"
@@ -0,0 +1,67 @@
+"""
+test_data_preprocessing.py — Lean and default preprocessing must agree, and
+a damaged split cache must be rebuilt rather than break load_splits.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from src.data_preprocessing import load_data, load_splits, preprocess, preprocess_lean  # noqa: E402
+
+FEATURES = ['pH', 'TDS']
+TARGET = 'Classification'
+
+
+def _write(tmp_path, labels, name='data.csv'):
+    path = str(tmp_path / name)
+    pd.DataFrame({
+        'pH': [7.0, 3.0, np.nan, 6.5, 8.0],
+        'TDS': [300, 3000, 500, np.nan, 200],
+        TARGET: labels,
+    }).to_csv(path, index=False)
+    return path
+
+
+def _both(path):
+    X, y, _ = preprocess(load_data(path), FEATURES, TARGET)
+    X_lean, y_lean, _ = preprocess_lean(path, FEATURES, TARGET, chunksize=2)
+    return (X, y), (X_lean, y_lean)
+
+
+def test_numeric_csv_labels_match(tmp_path):
+    (X, y), (X_lean, y_lean) = _both(_write(tmp_path, [1, 0, 1, 0, 1]))
+    assert y_lean.tolist() == y.tolist() == [1, 0, 1, 0, 1]
+    np.testing.assert_allclose(X_lean.to_numpy(dtype=np.float64), X.to_numpy(), rtol=1e-6)
+
+
+def test_text_csv_labels_match(tmp_path):
+    (X, y), (X_lean, y_lean) = _both(_write(tmp_path, ['Safe', 'Unsafe', 'Unknown', 'Unsafe', 'Safe']))
+    assert y_lean.tolist() == y.tolist() == [1, 0, 0, 1]
+    np.testing.assert_allclose(X_lean.to_numpy(dtype=np.float64), X.to_numpy(), rtol=1e-6)
+
+
+def _params(tmp_path):
+    return {
+        "data": {"processed_path": _write(tmp_path, [1, 0, 1, 0, 1]), "split_cache": str(tmp_path / "splits"),
+                 "test_size": 0.4, "random_state": 42},
+        "features": {"names": FEATURES, "target": TARGET},
+    }
+
+
+def test_damaged_split_cache_is_rebuilt(tmp_path):
+    params = _params(tmp_path)
+    expected = load_splits(params)
+    cache = tmp_path / "splits"
+    damage = [
+        lambda: (cache / "X_test.parquet").write_bytes((cache / "X_test.parquet").read_bytes()[:20]),
+        lambda: (cache / "missing_train.parquet").unlink(),
+        lambda: (cache / "imputer.pkl").write_bytes(b""),
+    ]
+    for corrupt in damage:
+        corrupt()
+        X_train, X_test, y_train, y_test, _ = load_splits(params)
+        pd.testing.assert_frame_equal(X_test, expected[1])
+        pd.testing.assert_series_equal(y_train, expected[2])
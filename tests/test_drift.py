@@ -0,0 +1,113 @@
+"""
+test_drift.py — FeatureSketch statistics and merging, PSI/KS scores, and the
+DriftMonitor's window rotation.
+"""
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from src.drift import DriftMonitor, FeatureSketch, build_reference, ks, psi  # noqa: E402
+
+RNG = np.random.default_rng(0)
+VALUES = RNG.normal(7.0, 0.5, 20_000)
+
+
+def test_moments_match_numpy_and_skip_missing():
+    values = np.concatenate([VALUES, [np.nan, np.inf, -np.inf]])
+    sketch = FeatureSketch.from_values(values, bins=20)
+    assert sketch.n == len(VALUES) and sketch.missing == 3 and sketch.seen == len(values)
+    assert sketch.counts.sum() == sketch.n
+    assert sketch.mean == pytest.approx(VALUES.mean())
+    assert sketch.std == pytest.approx(VALUES.std())
+    assert (sketch.min, sketch.max) == (VALUES.min(), VALUES.max())
+
+
+def test_merge_equals_single_pass():
+    whole = FeatureSketch.from_values(VALUES, bins=20)
+    left, right = FeatureSketch(whole.cuts), FeatureSketch(whole.cuts)
+    for part in np.array_split(VALUES[:7_000], 7):
+        left.update(part)
+    right.update(np.concatenate([VALUES[7_000:], [np.nan]]))
+    merged = left.copy().merge(right)
+    assert merged.n == whole.n and merged.missing == 1
+    np.testing.assert_array_equal(merged.counts, whole.counts)
+    assert merged.mean == pytest.approx(whole.mean)
+    assert merged.m2 == pytest.approx(whole.m2)
+    assert (merged.min, merged.max) == (whole.min, whole.max)
+    assert left.n == 7_000   # copy() left the original untouched
+
+
+def test_merge_rejects_different_cuts():
+    with pytest.raises(ValueError):
+        FeatureSketch([1.0, 2.0]).merge(FeatureSketch([1.0, 3.0]))
+
+
+def test_quantiles_are_close():
+    sketch = FeatureSketch.from_values(VALUES, bins=50)
+    qs = [0.1, 0.5, 0.9]
+    np.testing.assert_allclose(sketch.quantiles(qs), np.quantile(VALUES, qs), atol=0.02)
+    assert np.isnan(FeatureSketch([1.0]).quantiles([0.5])).all()
+
+
+def test_round_trip_through_dict():
+    sketch = FeatureSketch.from_values(VALUES, bins=20)
+    restored = FeatureSketch.from_dict(sketch.to_dict())
+    np.testing.assert_array_equal(restored.counts, sketch.counts)
+    assert (restored.n, restored.mean, restored.m2) == (sketch.n, sketch.mean, sketch.m2)
+
+
+def test_psi_ks_identical_vs_shifted():
+    reference = FeatureSketch.from_values(VALUES, bins=20)
+    same = FeatureSketch(reference.cuts)
+    same.update(RNG.normal(7.0, 0.5, 20_000))
+    shifted = FeatureSketch(reference.cuts)
+    shifted.update(RNG.normal(7.5, 0.5, 20_000))
+    assert psi(reference, reference) == 0 and ks(reference, reference) == 0
+    assert psi(reference, same) < 0.02 and ks(reference, same) < 0.03
+    assert psi(reference, shifted) > 0.25 and ks(reference, shifted) > 0.15
+
+
+def _monitor(**settings):
+    reference = build_reference(np.column_stack([VALUES, VALUES * 40]), ["pH", "TDS"], bins=20)
+    return DriftMonitor(reference, ["pH", "TDS"], **settings)
+
+
+def _readings(n, ph=7.0):
+    return np.column_stack([np.full(n, ph), np.full(n, 280.0)])
+
+
+def test_window_rotation_covers_last_one_to_two_windows():
+    monitor = _monitor(window=1000, check_every=10**9, buffer_size=16)
+    monitor.observe(_readings(999))
+    assert monitor.live()["pH"].seen == 999 and monitor._previous is None
+    monitor.observe(_readings(1))
+    live = monitor.live()["pH"]
+    assert monitor._previous is not None and live.seen == 1000
+    # Single readings go through the staging buffer; live() always includes them
+    for i in range(2500):
+        monitor.observe(_readings(1, ph=9.0)[0])
+        if i % 250 == 249:
+            assert 1000 <= monitor.live()["pH"].seen < 2000 + 16
+    # The 7.0 readings have rotated out; only the latest windows remain
+    live = monitor.live()["pH"]
+    assert live.mean == 9.0 and live.min == 9.0
+
+
+def test_checks_flag_shifted_traffic_only():
+    monitor = _monitor(window=5000, check_every=1000, min_readings=500)
+    report = monitor.observe(np.column_stack([VALUES[:1000], VALUES[:1000] * 40]))
+    assert report is not None and report["drifted"] == [] and report["readings"] == 1000
+    shifted = np.column_stack([VALUES[1000:2000] + 1.0, VALUES[1000:2000] * 40])
+    for _ in range(5):
+        report = monitor.observe(shifted)
+    assert report["drifted"] == ["pH"]
+    assert report["features"]["pH"]["mean_shift_std"] > 1
+
+
+def test_no_verdict_below_min_readings():
+    monitor = _monitor(check_every=100, min_readings=500)
+    assert monitor.observe(np.column_stack([VALUES[:100], VALUES[:100]])) is None
+    assert monitor.report is None
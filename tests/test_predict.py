@@ -0,0 +1,39 @@
+"""
+test_predict.py — Chunked Parquet output must keep one schema across chunks.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from src.predict import _ChunkWriter  # noqa: E402
+
+
+def _chunk(note, count):
+    return pd.DataFrame({'pH': [7.0, 6.9], 'Note': note, 'Count': count,
+                         'Prediction': [1, 0], 'Probability': [0.9, 0.2]})
+
+
+def test_parquet_chunks_with_changing_types(tmp_path):
+    path = str(tmp_path / 'out.parquet')
+    writer = _ChunkWriter(path)
+    writer.write(_chunk([np.nan, np.nan], [1, 2]))      # all missing, integers
+    writer.write(_chunk(['ok', None], [3.5, 4.0]))      # then text and floats
+    writer.close()
+    out = pd.read_parquet(path)
+    assert out['Note'].tolist() == [None, None, 'ok', None]
+    assert out['Count'].tolist() == [1.0, 2.0, 3.5, 4.0]
+    assert out['Prediction'].dtype == np.int64
+
+
+def test_parquet_chunk_that_cannot_be_cast(tmp_path):
+    path = str(tmp_path / 'out.parquet')
+    writer = _ChunkWriter(path)
+    writer.write(_chunk(['a', 'b'], [1, 2]))
+    with pytest.raises(ValueError, match="Column 'Count' in rows 2–3"):
+        writer.write(_chunk(['c', 'd'], ['x', 'y']))
+    writer.abort()
+    assert not os.path.exists(path)
@@ -0,0 +1,101 @@
+"""
+test_store.py — ReadingStore rollup buckets, merged aggregates and retention.
+"""
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from src.store import ReadingStore  # noqa: E402
+
+MINUTE, HOUR, DAY = 60_000, 3_600_000, 86_400_000
+T0 = 1_700_000_000_000 // DAY * DAY   # a UTC midnight, so minute/hour buckets start on it
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ReadingStore(str(tmp_path / "history.db"), batch_size=10**6, flush_seconds=10**6,
+                         retention_days=1, rollup_retention_days=30)
+    yield store
+    store.close()
+
+
+def _add(store, ts, ph, tds=300.0, prediction=1, probability=0.9, station="S1"):
+    store.add_readings(ts, [station], [ph], [tds], [prediction], [probability], "Random Forest")
+
+
+def test_readings_split_at_bucket_boundaries(store):
+    for ts in (T0, T0 + MINUTE - 1, T0 + MINUTE, T0 + HOUR - 1, T0 + HOUR):
+        _add(store, ts, 7.0)
+    store.flush()
+    minutes = store.rollup("minute")
+    assert minutes["n"].tolist() == [2, 1, 1, 1]
+    assert (minutes["start"].astype("int64") // 10**6).tolist() == [T0, T0 + MINUTE, T0 + HOUR - MINUTE, T0 + HOUR]
+    assert store.rollup("hour")["n"].tolist() == [4, 1]
+
+
+def test_rollups_merge_across_batches_and_skip_missing(store):
+    _add(store, T0, 6.0, tds=100.0, prediction=0, probability=0.2)
+    store.flush()
+    _add(store, T0 + 1000, np.nan, tds=300.0, prediction=1, probability=np.nan)
+    _add(store, T0 + 2000, 8.0, tds=np.nan, prediction=1, probability=0.8)
+    store.flush()
+    row = store.rollup("minute").iloc[0]
+    assert row["n"] == 3 and row["unsafe"] == 1
+    assert row["ph_mean"] == pytest.approx(7.0) and (row["ph_min"], row["ph_max"]) == (6.0, 8.0)
+    assert row["tds_mean"] == pytest.approx(200.0) and (row["tds_min"], row["tds_max"]) == (100.0, 300.0)
+    assert row["probability_mean"] == pytest.approx(0.5)
+    assert row["unsafe_share"] == pytest.approx(1 / 3)
+
+
+def test_all_missing_bucket_has_null_mean(store):
+    _add(store, T0, np.nan)
+    store.flush()
+    row = store.rollup("minute").iloc[0]
+    assert pd.isna(row["ph_mean"]) and pd.isna(row["ph_min"]) and pd.isna(row["ph_max"])
+    _add(store, T0 + 1, 7.5)
+    store.flush()
+    row = store.rollup("minute").iloc[0]
+    assert row["ph_mean"] == 7.5 and row["ph_min"] == 7.5 and row["ph_max"] == 7.5
+
+
+def test_query_ranges_are_half_open(store):
+    for ts in (T0, T0 + 1000, T0 + 2000):
+        _add(store, ts, 7.0)
+    store.flush()
+    assert len(store.readings(T0, T0 + 2000)) == 2
+    assert len(store.readings(T0 + 1000)) == 2
+    assert len(store.rollup("minute", T0 + 1, None)) == 0
+
+
+def test_retention_boundaries(store):
+    now = T0 + 40 * DAY
+    cutoff = now - DAY
+    for ts in (cutoff - 1, cutoff, now - 30 * DAY - HOUR, now - 30 * DAY):
+        _add(store, ts, 7.0)
+    store.add_alerts(cutoff - 1, ["S1"], ["queued"], ["old"], "Random Forest")
+    store.add_alerts(cutoff, ["S1"], ["queued"], ["new"], "Random Forest")
+    store.flush()
+
+    deleted = store.prune(now)
+    assert deleted["readings"] == 3 and deleted["alerts"] == 1
+    assert (store.readings()["ts"].astype("int64") // 10**6).tolist() == [cutoff]
+    assert store.alerts()["message"].tolist() == ["new"]
+    # Minute rollups follow retention_days, hour rollups rollup_retention_days
+    minute_starts = (store.rollup("minute")["start"].astype("int64") // 10**6).tolist()
+    assert minute_starts == [cutoff // MINUTE * MINUTE]
+    assert all(start >= cutoff for start in minute_starts)
+    hour_starts = (store.rollup("hour")["start"].astype("int64") // 10**6).tolist()
+    assert hour_starts == [now - 30 * DAY, cutoff - HOUR, cutoff]
+
+
+def test_no_retention_keeps_everything(tmp_path):
+    store = ReadingStore(str(tmp_path / "all.db"))
+    _add(store, T0, 7.0)
+    store.flush()
+    assert store.prune(T0 + 1000 * DAY) == {"readings": 0, "alerts": 0, "rollups": 0}
+    assert len(store.readings()) == 1
+    store.close()
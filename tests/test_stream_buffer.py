@@ -0,0 +1,64 @@
+"""
+test_stream_buffer.py — RingBuffer ordering across wraparound and resizes.
+"""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from src.stream_buffer import RingBuffer  # noqa: E402
+
+
+def _filled(capacity, n):
+    buffer = RingBuffer(capacity)
+    for i in range(n):
+        buffer.append(np.datetime64(i, 'ms'), float(i), 10.0 * i, i % 2, i / 100)
+    return buffer
+
+
+def test_partial_fill():
+    buffer = _filled(5, 3)
+    assert len(buffer) == 3
+    assert buffer.view()['pH'].tolist() == [0, 1, 2]
+    assert buffer.steps().tolist() == [0, 1, 2]
+
+
+def test_wraparound_keeps_oldest_first():
+    for n in (5, 6, 12, 13):
+        buffer = _filled(5, n)
+        expected = list(range(n - 5, n))
+        assert len(buffer) == 5 and buffer.appended == n
+        assert buffer.view()['pH'].tolist() == expected
+        assert buffer.view()['TDS'].tolist() == [10.0 * i for i in expected]
+        assert buffer.view()['timestamp'].astype(np.int64).tolist() == expected
+        assert buffer.steps().tolist() == expected
+
+
+def test_view_is_contiguous_without_copy():
+    buffer = _filled(4, 7)
+    view = buffer.view()
+    assert view.base is not None and view.flags['C_CONTIGUOUS']
+
+
+def test_resize_keeps_most_recent():
+    buffer = _filled(5, 12)
+    smaller = buffer.resized(3)
+    assert smaller.view()['pH'].tolist() == [9, 10, 11]
+    assert smaller.steps().tolist() == [9, 10, 11]
+
+    larger = buffer.resized(8)
+    assert larger.view()['pH'].tolist() == [7, 8, 9, 10, 11]
+    larger.append(np.datetime64(12, 'ms'), 12.0, 120.0)
+    assert larger.view()['pH'].tolist() == [7, 8, 9, 10, 11, 12]
+    for i in range(13, 16):
+        larger.append(np.datetime64(i, 'ms'), float(i), 10.0 * i)
+    assert larger.view()['pH'].tolist() == list(range(8, 16))
+    assert larger.steps().tolist() == list(range(8, 16))
+
+
+def test_resize_then_wraparound():
+    smaller = _filled(5, 12).resized(3)
+    for i in range(12, 17):
+        smaller.append(np.datetime64(i, 'ms'), float(i), 10.0 * i)
+    assert smaller.view()['pH'].tolist() == [14, 15, 16]
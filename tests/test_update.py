@@ -0,0 +1,136 @@
+"""
+test_update.py — Incremental bundle updates: running imputer means, fixed
+forest size, online SVM, drift sketches, lineage, and lazy bundles.
+"""
+import os
+import pickle
+import shutil
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+from sklearn.impute import SimpleImputer
+from sklearn.preprocessing import StandardScaler
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+from src.bundle_store import save_bundle_dir  # noqa: E402
+from src.drift import FeatureSketch, build_reference  # noqa: E402
+from src.predict import forest_predict_proba, load_bundle, predict_batch  # noqa: E402
+from src.train import build_random_forest, build_svm, flatten_forest  # noqa: E402
+from src.update import grow_forest, update_bundle, update_imputer  # noqa: E402
+
+FEATURES = ['pH', 'TDS']
+UPDATE_PARAMS = {'new_trees': 4, 'retire_trees': True}
+X_PROBE = np.array([[7.0, 300.0], [3.5, 3500.0], [6.0, 1500.0]])
+
+
+def _readings(n, seed):
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([rng.uniform(2, 12, n), rng.uniform(50, 3000, n)])
+    y = ((X[:, 0] > 6.5) & (X[:, 0] < 8.5) & (X[:, 1] < 1000)).astype(np.int64)
+    return X, y
+
+
+def _bundle(svm_mode='approx'):
+    X, y = _readings(600, seed=1)
+    X_raw = X.copy()
+    X_raw[::25, 0] = np.nan
+    imputer = SimpleImputer(strategy='mean').fit(pd.DataFrame(X_raw, columns=FEATURES))
+    X = imputer.transform(pd.DataFrame(X_raw, columns=FEATURES))
+    rf_model = build_random_forest({'n_estimators': 12, 'random_state': 0}).fit(X, y)
+    scaler = StandardScaler().fit(X)
+    svm_params = {'mode': svm_mode, 'kernel': 'rbf', 'probability': True, 'random_state': 0, 'n_components': 50}
+    svm_model = build_svm(svm_params).fit(scaler.transform(X), y)
+    return {
+        'rf_model': rf_model, 'svm_model': svm_model, 'scaler': scaler, 'imputer': imputer,
+        'features': FEATURES, 'rf_flat': flatten_forest(rf_model), 'version': 'v1',
+        'drift_reference': build_reference(X_raw, FEATURES, bins=10),
+        'lineage': [{'version': 'v1', 'kind': 'full', 'imputer_counts': (~np.isnan(X_raw)).sum(axis=0).tolist()}],
+    }, X_raw
+
+
+def test_update_imputer_is_a_running_mean():
+    old = np.array([[7.0, 100.0], [8.0, np.nan], [np.nan, 300.0]])
+    new = np.array([[6.0, np.nan], [np.nan, np.nan]])
+    imputer = SimpleImputer(strategy='mean').fit(old)
+    counts = update_imputer(imputer, new, np.array([2, 2]))
+    both = np.vstack([old, new])
+    np.testing.assert_allclose(imputer.statistics_, np.nanmean(both, axis=0))
+    assert counts.tolist() == [3, 2]
+
+
+def test_grow_forest_keeps_size_and_retires_oldest():
+    bundle, _ = _bundle()
+    rf_model = bundle['rf_model']
+    newest = rf_model.estimators_[4:]
+    X, y = _readings(100, seed=2)
+    assert grow_forest(rf_model, X, y, 4) == 4
+    assert len(rf_model.estimators_) == rf_model.n_estimators == 12
+    assert rf_model.estimators_[:8] == newest
+
+
+def test_update_bundle_refreshes_every_component():
+    bundle, X_old = _bundle()
+    before = {key: bundle[key] for key in ('rf_model', 'svm_model', 'scaler', 'imputer', 'drift_reference')}
+    X_new, y_new = _readings(200, seed=3)
+    X_new[::10, 1] = np.nan
+
+    updated = update_bundle(bundle, X_new, y_new, UPDATE_PARAMS)
+
+    # The input bundle is left alone
+    assert all(bundle[key] is value for key, value in before.items())
+    assert updated['rf_model'] is not bundle['rf_model'] and len(updated['rf_model'].estimators_) == 12
+    # Imputer means cover old and new non-missing values
+    np.testing.assert_allclose(updated['imputer'].statistics_, np.nanmean(np.vstack([X_old, X_new]), axis=0))
+    # Online SVM and scaler absorbed the new rows
+    assert updated['scaler'].n_samples_seen_.max() == bundle['scaler'].n_samples_seen_.max() + 200
+    assert updated['svm_model'] is not bundle['svm_model']
+    # The flat forest is re-exported from the updated forest
+    grid = np.column_stack([np.linspace(0, 14, 50), np.geomspace(1, 5000, 50)])
+    np.testing.assert_allclose(forest_predict_proba(updated['rf_flat'], grid), updated['rf_model'].predict_proba(grid))
+    # Drift sketches absorbed the raw new rows, missing values included
+    sketch = FeatureSketch.from_dict(updated['drift_reference']['TDS'])
+    reference = FeatureSketch.from_dict(bundle['drift_reference']['TDS'])
+    assert sketch.n == reference.n + 180 and sketch.missing == reference.missing + 20
+    # Lineage records the step
+    step = updated['lineage'][-1]
+    assert step['parent'] == 'v1' and step['version'] == updated['version'] != 'v1'
+    assert step['rows'] == 200 and step['trees_added'] == step['trees_retired'] == 4
+    assert step['svm_updated'] and step['imputer_counts'] == [576 + 200, 600 + 180]
+
+
+def test_exact_svm_is_left_unchanged():
+    bundle, _ = _bundle(svm_mode='exact')
+    updated = update_bundle(bundle, *_readings(100, seed=4), UPDATE_PARAMS)
+    assert updated['svm_model'] is bundle['svm_model'] and updated['scaler'] is bundle['scaler']
+    assert not updated['lineage'][-1]['svm_updated']
+
+
+def test_single_class_rows_leave_the_forest():
+    bundle, _ = _bundle()
+    X_new, _ = _readings(100, seed=5)
+    updated = update_bundle(bundle, X_new, np.ones(100, dtype=np.int64), UPDATE_PARAMS)
+    assert updated['lineage'][-1]['trees_added'] == 0
+    assert [t.random_state for t in updated['rf_model'].estimators_] == \
+        [t.random_state for t in bundle['rf_model'].estimators_]
+
+
+def test_update_from_lazy_bundle_is_in_memory(tmp_path):
+    bundle, _ = _bundle()
+    save_bundle_dir(bundle, str(tmp_path / 'model'))
+    lazy = load_bundle(str(tmp_path / 'model'))
+    updated = update_bundle(lazy, *_readings(100, seed=6), UPDATE_PARAMS)
+    assert isinstance(updated, dict) and updated['lineage'][-1]['parent'] == 'v1'
+    # Nothing may still be memory-mapped from the loaded version's files
+    shutil.rmtree(tmp_path / 'model')
+    restored = pickle.loads(pickle.dumps(updated))
+    for choice in ('Random Forest', 'SVM'):
+        np.testing.assert_array_equal(predict_batch(X_PROBE, choice, restored)[1],
+                                      predict_batch(X_PROBE, choice, updated)[1])
+
+
+def test_update_requires_known_features():
+    bundle, _ = _bundle()
+    with pytest.raises(ValueError):
+        update_bundle(bundle, np.ones((5, 3)), np.ones(5), UPDATE_PARAMS)
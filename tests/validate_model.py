@@ -75,10 +75,79 @@ def validate():
         pred, prob, msg = predict_quality(7.0, 500, "Random Forest", bundle)
         assert pred in [0, 1], "Prediction should be 0 or 1"
         print("✅ Prediction logic works correctly")
+
+        # Batch path must agree with the single-reading wrapper
+        from src.predict import predict_batch
+        batch_input = np.array([[7.0, 500], [3.5, 3500], [6.0, 1500]])
+        for choice in ["Random Forest", "SVM", "Consensus"]:
+            preds, probs = predict_batch(batch_input, choice, bundle)
+            for (ph, tds), p, q in zip(batch_input, preds, probs):
+                single_pred, single_prob, _ = predict_quality(ph, tds, choice, bundle)
+                assert single_pred == p and abs(single_prob - q) < 1e-9, \
+                    f"{choice} batch/single mismatch at pH={ph}, TDS={tds}"
+        print("✅ Batch prediction matches single-reading prediction")
+
+        # Flat-array forest must reproduce sklearn's probabilities
+        if 'rf_flat' in bundle:
+            from src.predict import forest_predict_proba
+            grid = np.column_stack([np.linspace(0, 14, 200), np.geomspace(1, 50000, 200)])
+            # Missing features must follow sklearn's missing-value routing
+            grid = np.vstack([grid, [[np.nan, 300], [7.0, np.nan], [np.nan, np.nan]]])
+            diff = np.abs(bundle['rf_model'].predict_proba(grid) - forest_predict_proba(bundle['rf_flat'], grid))
+            assert diff.max() < 1e-9, f"Compiled forest deviates from sklearn by {diff.max():.2e}"
+            print(f"✅ Compiled forest matches sklearn (max diff {diff.max():.1e})")
+
+        # Lookup surfaces must give the real models' labels on the processed data
+        if 'lookup' in bundle:
+            import pandas as pd
+            import yaml
+            with open(os.path.join(os.path.dirname(__file__), '..', 'params.yaml')) as f:
+                params = yaml.safe_load(f)
+            data_path = os.path.join(os.path.dirname(__file__), '..', params['data']['processed_path'])
+            if not os.path.exists(data_path):
+                # Not ingested yet (e.g. in CI): use the tracked classified dataset
+                data_path = os.path.join(os.path.dirname(__file__), '..', 'data', 'processed', 'water_classified.csv')
+            if os.path.exists(data_path):
+                data = pd.read_parquet(data_path) if data_path.endswith('.parquet') else pd.read_csv(data_path)
+                X = bundle['imputer'].transform(data[bundle['features']])
+                for choice in ["Random Forest", "SVM"]:
+                    lookup_preds, _ = predict_batch(X, choice, bundle, "lookup")
+                    preds, _ = predict_batch(X, choice, bundle)
+                    mismatches = int((lookup_preds != preds).sum())
+                    assert mismatches == 0, f"{choice} lookup labels differ from the model on {mismatches} rows"
+                print(f"✅ Lookup surfaces match the models' labels on {len(X)} processed rows")
+            else:
+                print("⚠️  No processed data found; lookup label check skipped")
+
+        # Drift reference sketches must be complete and score zero against themselves
+        if 'drift_reference' in bundle:
+            from src.drift import FeatureSketch, psi, ks
+            for name in bundle['features']:
+                sketch = FeatureSketch.from_dict(bundle['drift_reference'][name])
+                assert sketch.counts.sum() == sketch.n, f"{name} drift sketch counts do not add up"
+                assert psi(sketch, sketch) == 0 and ks(sketch, sketch) == 0, f"{name} drift sketch is inconsistent"
+            print(f"✅ Drift reference sketches present for {', '.join(bundle['features'])}")
     except Exception as e:
         print(f"❌ Predict module test failed: {e}")
         sys.exit(1)
 
+    # 8. Lazy bundle directory (if present) must agree with the pickle
+    bundle_dir = os.path.join(os.path.dirname(__file__), '..', 'water_model')
+    from src.bundle_store import current_version_dir
+    if os.path.isdir(bundle_dir) and current_version_dir(bundle_dir):
+        try:
+            from src.predict import load_bundle, predict_batch
+            lazy = load_bundle(bundle_dir)
+            for choice in ["Random Forest", "SVM"]:
+                lazy_preds, lazy_probs = predict_batch(batch_input, choice, lazy)
+                preds, probs = predict_batch(batch_input, choice, bundle)
+                assert (lazy_preds == preds).all() and np.allclose(lazy_probs, probs), \
+                    f"{choice} differs between water_model/ and water_model.pkl"
+            print(f"✅ Lazy bundle directory matches pickle (loaded: {', '.join(lazy.loaded())})")
+        except Exception as e:
+            print(f"❌ Lazy bundle check failed: {e}")
+            sys.exit(1)
+
     print("\n🎉 All model validations passed!")
 
 if __name__ == '__main__':